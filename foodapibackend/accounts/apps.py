@@ -4,6 +4,6 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
-    
-    # def ready(self):
-    #     import accounts.signals
\ No newline at end of file
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,153 @@
+"""
+JWT authentication without a user query on the hot path.
+
+The fields authorization needs (``AUTH_FIELDS``) are cached per user, for
+``TTL_SECONDS``, in the Django cache named by ``CACHE``. Each request gets
+a fresh User built from them with every other field deferred, so code
+that reads, say, ``request.user.email`` still works and pays for one query
+only then. Saves and deletes of a User evict its entry
+(``accounts.signals``) for every worker sharing that cache; changes made
+with ``QuerySet.update`` are picked up when the TTL expires. Deployments
+with several workers need a shared backend (Redis, Memcached): with the
+default per-process locmem cache a save only evicts the saving worker's
+entry and the others keep the old role until the TTL expires.
+
+With ``TRUST_TOKEN_CLAIMS`` the role signed into the access token by
+``RoleTokenObtainPairSerializer`` is used as is, without even a cache
+lookup: a role change or deactivation then only applies to tokens issued
+afterwards.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from foodapibackend.metrics import metrics
+
+from .models import User
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TTL_SECONDS': 60,
+    'TRUST_TOKEN_CLAIMS': False,
+}
+
+AUTH_FIELDS = ('id', 'role', 'is_active', 'is_staff')
+ROLE_CLAIM = 'role'
+STAFF_CLAIM = 'is_staff'
+
+
+def user_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'JWT_USER_CACHE', {})}
+
+
+class UserCache:
+    """
+    ``AUTH_FIELDS`` value tuples by user id in a Django cache, each valid for ``ttl`` seconds.
+    """
+    key_prefix = 'auth-user'
+
+    def __init__(self, alias='default', ttl=60):
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def get(self, user_id):
+        return self._cache.get(self._key(user_id))
+
+    def set(self, user_id, values):
+        self._cache.set(self._key(user_id), tuple(values), self.ttl)
+
+    def invalidate(self, user_id):
+        self._cache.delete(self._key(user_id))
+
+    def clear(self):
+        # Empties the whole cache alias, not just user entries; meant for tests
+        self._cache.clear()
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    with _user_cache_lock:
+        if _user_cache is None:
+            config = user_cache_settings()
+            _user_cache = UserCache(alias=config['CACHE'], ttl=config['TTL_SECONDS'])
+        return _user_cache
+
+
+def build_user(values):
+    """
+    User from ``AUTH_FIELDS`` values; other fields load on first access.
+    """
+    return User.from_db('default', AUTH_FIELDS, values)
+
+
+def resolve_user(validated_token):
+    """
+    The active User a validated access token belongs to.
+    """
+    try:
+        user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValueError):
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    if user_cache_settings()['TRUST_TOKEN_CLAIMS'] and ROLE_CLAIM in validated_token:
+        metrics.incr('auth.token_claims')
+        return build_user((user_id, validated_token[ROLE_CLAIM], True, validated_token.get(STAFF_CLAIM, False)))
+
+    cache = get_user_cache()
+    values = cache.get(user_id)
+    if values is None:
+        metrics.incr('auth.cache.miss')
+        values = User.objects.filter(pk=user_id).values_list(*AUTH_FIELDS).first()
+        if values is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        cache.set(user_id, values)
+    else:
+        metrics.incr('auth.cache.hit')
+
+    user = build_user(values)
+    if not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user through ``resolve_user``.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is deliberately not cached
+            return super().get_user(validated_token)
+        return resolve_user(validated_token)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Signs the user's role (and staff flag) into issued tokens; refreshed
+    access tokens copy the claims from the refresh token.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[ROLE_CLAIM] = user.role
+        token[STAFF_CLAIM] = user.is_staff
+        return token
@@ -0,0 +1,43 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import resolve_user
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    try:
+        return resolve_user(AccessToken(raw_token))
+    except (TokenError, AuthenticationFailed):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticates WebSocket connections once, at connect time, from a JWT passed
+    as ``?token=<access token>`` or an ``Authorization: JWT <access token>`` header.
+    Sets ``scope['user']``.
+    """
+
+    def get_raw_token(self, scope):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        if query.get('token'):
+            return query['token'][0]
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                parts = value.decode().split()
+                if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+                    return parts[1]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        raw_token = self.get_raw_token(scope)
+        scope = dict(scope, user=await get_user_for_token(raw_token) if raw_token else AnonymousUser())
+        return await super().__call__(scope, receive, send)
@@ -39,5 +39,13 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['role']
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Authentication builds users with only the authorization fields loaded
+        # (accounts.authentication); load the rest in one query, not one per field.
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
     def __str__(self):
         return self.email
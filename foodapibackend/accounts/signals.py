@@ -10,3 +10,15 @@
 #             Restaurant.objects.create(user=instance)
 #         elif instance.role == 'delivery_agent':
 #             DeliveryAgent.objects.create(user=instance)
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import get_user_cache
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    get_user_cache().invalidate(instance.pk)
@@ -1,3 +1,78 @@
-from django.test import TestCase
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from foodapibackend.testing import QueryBudgetTestCase
+
+from .authentication import RoleTokenObtainPairSerializer, UserCache, get_user_cache
+from .models import User
+
+
+class AccountQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Query budgets for the account endpoints. Authentication hits the warm user cache.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='customer@example.com', role='customer')
+
+    def test_me(self):
+        self.request('get', '/auth/users/me/', queries=1, user=self.user, explain=True)
+
+    def test_update_fcm_token(self):
+        self.request('post', '/api/v1/accounts/update-fcm-token/', queries=1, user=self.user,
+                     data={'fcm_token': 'token'})
+
+
+class CachedJWTAuthenticationTests(QueryBudgetTestCase):
+    """
+    The user's authorization fields are cached between requests and evicted on save.
+    """
+    url = '/api/v1/restaurant/orders/?fields=id'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='customer@example.com', role='customer')
+
+    def client_with(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        return client
+
+    def test_user_is_loaded_once(self):
+        client = self.client_with(AccessToken.for_user(self.user))
+        with self.assertNumQueries(2):
+            client.get(self.url)
+        with self.assertNumQueries(1):
+            client.get(self.url)
+
+    def test_save_evicts_cached_user(self):
+        client = self.client_with(AccessToken.for_user(self.user))
+        place_order = '/api/v1/restaurant/orders/create/'
+        self.assertEqual(client.post(place_order, {}, format='json').status_code, 400)
+        self.user.role = 'owner'
+        self.user.save()
+        self.assertEqual(client.post(place_order, {}, format='json').status_code, 403)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get(self.url).status_code, 401)
+
+    def test_save_evicts_the_entry_other_workers_read(self):
+        # Another worker's UserCache on the same backend must not keep serving the old role
+        other_worker = UserCache(alias=get_user_cache().alias)
+        other_worker.set(self.user.pk, (self.user.pk, 'customer', True, False))
+        self.user.role = 'owner'
+        self.user.save()
+        self.assertIsNone(other_worker.get(self.user.pk))
+
+    @override_settings(JWT_USER_CACHE={'TRUST_TOKEN_CLAIMS': True})
+    def test_trusted_role_claim_skips_the_user_query(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+        self.assertEqual(token['role'], 'customer')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client_with(token).get(self.url).status_code, 200)
+        # Tokens without the claim still go through the cache
+        with self.assertNumQueries(2):
+            self.client_with(AccessToken.for_user(self.user)).get(self.url)
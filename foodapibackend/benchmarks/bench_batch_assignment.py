@@ -0,0 +1,65 @@
+"""
+Benchmark: batch dispatch (cost matrix + optimal assignment) vs greedy per-delivery.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_batch_assignment.py [--sizes 500 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery.assignment import haversine_matrix, solve_assignment  # noqa: E402
+
+CENTER = (-1.286389, 36.817223)
+SPREAD_DEG = 0.25
+
+
+def greedy_total(cost):
+    # One delivery at a time, nearest still-free agent (what post_save dispatch does).
+    taken = np.zeros(cost.shape[1], dtype=bool)
+    total = 0.0
+    for row in cost:
+        col = int(np.argmin(np.where(taken, np.inf, row)))
+        taken[col] = True
+        total += row[col]
+    return total
+
+
+def run(size, seed=0):
+    rng = np.random.default_rng(seed)
+    deliveries = rng.uniform(-SPREAD_DEG, SPREAD_DEG, (size, 2)) + CENTER
+    agents = rng.uniform(-SPREAD_DEG, SPREAD_DEG, (size, 2)) + CENTER
+
+    start = time.perf_counter()
+    cost = haversine_matrix(deliveries, agents)
+    matrix_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches = solve_assignment(cost)
+    solve_s = time.perf_counter() - start
+
+    optimal = sum(distance for _, _, distance in matches)
+    return matrix_s, solve_s, optimal, greedy_total(cost)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000])
+    args = parser.parse_args()
+
+    print(f"{'size':>11} {'matrix s':>9} {'solve s':>8} {'optimal km':>11} {'greedy km':>10} {'saved':>6}")
+    for size in args.sizes:
+        matrix_s, solve_s, optimal, greedy = run(size)
+        print(
+            f"{size:>5}x{size:<5} {matrix_s:>9.3f} {solve_s:>8.3f} {optimal:>11.0f} {greedy:>10.0f} "
+            f"{(1 - optimal / greedy) * 100:>5.1f}%"
+        )
+
+
+if __name__ == '__main__':
+    main()
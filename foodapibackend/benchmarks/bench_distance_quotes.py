@@ -0,0 +1,85 @@
+"""
+Benchmark: delivery quotes per second with and without the geohash route cache.
+
+Quotes go from a few restaurants to addresses scattered around Nairobi, the
+way estimate-cost sees them. Two providers are measured: the offline
+HaversineProvider, and a stand-in for a remote routing API that sleeps
+``--latency`` seconds per call.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_distance_quotes.py [--quotes 20000] [--addresses 2000] [--latency 0.002]
+"""
+import argparse
+import random
+import time
+
+from django_setup import setup
+
+
+class RemoteProvider:
+    def __init__(self, provider, latency):
+        self.provider = provider
+        self.latency = latency
+
+    def route(self, start, end):
+        time.sleep(self.latency)
+        return self.provider.route(start, end)
+
+
+def workload(quotes, addresses, restaurants=20, seed=1):
+    rng = random.Random(seed)
+    pickups = [(-1.28 + rng.uniform(-0.03, 0.03), 36.82 + rng.uniform(-0.03, 0.03)) for _ in range(restaurants)]
+    dropoffs = [(-1.29 + rng.gauss(0, 0.03), 36.82 + rng.gauss(0, 0.03)) for _ in range(addresses)]
+    # Customers reorder: pickups and dropoffs follow a skewed popularity
+    return [
+        (f"{pickup[0]:.6f}, {pickup[1]:.6f}", f"{dropoff[0]:.6f}, {dropoff[1]:.6f}")
+        for pickup, dropoff in (
+            (pickups[min(int(rng.expovariate(0.2)), restaurants - 1)],
+             dropoffs[min(int(rng.expovariate(5 / addresses)), addresses - 1)])
+            for _ in range(quotes)
+        )
+    ]
+
+
+def bench(provider, quotes):
+    from delivery.geo import parse_coordinates
+
+    start = time.perf_counter()
+    for origin, destination in quotes:
+        provider.route(parse_coordinates(origin), parse_coordinates(destination))
+    return len(quotes) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quotes', type=int, default=20000)
+    parser.add_argument('--addresses', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.002)
+    args = parser.parse_args()
+
+    teardown = setup()
+    try:
+        from delivery.distance import HaversineProvider, RouteCache
+        from foodapibackend.metrics import metrics
+
+        quotes = workload(args.quotes, args.addresses)
+        rows = []
+        for name, provider in (('haversine', HaversineProvider()),
+                               ('remote', RemoteProvider(HaversineProvider(), args.latency))):
+            # The uncached remote run is capped so it finishes in reasonable time
+            sample = quotes if name == 'haversine' else quotes[:max(1, int(2 / args.latency))]
+            uncached = bench(provider, sample)
+            metrics.reset()
+            cache = RouteCache(provider)
+            cached = bench(cache, quotes)
+            rows.append((name, uncached, cached, metrics.ratio('distance.cache.hit', 'distance.cache.miss'), len(cache)))
+    finally:
+        teardown()
+
+    print(f"{'provider':>9} {'uncached q/s':>13} {'cached q/s':>11} {'hit rate':>9} {'entries':>8}")
+    for name, uncached, cached, hit_rate, entries in rows:
+        print(f"{name:>9} {uncached:>13.0f} {cached:>11.0f} {hit_rate:>8.1%} {entries:>8}")
+
+
+if __name__ == '__main__':
+    main()
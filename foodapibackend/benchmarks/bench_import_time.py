@@ -0,0 +1,77 @@
+"""
+Benchmark: cold start of the WSGI and ASGI applications.
+
+Each run starts a fresh interpreter with ``python -X importtime``, imports
+the application module and resolves the URLconf (what the first request
+would do), then reports the median wall time and the modules with the
+largest cumulative import time and the
+packages with the largest total self time from the last run.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_import_time.py [--app asgi wsgi] [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = """
+import time
+started = time.perf_counter()
+from foodapibackend.{app} import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print('WALL', time.perf_counter() - started)
+"""
+
+
+def run(app):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'foodapibackend.settings', 'PYTHONDONTWRITEBYTECODE': '1'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP.format(app=app)],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    wall = float(next(line.split()[1] for line in result.stdout.splitlines() if line.startswith('WALL')))
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented below the module that triggered them
+        name = name[1:].rstrip()
+        modules.append((int(cumulative_us), int(self_us), name))
+    return wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', nargs='+', default=['asgi', 'wsgi'], choices=['asgi', 'wsgi'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for app in args.app:
+        walls = []
+        for _ in range(args.runs):
+            wall, modules = run(app)
+            walls.append(wall)
+        top_level = [module for module in modules if not module[2].startswith(' ')]
+        print(f"{app}: median {statistics.median(walls) * 1000:.0f} ms over {args.runs} runs, "
+              f"{len(modules)} modules imported")
+        print(f"  {'cumulative ms':>13} {'self ms':>8}  module")
+        for cumulative, own, name in sorted(top_level, reverse=True)[:args.top]:
+            print(f"  {cumulative / 1000:>13.1f} {own / 1000:>8.1f}  {name}")
+        packages = {}
+        for _, own, name in modules:
+            package = name.strip().split('.')[0]
+            packages[package] = packages.get(package, 0) + own
+        print(f"  {'self ms':>13}  package")
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {own / 1000:>13.1f}  {package}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: agent GPS pings/sec, full Delivery.save() per ping vs write-behind LocationStore.
+
+Each agent pings ``--pings-per-flush`` times per flush interval (e.g. a ping
+every 2 s with a 10 s flush interval), so the buffer is flushed once every
+``agents * pings_per_flush`` pings.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_location_updates.py [--agents 500] [--rounds 4] [--pings-per-flush 5]
+"""
+import argparse
+import random
+import time
+
+from django_setup import setup
+
+
+def seed(agents):
+    from accounts.models import User
+    from delivery.models import Delivery, DeliveryAgentLocation
+    from restaurant.models import Order, Restaurant
+
+    owner = User.objects.create(email='owner@bench.local', role='owner')
+    customer = User.objects.create(email='customer@bench.local', role='customer')
+    restaurant = Restaurant.objects.create(user=owner, name='Bench', address='-', contact_number='0')
+    agent_users = User.objects.bulk_create([
+        User(email=f'agent{i}@bench.local', role='delivery_agent') for i in range(agents)
+    ])
+    DeliveryAgentLocation.objects.bulk_create([
+        DeliveryAgentLocation(agent=agent, latitude=-1.28, longitude=36.81) for agent in agent_users
+    ])
+    orders = Order.objects.bulk_create([
+        Order(customer=customer, restaurant=restaurant, total_price=10) for _ in agent_users
+    ])
+    deliveries = Delivery.objects.bulk_create([
+        Delivery(order=order, delivery_agent=agent, delivery_address='-', status='in_transit')
+        for order, agent in zip(orders, agent_users)
+    ])
+    return deliveries
+
+
+def bench_full_save(deliveries, rounds, rng):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for delivery in deliveries:
+            # What update_location used to do on every ping.
+            delivery.current_location = f"{-1.28 + rng.random() / 10}, {36.81 + rng.random() / 10}"
+            delivery.save()
+    return rounds * len(deliveries) / (time.perf_counter() - start)
+
+
+def bench_write_behind(deliveries, rounds, pings_per_flush, rng):
+    from delivery.location_store import LocationStore
+
+    store = LocationStore(flush_interval=0)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _ in range(pings_per_flush):
+            for delivery in deliveries:
+                store.record(delivery.pk, delivery.delivery_agent_id, -1.28 + rng.random() / 10, 36.81 + rng.random() / 10)
+        store.flush()
+    return rounds * pings_per_flush * len(deliveries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=4)
+    parser.add_argument('--pings-per-flush', type=int, default=5)
+    args = parser.parse_args()
+
+    teardown = setup(DELIVERY_AGENT_INDEX_REFRESH_SECONDS=3600)
+    try:
+        deliveries = seed(args.agents)
+        rng = random.Random(0)
+        before = bench_full_save(deliveries, args.rounds, rng)
+        after = bench_write_behind(deliveries, args.rounds, args.pings_per_flush, rng)
+    finally:
+        teardown()
+
+    print(f"{'path':<26} {'pings/sec':>12}")
+    print(f"{'full save() per ping':<26} {before:>12.0f}")
+    print(f"{'write-behind + bulk flush':<26} {after:>12.0f}")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
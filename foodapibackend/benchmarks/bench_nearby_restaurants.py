@@ -0,0 +1,93 @@
+"""
+Benchmark: nearby-restaurant query latency, bounding box on the
+(latitude, longitude) index vs haversine over every restaurant.
+
+Restaurants are spread over a ~55 km metro area, denser towards the centre,
+and queried from random points in it with ``--radius`` km, as the nearby
+endpoint does (before loading one page of full rows).
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_nearby_restaurants.py [--sizes 10000 100000] [--radius 3] [--queries 200]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from django_setup import setup
+
+# Roughly a 55 km x 55 km metro area.
+CENTER = (-1.286389, 36.817223)
+SPREAD_DEG = 0.25
+
+
+def point(rng):
+    return (CENTER[0] + max(-SPREAD_DEG, min(SPREAD_DEG, rng.gauss(0, SPREAD_DEG / 2))),
+            CENTER[1] + max(-SPREAD_DEG, min(SPREAD_DEG, rng.gauss(0, SPREAD_DEG / 2))))
+
+
+def full_scan(lat, lng, radius_km):
+    from delivery.geo import haversine
+    from restaurant.models import Restaurant
+
+    results = []
+    for restaurant_id, restaurant_lat, restaurant_lng in (
+            Restaurant.objects.exclude(latitude=None).values_list('id', 'latitude', 'longitude')):
+        distance = haversine(lat, lng, restaurant_lat, restaurant_lng)
+        if distance <= radius_km:
+            results.append((distance, restaurant_id))
+    results.sort()
+    return results
+
+
+def bench(function, points, radius_km):
+    timings, found = [], 0
+    for lat, lng in points:
+        start = time.perf_counter()
+        found += len(function(lat, lng, radius_km))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)], found / len(points)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--radius', type=float, default=3)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    teardown = setup()
+    try:
+        from accounts.models import User
+        from restaurant.models import Restaurant
+        from restaurant.nearby import nearby_restaurant_ids
+
+        rng = random.Random(1)
+        points = [point(rng) for _ in range(args.queries)]
+        rows = []
+        size = 0
+        for target in sorted(args.sizes):
+            owners = User.objects.bulk_create([
+                User(email=f'owner{i}@example.com', role='owner') for i in range(size, target)
+            ], batch_size=2000)
+            Restaurant.objects.bulk_create([
+                Restaurant(user=owner, name=f'Restaurant {i}', address='-', contact_number='0700000000',
+                           latitude=lat, longitude=lng)
+                for i, (owner, (lat, lng)) in enumerate(zip(owners, (point(rng) for _ in owners)), size)
+            ], batch_size=2000)
+            size = target
+            indexed = bench(nearby_restaurant_ids, points, args.radius)
+            # The full scan is slow; a tenth of the queries is enough for stable numbers
+            scanned = bench(full_scan, points[:max(1, len(points) // 10)], args.radius)
+            rows.append((size, indexed, scanned))
+    finally:
+        teardown()
+
+    print(f"{'restaurants':>11} {'found':>6} {'bbox p50 ms':>12} {'bbox p95 ms':>12} {'scan p50 ms':>12} {'scan p95 ms':>12}")
+    for size, (bbox_p50, bbox_p95, found), (scan_p50, scan_p95, _) in rows:
+        print(f"{size:>11} {found:>6.0f} {bbox_p50:>12.2f} {bbox_p95:>12.2f} {scan_p50:>12.2f} {scan_p95:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: nearest-driver lookup, linear geodesic scan vs GridIndex.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_nearest_driver.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geopy.distance import geodesic  # noqa: E402
+
+from delivery.spatial import GridIndex  # noqa: E402
+
+# Roughly a 55 km x 55 km metro area.
+CENTER = (-1.286389, 36.817223)
+SPREAD_DEG = 0.25
+
+
+def linear_scan(order_location, drivers):
+    # The linear scan dispatch used before GridIndex (formerly delivery.utils.find_nearest_driver).
+    nearest_driver = None
+    min_distance = float('inf')
+    for driver in drivers:
+        distance = geodesic(order_location, (driver.latitude, driver.longitude)).km
+        if distance < min_distance:
+            min_distance = distance
+            nearest_driver = driver
+    return nearest_driver
+
+
+def random_point(rng):
+    return (
+        CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+    )
+
+
+def run(size, queries, linear_queries, seed=0):
+    rng = random.Random(seed)
+    drivers = []
+    for i in range(size):
+        lat, lng = random_point(rng)
+        drivers.append(SimpleNamespace(id=i, latitude=lat, longitude=lng))
+    points = [random_point(rng) for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = GridIndex(cell_size_km=1.0)
+    for driver in drivers:
+        index.insert(driver.id, driver.latitude, driver.longitude)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [index.nearest(lat, lng, k=1)[0][1] for lat, lng in points]
+    index_ms = (time.perf_counter() - start) * 1000 / queries
+
+    start = time.perf_counter()
+    linear = [linear_scan(point, drivers).id for point in points[:linear_queries]]
+    linear_ms = (time.perf_counter() - start) * 1000 / linear_queries
+
+    mismatches = sum(1 for a, b in zip(indexed, linear) if a != b)
+    return build_s, index_ms, linear_ms, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--linear-queries', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'agents':>8} {'build s':>8} {'index ms/q':>11} {'linear ms/q':>12} {'speedup':>9} {'mismatch':>9}")
+    for size in args.sizes:
+        build_s, index_ms, linear_ms, mismatches = run(size, args.queries, args.linear_queries)
+        print(
+            f"{size:>8} {build_s:>8.3f} {index_ms:>11.3f} {linear_ms:>12.2f} "
+            f"{linear_ms / index_ms:>8.0f}x {mismatches:>9}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: order placement throughput for orders with 1, 10 and 50 lines.
+
+Compares the previous OrderCreateSerializer (one MenuItem query per line
+during validation, one INSERT per OrderItem, no transaction) with the current
+one (one MenuItem query, bulk_create inside transaction.atomic).
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_order_create.py [--orders 200] [--lines 1 10 50]
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from django_setup import setup
+
+
+def legacy_serializer_class():
+    from rest_framework import serializers
+
+    from restaurant.models import Order, OrderItem
+
+    class LegacyOrderItemCreateSerializer(serializers.ModelSerializer):
+        class Meta:
+            model = OrderItem
+            fields = ['menu_item', 'quantity']
+
+        def validate_menu_item(self, value):
+            if not value.is_available:
+                raise serializers.ValidationError("This menu item is currently unavailable")
+            return value
+
+    class LegacyOrderCreateSerializer(serializers.ModelSerializer):
+        order_items = LegacyOrderItemCreateSerializer(many=True)
+
+        class Meta:
+            model = Order
+            fields = ['restaurant', 'order_items']
+
+        def create(self, validated_data):
+            order_items_data = validated_data.pop('order_items')
+            total_price = sum(item['menu_item'].price * item['quantity'] for item in order_items_data)
+            order = Order.objects.create(customer=self.context['request'].user, total_price=total_price, **validated_data)
+            for item_data in order_items_data:
+                OrderItem.objects.create(order=order, price=item_data['menu_item'].price, **item_data)
+            return order
+
+    return LegacyOrderCreateSerializer
+
+
+def seed(menu_size):
+    from accounts.models import User
+    from restaurant.models import MenuItem, Restaurant
+
+    owner = User.objects.create(email='owner@bench.local', role='owner')
+    customer = User.objects.create(email='customer@bench.local', role='customer')
+    restaurant = Restaurant.objects.create(user=owner, name='Bench', address='-', contact_number='0')
+    items = MenuItem.objects.bulk_create([
+        MenuItem(restaurant=restaurant, name=f'item {i}', price=5 + i % 7) for i in range(menu_size)
+    ])
+    return customer, restaurant, [item.pk for item in items]
+
+
+def bench(serializer_class, customer, restaurant, menu_ids, orders, lines):
+    context = {'request': SimpleNamespace(user=customer)}
+    payload = {
+        'restaurant': restaurant.pk,
+        'order_items': [{'menu_item': menu_ids[i % len(menu_ids)], 'quantity': 1 + i % 3} for i in range(lines)],
+    }
+    start = time.perf_counter()
+    for _ in range(orders):
+        serializer = serializer_class(data=payload, context=context)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+    return orders / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50])
+    args = parser.parse_args()
+
+    teardown = setup()
+    try:
+        from restaurant.serializers import OrderCreateSerializer
+
+        customer, restaurant, menu_ids = seed(max(args.lines))
+        rows = []
+        for lines in args.lines:
+            before = bench(legacy_serializer_class(), customer, restaurant, menu_ids, args.orders, lines)
+            after = bench(OrderCreateSerializer, customer, restaurant, menu_ids, args.orders, lines)
+            rows.append((lines, before, after))
+    finally:
+        teardown()
+
+    print(f"{'lines':>5} {'per-row orders/s':>17} {'bulk orders/s':>14} {'speedup':>8}")
+    for lines, before, after in rows:
+        print(f"{lines:>5} {before:>17.0f} {after:>14.0f} {after / before:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
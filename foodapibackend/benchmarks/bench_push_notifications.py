@@ -0,0 +1,68 @@
+"""
+Benchmark: push notification throughput against a transport with a fixed
+round-trip latency per call (FakeTransport, default 20 ms like one FCM request).
+
+Compares the previous approach (one send per message on the calling thread)
+with the NotificationPipeline: time the caller spends per message, and the
+time to drain all messages through batched transport calls.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_push_notifications.py [--messages 2000] [--latency 0.02] [--batch 500]
+"""
+import argparse
+import time
+
+from django_setup import setup
+
+
+def bench_inline(transport_class, messages, latency):
+    from delivery.notifications import PushMessage
+
+    transport = transport_class(latency=latency)
+    start = time.perf_counter()
+    for i in range(messages):
+        transport.send([PushMessage(f'token-{i}', 'Delivery Status Update', 'Your delivery is now In Transit!', None)])
+    elapsed = time.perf_counter() - start
+    return elapsed / messages, elapsed, len(transport.calls)
+
+
+def bench_pipeline(transport_class, pipeline_class, messages, latency, batch):
+    transport = transport_class(latency=latency)
+    pipeline = pipeline_class(transport, window=0.05, max_batch=batch)
+    start = time.perf_counter()
+    for i in range(messages):
+        pipeline.enqueue(f'token-{i}', 'Delivery Status Update', 'Your delivery is now In Transit!')
+    enqueued = time.perf_counter() - start
+    pipeline.start()
+    while len(transport.delivered) < messages:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    pipeline.stop()
+    return enqueued / messages, elapsed, len(transport.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    teardown = setup()
+    try:
+        from delivery.notifications import FakeTransport, NotificationPipeline
+
+        rows = [
+            ('inline', *bench_inline(FakeTransport, args.messages, args.latency)),
+            ('pipeline', *bench_pipeline(FakeTransport, NotificationPipeline, args.messages, args.latency, args.batch)),
+        ]
+    finally:
+        teardown()
+
+    print(f"{'mode':>8} {'caller us/msg':>14} {'drain s':>8} {'calls':>6} {'msgs/s':>9}")
+    for mode, per_message, elapsed, calls in rows:
+        print(f"{mode:>8} {per_message * 1e6:>14.1f} {elapsed:>8.2f} {calls:>6} {args.messages / elapsed:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: search latency as the menu grows, FTS5 index vs LIKE matching.
+
+Menu items get names and descriptions drawn from a small food vocabulary, so
+common words match thousands of rows, as they would in a real catalog. Each
+round adds ``--step`` items and times the same mix of full-word and prefix
+(autocomplete) queries through restaurant.search, once with the FTS5 index
+and once with the ``icontains`` fallback other databases get.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_search.py [--items 200000] [--step 50000] [--queries 200]
+"""
+import argparse
+import random
+import statistics
+import time
+from unittest import mock
+
+from django_setup import setup
+
+WORDS = ('chicken beef goat fish tilapia pilau biryani chapati ugali sukuma mandazi samosa chips masala '
+         'tikka curry stew grilled fried roast spicy mild coconut garlic lemon bean rice salad wrap burger '
+         'pizza latte chai juice mango passion avocado sauce smokey crispy creamy special family').split()
+
+
+def menu_rows(count, restaurants, rng):
+    from restaurant.models import MenuItem
+
+    return [
+        MenuItem(restaurant=rng.choice(restaurants), name=' '.join(rng.sample(WORDS, 2)).title(),
+                 description=' '.join(rng.sample(WORDS, 6)), price=rng.randint(50, 2000),
+                 is_available=rng.random() < 0.9)
+        for _ in range(count)
+    ]
+
+
+def queries(count, rng):
+    mix = []
+    for _ in range(count):
+        words = rng.sample(WORDS, rng.choice((1, 2)))
+        # Half the queries are half-typed, as autocomplete sends them
+        if rng.random() < 0.5:
+            words[-1] = words[-1][:rng.randint(2, len(words[-1]))]
+        mix.append((' '.join(words), rng.choice((None, 500))))
+    return mix
+
+
+def bench(mix, limit=20):
+    from restaurant.search import search_menu_items
+
+    timings = []
+    for query, max_price in mix:
+        start = time.perf_counter()
+        search_menu_items(query, limit=limit, max_price=max_price, is_available=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200000)
+    parser.add_argument('--step', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    teardown = setup()
+    try:
+        from accounts.models import User
+        from restaurant.models import MenuItem, Restaurant
+
+        rng = random.Random(1)
+        owners = User.objects.bulk_create([User(email=f'owner{i}@example.com', role='owner') for i in range(200)])
+        restaurants = Restaurant.objects.bulk_create([
+            Restaurant(user=owner, name=f"{rng.choice(WORDS).title()} House {i}", address='Moi Avenue',
+                       contact_number='0700000000')
+            for i, owner in enumerate(owners)
+        ])
+        mix = queries(args.queries, rng)
+        rows = []
+        size = 0
+        while size < args.items:
+            batch = min(args.step, args.items - size)
+            MenuItem.objects.bulk_create(menu_rows(batch, restaurants, rng), batch_size=2000)
+            size += batch
+            fts = bench(mix)
+            with mock.patch('restaurant.search.uses_fts', return_value=False):
+                like = bench(mix[:max(1, len(mix) // 10)])
+            rows.append((size, fts, like))
+    finally:
+        teardown()
+
+    print(f"{'items':>8} {'fts p50 ms':>11} {'fts p95 ms':>11} {'like p50 ms':>12} {'like p95 ms':>12}")
+    for size, (fts_p50, fts_p95), (like_p50, like_p95) in rows:
+        print(f"{size:>8} {fts_p50:>11.2f} {fts_p95:>11.2f} {like_p50:>12.2f} {like_p95:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: archiving completed deliveries' status history.
+
+``--deliveries`` deliveries each get ``--updates`` status updates; all but
+``--active`` of them are then completed long ago. The run reports the hot
+table before and after archival, the time per archive batch, and the time
+to read one delivery's full history (``Delivery.status_history``) from the
+hot table vs from its archive row.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_status_archive.py [--deliveries 3000] [--updates 6] [--active 300] [--batch-size 500]
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from django_setup import setup
+
+
+def read_history(delivery_ids):
+    from delivery.models import Delivery
+
+    timings = []
+    for delivery_id in delivery_ids:
+        start = time.perf_counter()
+        delivery = (Delivery.objects.select_related('status_archive').prefetch_related('status_updates__updated_by')
+                    .get(pk=delivery_id))
+        delivery.status_history
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deliveries', type=int, default=3000)
+    parser.add_argument('--updates', type=int, default=6)
+    parser.add_argument('--active', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    teardown = setup(DELIVERY_OUTBOX={'IN_PROCESS_WORKER': False})
+    try:
+        from django.utils import timezone
+
+        from delivery.archive import StatusHistoryArchiver
+        from delivery.models import Delivery, DeliveryStatusUpdate
+        from foodapibackend.testing import seed_marketplace
+
+        seed_marketplace(restaurants=1, customers=max(1, args.deliveries // 30), orders_per_customer=30,
+                         reviews_per_restaurant=0)
+        delivery_ids = list(Delivery.objects.order_by('pk').values_list('pk', flat=True)[:args.deliveries])
+        DeliveryStatusUpdate.objects.bulk_create([
+            DeliveryStatusUpdate(delivery_id=delivery_id, status='in_transit')
+            for delivery_id in delivery_ids for _ in range(args.updates)
+        ], batch_size=2000)
+        completed = delivery_ids[args.active:]
+        Delivery.objects.filter(pk__in=completed).update(status='delivered',
+                                                         updated_at=timezone.now() - timedelta(days=60))
+        sample = completed[:200]
+
+        hot_before = DeliveryStatusUpdate.objects.count()
+        hot_read = read_history(sample)
+        archiver = StatusHistoryArchiver(batch_size=args.batch_size)
+        batches = []
+        while True:
+            start = time.perf_counter()
+            archived = archiver.run_once()
+            batches.append((time.perf_counter() - start) * 1000)
+            if archived < args.batch_size:
+                break
+        hot_after = DeliveryStatusUpdate.objects.count()
+        archived_read = read_history(sample)
+    finally:
+        teardown()
+
+    print(f"{'hot rows before':>15} {'hot rows after':>14} {'batches':>8} {'batch p50 ms':>13} "
+          f"{'hot read ms':>12} {'archived read ms':>17}")
+    print(f"{hot_before:>15} {hot_after:>14} {len(batches):>8} {statistics.median(batches):>13.2f} "
+          f"{hot_read:>12.2f} {archived_read:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: concurrent delivery status transitions, read-modify-write vs
+conditional UPDATE.
+
+``--workers`` threads race to move the same ``--deliveries`` from assigned
+to in_transit, as duplicate taps or an agent and an admin would. The old
+path reads the row, changes it in Python and writes it back with its log
+row. The new path is ``delivery.transitions.transition_delivery``. A
+transition is "applied" when it writes its log row; every applied
+transition beyond the first per delivery overwrote someone else's.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_status_transitions.py [--deliveries 300] [--workers 4]
+"""
+import argparse
+import threading
+import time
+
+from django_setup import setup
+
+
+def read_modify_write(delivery_id):
+    from django.db import transaction
+
+    from delivery.models import Delivery, DeliveryStatusUpdate
+
+    delivery = Delivery.objects.get(pk=delivery_id)
+    if delivery.status != 'assigned':
+        return False
+    time.sleep(0)  # Let another thread read the same row
+    with transaction.atomic():
+        # What save() wrote before: whatever this instance holds, unconditionally
+        Delivery.objects.filter(pk=delivery_id).update(status='in_transit')
+        DeliveryStatusUpdate.objects.create(delivery=delivery, status='in_transit')
+    return True
+
+
+def conditional(delivery_id):
+    from delivery.models import Delivery
+    from delivery.transitions import transition_delivery
+    from foodapibackend.statemachine import InvalidTransition, TransitionConflict
+
+    delivery = Delivery.objects.get(pk=delivery_id)
+    time.sleep(0)
+    try:
+        transition_delivery(delivery, 'in_transit')
+    except (InvalidTransition, TransitionConflict):
+        return False
+    return True
+
+
+def race(function, delivery_ids, workers):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    barrier = threading.Barrier(workers)
+    applied = [0] * workers
+    queries = [0] * workers
+
+    def worker(index):
+        barrier.wait()
+        with CaptureQueriesContext(connection) as captured:
+            for delivery_id in delivery_ids:
+                applied[index] += function(delivery_id)
+        queries[index] = len(captured)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(applied), sum(queries), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deliveries', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    # Events are left unpublished; the relay would only compete for the SQLite write lock
+    teardown = setup(DELIVERY_OUTBOX={'IN_PROCESS_WORKER': False})
+    try:
+        from delivery.models import Delivery, DeliveryStatusUpdate
+        from foodapibackend.testing import seed_marketplace
+
+        seed_marketplace(restaurants=1, customers=max(1, args.deliveries // 30), orders_per_customer=30,
+                         reviews_per_restaurant=0)
+        delivery_ids = list(Delivery.objects.values_list('pk', flat=True)[:args.deliveries])
+        rows = []
+        for name, function in (('read-modify-write', read_modify_write), ('conditional', conditional)):
+            Delivery.objects.filter(pk__in=delivery_ids).update(status='assigned', version=0)
+            DeliveryStatusUpdate.objects.filter(status='in_transit').delete()
+            applied, queries, elapsed = race(function, delivery_ids, args.workers)
+            attempts = len(delivery_ids) * args.workers
+            rows.append((name, applied, applied - len(delivery_ids), queries / attempts, attempts / elapsed))
+    finally:
+        teardown()
+
+    print(f"{'path':>17} {'applied':>8} {'lost':>5} {'queries/attempt':>16} {'attempts/s':>11}")
+    for name, applied, lost, queries, rate in rows:
+        print(f"{name:>17} {applied:>8} {lost:>5} {queries:>16.2f} {rate:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
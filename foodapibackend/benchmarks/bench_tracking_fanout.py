@@ -0,0 +1,138 @@
+"""
+Benchmark: tracking fan-out through the in-memory channel layer.
+
+Compares the old path (one full group_send per location update, consumer
+echoes the whole event as JSON) with TrackingFanout (coalesced per window,
+delta frames, optional msgpack) for thousands of local consumers.
+
+Usage (from the directory containing manage.py):
+    python benchmarks/bench_tracking_fanout.py [--orders 1000] [--watchers 3] [--pings 10] [--windows 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channels.layers import InMemoryChannelLayer  # noqa: E402
+
+from delivery.fanout import TrackingFanout, encode_frame, tracking_group  # noqa: E402
+
+
+class SweepOncePerWindowLayer(InMemoryChannelLayer):
+    """
+    The stock in-memory layer sweeps every channel for expired messages on each
+    send/receive (O(consumers) per call), which would dominate both paths here.
+    The sweep is done once per window instead.
+    """
+
+    def _clean_expired(self):
+        pass
+
+    def sweep(self):
+        InMemoryChannelLayer._clean_expired(self)
+
+
+async def subscribe(layer, orders, watchers):
+    channels = {}
+    for order_id in range(orders):
+        group = tracking_group(order_id)
+        channels[group] = []
+        for _ in range(watchers):
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            channels[group].append(channel)
+    return channels
+
+
+async def drain(layer, channels, sends_per_group, encoder):
+    writes = size = 0
+    for group, count in sends_per_group.items():
+        for channel in channels[group]:
+            for _ in range(count):
+                text, data = encoder(await layer.receive(channel))
+                writes += 1
+                size += len(text.encode() if text is not None else data)
+    return writes, size
+
+
+def ping(rng, order_id, status):
+    return {
+        'order_id': order_id,
+        'status': status,
+        'latitude': round(-1.28 + rng.random() / 10, 6),
+        'longitude': round(36.81 + rng.random() / 10, 6),
+        'timestamp': round(time.time(), 1),
+    }
+
+
+async def run_naive(args):
+    layer = SweepOncePerWindowLayer(capacity=args.pings + 10)
+    channels = await subscribe(layer, args.orders, args.watchers)
+    rng = random.Random(0)
+    sends = writes = size = 0
+    start = time.perf_counter()
+    for _ in range(args.windows):
+        for _ in range(args.pings):
+            for order_id in range(args.orders):
+                event = {'type': 'send_delivery_update', 'data': ping(rng, order_id, 'in_transit')}
+                await layer.group_send(tracking_group(order_id), event)
+                sends += 1
+        w, s = await drain(
+            layer, channels, {group: args.pings for group in channels},
+            lambda event: (json.dumps(event), None),
+        )
+        writes, size = writes + w, size + s
+        layer.sweep()
+    return sends, writes, size, time.perf_counter() - start
+
+
+async def run_coalesced(args, encoding):
+    layer = SweepOncePerWindowLayer(capacity=10)
+    channels = await subscribe(layer, args.orders, args.watchers)
+    fanout = TrackingFanout(window=1.0, keyframe_every=20, channel_layer=layer)
+    rng = random.Random(0)
+    sends = writes = size = 0
+    start = time.perf_counter()
+    for _ in range(args.windows):
+        for _ in range(args.pings):
+            for order_id in range(args.orders):
+                fanout.publish(order_id, ping(rng, order_id, 'in_transit'))
+        events = fanout.build_frames()
+        await fanout._send_all(events)
+        sends += len(events)
+        w, s = await drain(
+            layer, channels, {group: 1 for group, _ in events},
+            lambda event: encode_frame({k: event[k] for k in ('data', 'seq', 'delta')}, encoding),
+        )
+        writes, size = writes + w, size + s
+        layer.sweep()
+    return sends, writes, size, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--watchers', type=int, default=3)
+    parser.add_argument('--pings', type=int, default=10, help="location updates per order per window")
+    parser.add_argument('--windows', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.orders} orders x {args.watchers} watchers = {args.orders * args.watchers} consumers, "
+          f"{args.pings} pings per order per window, {args.windows} windows")
+    print(f"{'path':<28} {'group_sends':>12} {'socket writes':>14} {'bytes':>11} {'seconds':>8}")
+    rows = [
+        ('full event per ping (json)', asyncio.run(run_naive(args))),
+        ('coalesced + delta (json)', asyncio.run(run_coalesced(args, 'json'))),
+        ('coalesced + delta (msgpack)', asyncio.run(run_coalesced(args, 'msgpack'))),
+    ]
+    for label, (sends, writes, size, seconds) in rows:
+        print(f"{label:<28} {sends:>12} {writes:>14} {size:>11} {seconds:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Shared setup for benchmarks that need Django: configures settings and runs
+against a throwaway test database. With SQLite the test database is a real
+file (``bench.sqlite3``) so commits pay for disk I/O as they would in production.
+"""
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(**overrides):
+    """
+    Configure Django, apply ``overrides`` to settings and create the test database.
+    Returns a callable that destroys the database again.
+    """
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodapibackend.settings')
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(PROJECT_DIR, 'bench.sqlite3')
+    connection.creation.create_test_db(verbosity=0)
+
+    def teardown():
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return teardown
@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import DeliveryAgent, DeliveryAgentLocation, DeliveryTask
+from .models import Delivery, DeliveryStatusArchive, DeliveryStatusUpdate, DeliveryAgentLocation, OutboxEvent
 # Register your models here.
 
-admin.site.register(DeliveryAgent)
+admin.site.register(Delivery)
+admin.site.register(DeliveryStatusUpdate)
+admin.site.register(DeliveryStatusArchive)
 admin.site.register(DeliveryAgentLocation)
-admin.site.register(DeliveryTask)
+admin.site.register(OutboxEvent)
@@ -0,0 +1,122 @@
+"""
+Archival of delivery status history.
+
+DeliveryStatusUpdate is the hot table: every transition adds a row. Once a
+delivery has been delivered or failed for ``AFTER_DAYS``, its updates are
+packed into a single DeliveryStatusArchive row and deleted from the hot
+table, so the table and its indexes only cover recent deliveries.
+``Delivery.status_history`` and the status-history endpoint read both.
+
+Each batch is one short transaction over at most ``BATCH_SIZE`` deliveries:
+a handful of statements, with no lock held between batches. Candidates are
+found from the hot table itself, so the cost of a run follows the size of
+the hot table, not of all history. Deliveries are locked with SKIP LOCKED
+(where supported) so concurrent archivers never pack the same updates twice.
+"""
+import logging
+import time
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from foodapibackend.metrics import metrics
+
+from .models import ARCHIVED_STATUSES, Delivery, DeliveryStatusArchive, DeliveryStatusUpdate
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'AFTER_DAYS': 30,
+    'BATCH_SIZE': 500,
+    'PAUSE_SECONDS': 0.0,
+}
+
+def archive_settings():
+    return {**DEFAULTS, **getattr(settings, 'DELIVERY_STATUS_ARCHIVE', {})}
+
+
+class StatusHistoryArchiver:
+    """
+    Moves the status history of deliveries completed more than ``after_days``
+    ago into DeliveryStatusArchive, ``batch_size`` deliveries at a time.
+    """
+
+    def __init__(self, after_days=30, batch_size=500, pause=0.0):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def due_delivery_ids(self, cutoff):
+        # A terminal delivery's updated_at is when it completed
+        return list(
+            DeliveryStatusUpdate.objects.filter(delivery__status__in=ARCHIVED_STATUSES,
+                                                delivery__updated_at__lt=cutoff)
+            .order_by('delivery_id').values_list('delivery_id', flat=True).distinct()[:self.batch_size]
+        )
+
+    def run_once(self, now=None):
+        """
+        Archive one batch; returns the number of deliveries archived.
+        """
+        cutoff = (now or timezone.now()) - timedelta(days=self.after_days)
+        with transaction.atomic():
+            delivery_ids = self.due_delivery_ids(cutoff)
+            if not delivery_ids:
+                return 0
+            delivery_ids = list(Delivery.objects.select_for_update(skip_locked=True)
+                                .filter(pk__in=delivery_ids).values_list('pk', flat=True))
+            rows = list(
+                DeliveryStatusUpdate.objects.filter(delivery_id__in=delivery_ids)
+                .order_by('delivery_id', 'updated_at', 'id')
+                .values_list('delivery_id', 'id', 'status', 'updated_at', 'updated_by_id', 'updated_by__email')
+            )
+            existing = DeliveryStatusArchive.objects.in_bulk(delivery_ids)
+            created, updated = [], []
+            for delivery_id, updates in groupby(rows, key=lambda row: row[0]):
+                events = [DeliveryStatusArchive.pack(*row[1:]) for row in updates]
+                archive = existing.get(delivery_id)
+                if archive is None:
+                    created.append(DeliveryStatusArchive(delivery_id=delivery_id, events=events))
+                else:
+                    # Updates written after an earlier archival (e.g. by hand) join the packed list in order
+                    archive.events = sorted(archive.events + events, key=lambda event: (event[2], event[0]))
+                    archive.archived_at = timezone.now()
+                    updated.append(archive)
+            DeliveryStatusArchive.objects.bulk_create(created)
+            if updated:
+                DeliveryStatusArchive.objects.bulk_update(updated, ['events', 'archived_at'])
+            DeliveryStatusUpdate.objects.filter(pk__in=[row[1] for row in rows]).delete()
+        metrics.incr('status_archive.deliveries', len(created) + len(updated))
+        metrics.incr('status_archive.updates', len(rows))
+        return len(created) + len(updated)
+
+    def run(self, max_batches=None, now=None):
+        """
+        Archive batches until nothing is due (or ``max_batches``); returns the deliveries archived.
+        """
+        archived = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = self.run_once(now=now)
+            batches += 1
+            archived += count
+            if count < self.batch_size:
+                break
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info("Archived the status history of %s deliveries in %s batches", archived, batches)
+        return archived
+
+
+def get_archiver(after_days=None, batch_size=None, pause=None):
+    """
+    StatusHistoryArchiver configured from DELIVERY_STATUS_ARCHIVE, with any argument given taking precedence.
+    """
+    config = archive_settings()
+    return StatusHistoryArchiver(
+        after_days=config['AFTER_DAYS'] if after_days is None else after_days,
+        batch_size=config['BATCH_SIZE'] if batch_size is None else batch_size,
+        pause=config['PAUSE_SECONDS'] if pause is None else pause,
+    )
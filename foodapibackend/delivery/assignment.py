@@ -0,0 +1,47 @@
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM
+
+# Cost given to pairs beyond the distance cap so the solver only uses them
+# when there is nothing else; such pairs are dropped from the result.
+UNREACHABLE_COST = 1e9
+
+
+def haversine_matrix(origins, destinations):
+    """
+    Pairwise haversine distances in km, computed in one vectorized pass.
+
+    ``origins`` is an (n, 2) and ``destinations`` an (m, 2) array of
+    (latitude, longitude) in degrees; the result has shape (n, m).
+    """
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    lat1 = origins[:, 0:1]
+    lat2 = destinations[:, 0][np.newaxis, :]
+    dlat = lat2 - lat1
+    dlng = destinations[:, 1][np.newaxis, :] - origins[:, 1:2]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def solve_assignment(cost, max_cost=None):
+    """
+    Minimum-total-cost matching of rows to columns (rectangular allowed).
+
+    Returns a list of ``(row, col, cost)`` tuples. Pairs costing more than
+    ``max_cost`` are never returned.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return []
+    if max_cost is not None:
+        cost = np.where(cost > max_cost, UNREACHABLE_COST, cost)
+    # scipy.optimize alone costs ~300 ms to import; only dispatch workers need it
+    from scipy.optimize import linear_sum_assignment
+
+    rows, cols = linear_sum_assignment(cost)
+    return [
+        (int(row), int(col), float(cost[row, col]))
+        for row, col in zip(rows, cols)
+        if cost[row, col] < UNREACHABLE_COST
+    ]
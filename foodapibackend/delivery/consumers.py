@@ -1,10 +1,45 @@
 import json
+import time
+from urllib.parse import parse_qs
+
+import msgpack
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .fanout import encode_frame, get_fanout, location_fields
+from .location_store import buffered_delivery_location, get_location_store
+from .models import Delivery
+from restaurant.models import Order
+
 
 class DeliveryTrackingConsumer(AsyncWebsocketConsumer):
+    """
+    Streams tracking frames for one order to its customer, the restaurant
+    owner, the assigned agent or staff. Frames are ``{data, seq, delta}``
+    with ``data`` holding any of ``status``, ``latitude``, ``longitude`` and
+    ``timestamp``; clients merge every frame into their state (see
+    delivery.fanout). Connect with ``?encoding=msgpack`` to receive binary
+    msgpack frames.
+    """
+
     async def connect(self):
         self.order_id = self.scope['url_route']['kwargs']['order_id']
         self.delivery_group_name = f"delivery_{self.order_id}"
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.encoding = 'msgpack' if query.get('encoding') == ['msgpack'] else 'json'
+        # Last seq seen from each publisher; sequences are per process
+        self.last_seq = {}
+
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        if not await self.can_track(user):
+            await self.close(code=4403)
+            return
 
         await self.channel_layer.group_add(
             self.delivery_group_name,
@@ -12,11 +47,117 @@ class DeliveryTrackingConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
+        snapshot = await self.get_snapshot()
+        if snapshot:
+            await self.send_frame({'data': snapshot, 'seq': 0, 'delta': False})
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             self.delivery_group_name,
             self.channel_name
         )
 
+    @database_sync_to_async
+    def can_track(self, user):
+        if not self.order_id.isdigit():
+            return False
+        orders = Order.objects.filter(pk=self.order_id)
+        if not user.is_staff:
+            orders = orders.filter(Q(customer=user) | Q(restaurant__user=user) | Q(delivery__delivery_agent=user))
+        return orders.exists()
+
+    @database_sync_to_async
+    def get_snapshot(self):
+        delivery = Delivery.objects.filter(order_id=self.order_id).values_list(
+            'pk', 'status', 'current_latitude', 'current_longitude').first()
+        if delivery is None:
+            return None
+        pk, status, latitude, longitude = delivery
+        snapshot = {'status': status}
+        buffered = buffered_delivery_location(pk)
+        if buffered:
+            latitude, longitude = buffered
+        if latitude is not None:
+            # The same fields as location frames (delivery.fanout.location_fields)
+            snapshot.update(latitude=round(float(latitude), 6), longitude=round(float(longitude), 6))
+        return snapshot
+
+    async def send_frame(self, frame):
+        text_data, bytes_data = encode_frame(frame, self.encoding)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
     async def send_delivery_update(self, event):
-        await self.send(text_data=json.dumps(event))
+        seq, source = event.get('seq'), event.get('source')
+        if seq is not None:
+            if seq <= self.last_seq.get(source, 0):
+                return
+            self.last_seq[source] = seq
+        await self.send_frame({key: event[key] for key in ('data', 'seq', 'delta') if key in event})
+
+
+class AgentLocationConsumer(AsyncWebsocketConsumer):
+    """
+    Long-lived socket for a delivery agent's GPS stream.
+
+    The JWT is checked once when the socket connects (see
+    accounts.middleware.JWTAuthMiddleware). Each frame is
+    ``{"delivery_id": ..., "latitude": ..., "longitude": ...}`` as JSON text or
+    msgpack bytes. Ownership of a delivery is checked against the database on
+    its first frame and again once ``DELIVERY_AGENT_OWNERSHIP_TTL_SECONDS``
+    have passed, so an agent stops being able to write once the delivery is
+    reassigned, delivered or failed; in between, positions go straight to
+    the location store and the tracking group of the order. Nothing is sent
+    back unless a frame is rejected.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or user.role != 'delivery_agent':
+            await self.close(code=4401)
+            return
+        self.agent = user
+        # delivery_id -> (recheck_at, (pk, order_id))
+        self.deliveries = {}
+        self.ownership_ttl = getattr(settings, 'DELIVERY_AGENT_OWNERSHIP_TTL_SECONDS', 5.0)
+        await self.accept()
+
+    @database_sync_to_async
+    def get_delivery(self, delivery_id):
+        try:
+            return Delivery.objects.filter(
+                pk=delivery_id,
+                delivery_agent=self.agent,
+                status__in=('assigned', 'in_transit'),
+            ).values_list('pk', 'order_id').first()
+        except (ValueError, ValidationError):
+            return None
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({'error': message}))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            frame = msgpack.unpackb(bytes_data) if bytes_data is not None else json.loads(text_data)
+            delivery_id = str(frame['delivery_id'])
+            latitude = float(frame['latitude'])
+            longitude = float(frame['longitude'])
+        except (ValueError, TypeError, KeyError, msgpack.UnpackException):
+            await self.send_error("Invalid location frame")
+            return
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            await self.send_error("Invalid location data")
+            return
+
+        now = time.monotonic()
+        recheck_at, delivery = self.deliveries.get(delivery_id, (now, None))
+        if recheck_at <= now:
+            delivery = await self.get_delivery(delivery_id)
+            if delivery is None:
+                self.deliveries.pop(delivery_id, None)
+                await self.send_error("Unknown delivery")
+                return
+            self.deliveries[delivery_id] = (now + self.ownership_ttl, delivery)
+        pk, order_id = delivery
+
+        get_location_store().record(pk, self.agent.pk, latitude, longitude)
+        await get_fanout().apublish(order_id, location_fields(latitude, longitude))
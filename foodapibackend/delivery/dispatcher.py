@@ -0,0 +1,285 @@
+import heapq
+import itertools
+import json
+import logging
+import math
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from foodapibackend.metrics import metrics
+from .services import BatchDispatchService
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'QUEUE_URL': None,
+    'WINDOW_SECONDS': 0.5,
+    'MAX_BATCH': 200,
+    'CANDIDATES_PER_DELIVERY': 10,
+    'MAX_DISTANCE_KM': None,
+    'IN_PROCESS_WORKER': True,
+    'RETRY_BACKOFF_SECONDS': 5.0,
+    'RETRY_MAX_BACKOFF_SECONDS': 300.0,
+    'RETRY_MAX_ATTEMPTS': 20,
+}
+
+
+class LocalDispatchQueue:
+    """
+    In-memory queue for running the dispatcher inside the web process and in tests.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(block=timeout != 0, timeout=timeout or None)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class RedisDispatchQueue:
+    """
+    Redis list shared between web processes and a standalone dispatcher worker.
+    """
+
+    def __init__(self, url, key='delivery:dispatch'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def put(self, item):
+        self.client.rpush(self.key, json.dumps(item))
+
+    def get(self, timeout=None):
+        if timeout == 0:
+            raw = self.client.lpop(self.key)
+        else:
+            popped = self.client.blpop([self.key], timeout=math.ceil(timeout) if timeout else 0)
+            raw = popped[1] if popped else None
+        return json.loads(raw) if raw else None
+
+    def qsize(self):
+        return self.client.llen(self.key)
+
+
+class Dispatcher:
+    """
+    Assign newly created deliveries to agents off the request path.
+
+    Deliveries are read from the queue in micro-batches: the first item blocks,
+    then everything arriving within ``window`` seconds (up to ``max_batch``)
+    joins the batch, which is solved in one go by BatchDispatchService.
+    Records ``dispatch.queue_depth`` and ``dispatch.latency_seconds`` (time
+    from being queued, or queued again after a backoff, to being dispatched).
+
+    Deliveries left unassigned (no free agent in range) and batches that
+    fail are queued again after ``retry_backoff`` seconds, doubling per
+    attempt up to ``retry_max_backoff``, until they are assigned, leave
+    ``pending`` or have been tried ``retry_max_attempts`` times. Deliveries
+    without pickup coordinates are not retried at all. Both are logged and
+    stay pending for the next sweep. Retries wait in this worker's memory;
+    ``run_forever`` first sweeps pending deliveries into the queue so a
+    restart does not strand them.
+    """
+
+    def __init__(self, dispatch_queue, window=0.5, max_batch=200, candidates_per_delivery=10, max_distance_km=None,
+                 retry_backoff=5.0, retry_max_backoff=300.0, retry_max_attempts=20):
+        self.queue = dispatch_queue
+        self.window = window
+        self.max_batch = max_batch
+        self.candidates_per_delivery = candidates_per_delivery
+        self.max_distance_km = max_distance_km
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.retry_max_attempts = retry_max_attempts
+        self._retries = []
+        self._retry_order = itertools.count()
+        self._retries_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def enqueue(self, delivery_id):
+        self.queue.put({'id': str(delivery_id), 'enqueued_at': time.time()})
+        metrics.incr('dispatch.enqueued')
+        metrics.gauge('dispatch.queue_depth', self.queue.qsize())
+
+    def retry(self, items, now=None):
+        """
+        Hold ``items`` back for their next backoff interval, then queue them again (see ``requeue_due``).
+        """
+        now = time.monotonic() if now is None else now
+        abandoned = [item['id'] for item in items if item.get('attempts', 0) >= self.retry_max_attempts]
+        if abandoned:
+            logger.warning("Giving up on dispatching %s after %d attempts", abandoned, self.retry_max_attempts)
+            metrics.incr('dispatch.abandoned', len(abandoned))
+        items = [item for item in items if item.get('attempts', 0) < self.retry_max_attempts]
+        with self._retries_lock:
+            for item in items:
+                attempts = item.get('attempts', 0) + 1
+                delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_max_backoff)
+                heapq.heappush(self._retries, (now + delay, next(self._retry_order), {**item, 'attempts': attempts}))
+        metrics.incr('dispatch.retried', len(items))
+
+    def requeue_due(self, now=None):
+        """
+        Queue the retries whose backoff has elapsed. Returns how many.
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._retries_lock:
+            while self._retries and self._retries[0][0] <= now:
+                due.append(heapq.heappop(self._retries)[2])
+        for item in due:
+            # Latency counts from here, not from the first enqueue, so it leaves out the backoff
+            self.queue.put({**item, 'enqueued_at': time.time()})
+        return len(due)
+
+    def sweep(self):
+        """
+        Queue every pending, unassigned delivery. Returns how many.
+        """
+        from .models import Delivery
+
+        delivery_ids = Delivery.objects.filter(status='pending', delivery_agent__isnull=True).values_list(
+            'pk', flat=True)
+        count = 0
+        for delivery_id in delivery_ids.iterator():
+            self.enqueue(delivery_id)
+            count += 1
+        return count
+
+    def collect_batch(self, timeout=None):
+        first = self.queue.get(timeout=timeout)
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            item = self.queue.get(timeout=max(remaining, 0))
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def dispatch(self, batch):
+        if not batch:
+            return None
+        try:
+            result = BatchDispatchService(
+                max_distance_km=self.max_distance_km,
+                delivery_ids=[item['id'] for item in batch],
+                candidates_per_delivery=self.candidates_per_delivery,
+            ).run()
+        except Exception:
+            self.retry(batch)
+            raise
+        unlocated = set(result['unlocated_ids'])
+        if unlocated:
+            logger.warning("Not retrying deliveries without pickup coordinates: %s", sorted(unlocated))
+            metrics.incr('dispatch.unlocated', len(unlocated))
+        unassigned = set(result['unassigned_ids']) - unlocated
+        self.retry([item for item in batch if item['id'] in unassigned])
+
+        finished = time.time()
+        for item in batch:
+            metrics.observe('dispatch.latency_seconds', finished - item['enqueued_at'])
+        metrics.observe('dispatch.batch_size', len(batch))
+        metrics.incr('dispatch.batches')
+        metrics.incr('dispatch.assigned', result['assigned'])
+        metrics.incr('dispatch.unassigned', result['pending'] - result['assigned'])
+        metrics.gauge('dispatch.queue_depth', self.queue.qsize())
+        return result
+
+    def run_once(self, timeout=0):
+        """
+        Collect and dispatch a single micro-batch. Returns the dispatch summary or None.
+        """
+        self.requeue_due()
+        return self.dispatch(self.collect_batch(timeout=timeout))
+
+    def run_forever(self, poll_timeout=1.0):
+        try:
+            self.sweep()
+        except Exception:
+            logger.exception("Sweeping pending deliveries failed")
+        while not self._stopping.is_set():
+            try:
+                self.requeue_due()
+                batch = self.collect_batch(timeout=poll_timeout)
+                if batch:
+                    close_old_connections()
+                    self.dispatch(batch)
+            except Exception:
+                logger.exception("Delivery dispatch batch failed")
+                metrics.incr('dispatch.errors')
+        close_old_connections()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='delivery-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def dispatcher_settings():
+    return {**DEFAULTS, **getattr(settings, 'DELIVERY_DISPATCHER', {})}
+
+
+def build_dispatcher(config=None):
+    config = config or dispatcher_settings()
+    if config['QUEUE_URL']:
+        dispatch_queue = RedisDispatchQueue(config['QUEUE_URL'])
+    else:
+        dispatch_queue = LocalDispatchQueue()
+    return Dispatcher(
+        dispatch_queue,
+        window=config['WINDOW_SECONDS'],
+        max_batch=config['MAX_BATCH'],
+        candidates_per_delivery=config['CANDIDATES_PER_DELIVERY'],
+        max_distance_km=config['MAX_DISTANCE_KM'],
+        retry_backoff=config['RETRY_BACKOFF_SECONDS'],
+        retry_max_backoff=config['RETRY_MAX_BACKOFF_SECONDS'],
+        retry_max_attempts=config['RETRY_MAX_ATTEMPTS'],
+    )
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = build_dispatcher()
+        return _dispatcher
+
+
+def enqueue_delivery(delivery_id):
+    """
+    Queue a delivery for assignment, starting the in-process worker if configured.
+    """
+    dispatcher = get_dispatcher()
+    dispatcher.enqueue(delivery_id)
+    if dispatcher_settings()['IN_PROCESS_WORKER']:
+        dispatcher.start()
@@ -0,0 +1,138 @@
+"""
+Distance providers for delivery quotes.
+
+``get_distance_provider()`` returns the configured provider, wrapped in a
+RouteCache when the provider is costly to call (a routing API). Endpoints
+are then quantized to geohash cells and the route is computed between the
+cell centres, so every quote from the same restaurant to the same ~150 m
+neighbourhood reuses one cached result and gets the same price; that is
+an approximation of up to a cell per endpoint. The offline
+HaversineProvider is exact and faster than a cache lookup, so it is never
+wrapped.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from foodapibackend.metrics import metrics
+
+from .geo import geohash_bits, geohash_cell_center, haversine
+
+DEFAULTS = {
+    'PROVIDER': 'delivery.distance.HaversineProvider',
+    # Keyword arguments for the provider class
+    'OPTIONS': {},
+    'CACHE_PRECISION': 7,
+    'CACHE_SIZE': 10000,
+    'CACHE_TTL_SECONDS': 3600,
+}
+
+Route = namedtuple('Route', ['distance_km', 'duration_minutes'])
+
+
+class HaversineProvider:
+    """
+    Offline estimate: great-circle distance times ``road_factor`` (streets
+    are rarely straight; ~1.3 is typical in cities), at ``speed_kmh``.
+    """
+    # Cheaper than a RouteCache lookup, and exact
+    cacheable = False
+
+    def __init__(self, road_factor=1.0, speed_kmh=30):
+        self.road_factor = road_factor
+        self.speed_kmh = speed_kmh
+
+    def route(self, start, end):
+        distance = haversine(*start, *end) * self.road_factor
+        return Route(distance, distance / self.speed_kmh * 60)
+
+
+class RouteCache:
+    """
+    LRU cache with a TTL in front of a provider, keyed on the geohash cells
+    of both endpoints. Endpoints in the same cell are routed exactly rather
+    than quoted as zero. Counts ``distance.cache.hit/miss/evicted``; the
+    ``distance.cache.hit_rate`` gauge is refreshed on each miss.
+    """
+
+    def __init__(self, provider, precision=7, maxsize=10000, ttl=3600):
+        self.provider = provider
+        self.precision = precision
+        self.maxsize = maxsize
+        self.ttl = ttl
+        lat_bits, lng_bits = geohash_bits(precision)
+        # Cell indexes as in geo.geohash_cell, with the scales hoisted out of the hot path
+        self._lat_scale = (1 << lat_bits) / 180.0
+        self._lng_scale = (1 << lng_bits) / 360.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cell(self, lat, lng):
+        return int((lat + 90.0) * self._lat_scale), int((lng + 180.0) * self._lng_scale)
+
+    def route(self, start, end):
+        key = (self.cell(*start), self.cell(*end))
+        if key[0] == key[1]:
+            return self.provider.route(start, end)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.incr('distance.cache.hit')
+                return entry[1]
+
+        metrics.incr('distance.cache.miss')
+        route = self.provider.route(geohash_cell_center(key[0], self.precision),
+                                    geohash_cell_center(key[1], self.precision))
+        with self._lock:
+            self._entries[key] = (now + self.ttl, route)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                metrics.incr('distance.cache.evicted')
+        self._record_hit_rate()
+        return route
+
+    @staticmethod
+    def _record_hit_rate():
+        metrics.gauge('distance.cache.hit_rate', metrics.ratio('distance.cache.hit', 'distance.cache.miss'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def distance_settings():
+    return {**DEFAULTS, **getattr(settings, 'DELIVERY_DISTANCE', {})}
+
+
+def build_distance_provider(config=None):
+    """
+    The ``PROVIDER`` class built with ``OPTIONS``, behind a RouteCache unless
+    it is cheap (``cacheable = False``) or ``CACHE_SIZE`` is 0.
+    """
+    config = {**DEFAULTS, **(config or distance_settings())}
+    provider = import_string(config['PROVIDER'])(**config['OPTIONS'])
+    if not config['CACHE_SIZE'] or not getattr(provider, 'cacheable', True):
+        return provider
+    return RouteCache(provider, precision=config['CACHE_PRECISION'], maxsize=config['CACHE_SIZE'],
+                      ttl=config['CACHE_TTL_SECONDS'])
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_distance_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = build_distance_provider()
+        return _provider
@@ -0,0 +1,237 @@
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from foodapibackend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('delivered', 'failed')
+
+
+def tracking_group(order_id):
+    return f"delivery_{order_id}"
+
+
+def encode_frame(frame, encoding='json'):
+    """
+    Serialize a tracking frame for the socket. Returns ``(text, bytes)`` with
+    exactly one of them set, matching ``AsyncWebsocketConsumer.send``.
+    """
+    if encoding == 'msgpack':
+        return None, msgpack.packb(frame, default=str)
+    return json.dumps(frame, default=str, separators=(',', ':')), None
+
+
+class TrackingFanout:
+    """
+    Coalescing, delta-encoding publisher for the ``delivery_{order_id}`` groups.
+
+    Updates published within one ``window`` are merged per group (newest value
+    of each field wins) and sent as a single channel-layer message per group.
+    Frames carry only the fields that changed since the previous frame
+    (``delta: true``); every ``keyframe_every``-th frame carries every field
+    this publisher tracks so late subscribers converge.
+
+    Several processes publish to the same group (HTTP workers for pings, the
+    outbox relay for status changes), each with its own state and sequence.
+    Frames name their publisher in ``source`` and are ordered per publisher;
+    clients merge every frame, keyframes included, into their state, since
+    no one publisher knows all the fields.
+
+    Per-group state is dropped when a terminal status passes through, or
+    after ``idle_seconds`` without a frame: workers that only see pings
+    never learn that a delivery ended. Sequence numbers come from one
+    counter per publisher, so they keep increasing for a group whose state
+    was dropped; its next frame is a keyframe.
+    """
+
+    def __init__(self, window=1.0, keyframe_every=20, channel_layer=None, idle_seconds=300):
+        self.window = window
+        self.keyframe_every = keyframe_every
+        self.idle_seconds = idle_seconds
+        self.source = uuid.uuid4().hex[:12]
+        self._channel_layer = channel_layer
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._state = {}
+        self._frames = {}
+        self._last_sent = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def channel_layer(self):
+        if self._channel_layer is None:
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+
+    def _merge(self, order_id, fields):
+        group = tracking_group(order_id)
+        with self._lock:
+            self._pending.setdefault(group, {}).update(fields)
+        metrics.incr('fanout.published')
+
+    def publish(self, order_id, fields):
+        self._merge(order_id, fields)
+        if not self.window:
+            self.flush()
+
+    async def apublish(self, order_id, fields):
+        """
+        ``publish`` for callers already running on an event loop (consumers).
+        """
+        self._merge(order_id, fields)
+        if not self.window:
+            events = self.build_frames()
+            await self._send_all(events)
+            metrics.incr('fanout.frames', len(events))
+
+    def _frame(self, group, fields, keyframe=False):
+        # Caller holds self._lock
+        previous = self._state.get(group)
+        count = self._frames.get(group, 0) + 1
+        state = {**(previous or {}), **fields}
+        keyframe = keyframe or previous is None or count % self.keyframe_every == 0
+        data = state if keyframe else {
+            key: value for key, value in fields.items() if previous.get(key) != value
+        }
+        if not data:
+            return None
+        if state.get('status') in TERMINAL_STATUSES:
+            self._forget(group)
+        else:
+            self._state[group] = state
+            self._frames[group] = count
+            self._last_sent[group] = time.monotonic()
+            self._last_sent.move_to_end(group)
+        return {
+            'type': 'send_delivery_update',
+            'data': data,
+            'seq': next(self._sequence),
+            'source': self.source,
+            'delta': not keyframe,
+        }
+
+    def _forget(self, group):
+        self._state.pop(group, None)
+        self._frames.pop(group, None)
+        self._last_sent.pop(group, None)
+
+    def evict_idle(self, now=None):
+        """
+        Drop the state of groups without a frame for ``idle_seconds``. Returns how many were dropped.
+        """
+        cutoff = (time.monotonic() if now is None else now) - self.idle_seconds
+        evicted = 0
+        with self._lock:
+            while self._last_sent:
+                group, last_sent = next(iter(self._last_sent.items()))
+                if last_sent > cutoff:
+                    break
+                self._forget(group)
+                evicted += 1
+        if evicted:
+            metrics.incr('fanout.evicted', evicted)
+        return evicted
+
+    def build_frames(self):
+        """
+        Drain pending updates into ``(group, event)`` pairs ready for ``group_send``.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            events = []
+            for group, fields in pending.items():
+                event = self._frame(group, fields)
+                if event is not None:
+                    events.append((group, event))
+        self.evict_idle()
+        return events
+
+    def send_now(self, order_id, fields):
+        """
+        Send ``fields``, and anything pending for the group, as a keyframe
+        right away, raising whatever the channel layer raises. For the outbox
+        relay, which may only mark an event published once it was sent; a
+        keyframe stays correct when the event is sent again.
+        """
+        group = tracking_group(order_id)
+        with self._lock:
+            event = self._frame(group, {**self._pending.pop(group, {}), **fields}, keyframe=True)
+        async_to_sync(self.channel_layer.group_send)(group, event)
+        metrics.incr('fanout.frames')
+
+    def flush(self):
+        events = self.build_frames()
+        if events:
+            async_to_sync(self._send_all)(events)
+            metrics.incr('fanout.frames', len(events))
+        return len(events)
+
+    async def _send_all(self, events):
+        layer = self.channel_layer
+        for group, event in events:
+            await layer.group_send(group, event)
+
+    def run_forever(self):
+        while not self._stopping.wait(self.window):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Tracking fan-out flush failed")
+                metrics.incr('fanout.errors')
+
+    def start(self):
+        if self.window and (self._thread is None or not self._thread.is_alive()):
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='tracking-fanout', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_fanout = None
+_fanout_lock = threading.Lock()
+
+
+def get_fanout():
+    """
+    Return the process-wide TrackingFanout, starting its flush thread on first use.
+    """
+    global _fanout
+    with _fanout_lock:
+        if _fanout is None:
+            _fanout = TrackingFanout(
+                window=getattr(settings, 'DELIVERY_TRACKING_WINDOW_SECONDS', 1.0),
+                keyframe_every=getattr(settings, 'DELIVERY_TRACKING_KEYFRAME_EVERY', 20),
+                idle_seconds=getattr(settings, 'DELIVERY_TRACKING_IDLE_SECONDS', 300),
+            )
+            _fanout.start()
+        return _fanout
+
+
+def location_fields(lat, lng):
+    return {
+        'latitude': round(float(lat), 6),
+        'longitude': round(float(lng), 6),
+        'timestamp': round(time.time(), 1),
+    }
+
+
+def publish_location(order_id, lat, lng):
+    get_fanout().publish(order_id, location_fields(lat, lng))
@@ -0,0 +1,126 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.195
+# Stored geohash columns use ~5 m cells; any shorter prefix selects a larger cell.
+GEOHASH_PRECISION = 9
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in kilometres between two points.
+
+    Cheap compared with geopy's ``geodesic`` and within ~0.5% of it, which makes
+    it a good prefilter before any exact refinement.
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    ``(min_lat, max_lat, min_lng, max_lng)`` of a box containing every point
+    within ``radius_km`` of ``(lat, lng)``. ``min_lng > max_lng`` means the
+    box wraps across the antimeridian; near the poles it spans every longitude.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 89.9:
+        return min_lat, max_lat, -180.0, 180.0
+    # Degrees of longitude are shortest at the box's poleward edge
+    dlng = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(widest)))
+    if dlng >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180:
+        min_lng += 360
+    elif max_lng > 180:
+        max_lng -= 360
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def parse_coordinates(value):
+    """
+    Parse a "lat, lng" string (as stored on Delivery) into a float tuple.
+    Returns None when the value is empty or malformed.
+    """
+    if not value:
+        return None
+    try:
+        lat, lng = (float(part) for part in str(value).split(','))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_bits(precision):
+    """
+    Bits of latitude and longitude in a geohash of ``precision`` characters.
+    """
+    bits = precision * 5
+    return bits // 2, bits - bits // 2
+
+
+def geohash_cell(lat, lng, precision=7):
+    """
+    ``(lat_index, lng_index)`` of the geohash cell containing the point.
+    Same cell as ``geohash_encode`` at this precision, but a few times
+    cheaper, which makes it the better cache key.
+    """
+    lat_bits, lng_bits = geohash_bits(precision)
+    lat_index = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    lng_index = min(int((lng + 180.0) / 360.0 * (1 << lng_bits)), (1 << lng_bits) - 1)
+    return lat_index, lng_index
+
+
+def geohash_cell_center(cell, precision=7):
+    lat_bits, lng_bits = geohash_bits(precision)
+    return (
+        (cell[0] + 0.5) / (1 << lat_bits) * 180.0 - 90.0,
+        (cell[1] + 0.5) / (1 << lng_bits) * 360.0 - 180.0,
+    )
+
+
+def geohash_encode(lat, lng, precision=7):
+    """
+    Standard base32 geohash of a point. Precision 7 is a ~150 m cell,
+    6 is ~1.2 km, 5 is ~5 km.
+    """
+    lat_bits, lng_bits = geohash_bits(precision)
+    lat_index, lng_index = geohash_cell(lat, lng, precision)
+    value = 0
+    # Bits interleave starting with longitude
+    for bit in range(lng_bits + lat_bits):
+        if bit % 2 == 0:
+            value = value << 1 | (lng_index >> (lng_bits - 1 - bit // 2) & 1)
+        else:
+            value = value << 1 | (lat_index >> (lat_bits - 1 - bit // 2) & 1)
+    return ''.join(GEOHASH_ALPHABET[value >> shift & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+
+def geohash_decode(geohash):
+    """
+    Centre ``(lat, lng)`` of a geohash cell.
+    """
+    precision = len(geohash)
+    lat_bits, lng_bits = geohash_bits(precision)
+    value = 0
+    for char in geohash:
+        value = value << 5 | GEOHASH_ALPHABET.index(char)
+    lat_index = lng_index = 0
+    for bit in range(lng_bits + lat_bits):
+        current = value >> (lng_bits + lat_bits - 1 - bit) & 1
+        if bit % 2 == 0:
+            lng_index = lng_index << 1 | current
+        else:
+            lat_index = lat_index << 1 | current
+    return geohash_cell_center((lat_index, lng_index), precision)
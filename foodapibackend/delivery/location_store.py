@@ -0,0 +1,196 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from foodapibackend.metrics import metrics
+from .models import Delivery, DeliveryAgentLocation
+from .spatial import get_agent_index
+
+logger = logging.getLogger(__name__)
+
+
+def format_location(lat, lng):
+    return f"{lat}, {lng}"
+
+
+class LocationStore:
+    """
+    Write-behind buffer for agent GPS pings.
+
+    The latest position per agent and per delivery is kept in memory and
+    served from there; dirty positions are written to ``Delivery.current_location``
+    and ``DeliveryAgentLocation`` every ``flush_interval`` seconds with
+    ``bulk_update`` (or on demand, e.g. before a status transition).
+    The buffer is per process, so readers in other processes see the last
+    flushed value.
+    """
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._agents = {}
+        self._deliveries = {}
+        self._dirty_agents = set()
+        self._dirty_deliveries = set()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def record(self, delivery_id, agent_id, lat, lng):
+        lat, lng = float(lat), float(lng)
+        position = (lat, lng, time.time())
+        with self._lock:
+            self._deliveries[delivery_id] = position
+            self._dirty_deliveries.add(delivery_id)
+            if agent_id is not None:
+                self._agents[agent_id] = position
+                self._dirty_agents.add(agent_id)
+        if agent_id is not None:
+            get_agent_index().update(agent_id, lat, lng)
+        metrics.incr('location.pings')
+
+    def reset(self):
+        """
+        Drop all buffered positions without writing them.
+        """
+        with self._lock:
+            self._agents.clear()
+            self._deliveries.clear()
+            self._dirty_agents.clear()
+            self._dirty_deliveries.clear()
+
+    def delivery_location(self, delivery_id):
+        position = self._deliveries.get(delivery_id)
+        return position[:2] if position else None
+
+    def agent_location(self, agent_id):
+        position = self._agents.get(agent_id)
+        return position[:2] if position else None
+
+    def flush(self, delivery_ids=None, agent_ids=None):
+        """
+        Write dirty positions to the database, all of them or only those of
+        ``delivery_ids`` and ``agent_ids``. Returns ``(deliveries, agents)`` written.
+        """
+        scoped = delivery_ids is not None or agent_ids is not None
+        with self._flush_lock:
+            with self._lock:
+                dirty_deliveries = self._dirty_deliveries & set(delivery_ids or ()) if scoped else self._dirty_deliveries
+                dirty_agents = self._dirty_agents & set(agent_ids or ()) if scoped else self._dirty_agents
+                deliveries = {pk: self._deliveries[pk] for pk in dirty_deliveries}
+                agents = {pk: self._agents[pk] for pk in dirty_agents}
+                self._dirty_deliveries -= dirty_deliveries
+                self._dirty_agents -= dirty_agents
+            if not deliveries and not agents:
+                return 0, 0
+
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    self._write(deliveries, agents)
+            except Exception:
+                with self._lock:
+                    self._dirty_deliveries.update(deliveries)
+                    self._dirty_agents.update(agents)
+                raise
+            metrics.observe('location.flush_seconds', time.perf_counter() - started)
+            metrics.incr('location.flushed_rows', len(deliveries) + len(agents))
+            return len(deliveries), len(agents)
+
+    def _write(self, deliveries, agents):
+        if deliveries:
+            Delivery.objects.bulk_update(
+                [Delivery(pk=pk, current_location=format_location(lat, lng), current_latitude=lat, current_longitude=lng)
+                 for pk, (lat, lng, _) in deliveries.items()],
+                fields=['current_location', 'current_latitude', 'current_longitude'],
+                batch_size=500,
+            )
+        if agents:
+            now = timezone.now()
+            existing = dict(
+                DeliveryAgentLocation.objects.filter(agent_id__in=agents).values_list('agent_id', 'id')
+            )
+            updates, creates = [], []
+            for agent_id, (lat, lng, _) in agents.items():
+                location = DeliveryAgentLocation(
+                    id=existing.get(agent_id), agent_id=agent_id,
+                    latitude=round(lat, 6), longitude=round(lng, 6), updated_at=now,
+                )
+                (updates if location.id else creates).append(location)
+            if updates:
+                DeliveryAgentLocation.objects.bulk_update(
+                    updates, fields=['latitude', 'longitude', 'updated_at'], batch_size=500,
+                )
+            if creates:
+                DeliveryAgentLocation.objects.bulk_create(creates, batch_size=500, ignore_conflicts=True)
+
+    def flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Location flush failed")
+            metrics.incr('location.flush_errors')
+
+    def run_forever(self):
+        while not self._stopping.wait(self.flush_interval):
+            close_old_connections()
+            self.flush_quietly()
+        close_old_connections()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='location-flusher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_location_store = None
+_location_store_lock = threading.Lock()
+
+
+def get_location_store():
+    """
+    Return the process-wide LocationStore, starting its flush thread on first use.
+    """
+    global _location_store
+    with _location_store_lock:
+        if _location_store is None:
+            _location_store = LocationStore(
+                flush_interval=getattr(settings, 'DELIVERY_LOCATION_FLUSH_SECONDS', 5.0),
+            )
+            if _location_store.flush_interval:
+                _location_store.start()
+            atexit.register(_location_store.flush_quietly)
+        return _location_store
+
+
+def flush_delivery_location(delivery_id, agent_id=None):
+    """
+    Write the delivery's and its agent's buffered positions now, e.g. before
+    a status transition, so a delivered or failed delivery is committed with
+    its final position. A no-op in processes that never buffered a ping.
+    """
+    store = _location_store
+    if store is not None:
+        store.flush(delivery_ids=[delivery_id], agent_ids=[agent_id] if agent_id is not None else [])
+
+
+def buffered_delivery_location(delivery_id):
+    """
+    The delivery's unflushed position in this process, if any. Unlike
+    ``get_location_store`` this never creates the store or starts its thread,
+    so readers (serializers, the tracking snapshot) stay side-effect free.
+    """
+    store = _location_store
+    return store.delivery_location(delivery_id) if store is not None else None
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from delivery.archive import get_archiver
+
+
+class Command(BaseCommand):
+    help = "Pack the status history of long-completed deliveries into the archive table, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive deliveries completed at least this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=None, help="Deliveries per transaction.")
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many batches.")
+        parser.add_argument('--pause', type=float, default=None, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        archiver = get_archiver(after_days=options['days'], batch_size=options['batch_size'], pause=options['pause'])
+        archived = archiver.run(max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f"Archived the status history of {archived} deliveries"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from delivery.services import BatchDispatchService
+
+
+class Command(BaseCommand):
+    help = "Assign all pending deliveries to free delivery agents in one optimal batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-distance-km',
+            type=float,
+            default=None,
+            help="Never assign an agent farther than this from the pickup point.",
+        )
+
+    def handle(self, *args, **options):
+        result = BatchDispatchService(max_distance_km=options['max_distance_km']).run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {result['assigned']} of {result['pending']} pending deliveries "
+            f"to {result['agents']} free agents "
+            f"(total {result['total_distance_km']} km, solve {result['solve_seconds'] * 1000:.1f} ms, "
+            f"total {result['total_seconds'] * 1000:.1f} ms)"
+        ))
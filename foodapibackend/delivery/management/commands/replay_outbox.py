@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from delivery.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = "Mark outbox events as pending again so the relay publishes them a second time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since-id', type=int, default=None, help="Replay events with this id or later.")
+        parser.add_argument('--topic', default=None, help="Only replay events of this topic.")
+        parser.add_argument('--failed', action='store_true', help="Only replay events that gave up with an error.")
+
+    def handle(self, *args, **options):
+        events = OutboxEvent.objects.filter(published_at__isnull=False)
+        if options['since_id'] is not None:
+            events = events.filter(id__gte=options['since_id'])
+        if options['topic']:
+            events = events.filter(topic=options['topic'])
+        if options['failed']:
+            events = events.exclude(last_error='')
+        replayed = events.update(published_at=None, attempts=0, last_error='')
+        self.stdout.write(self.style.SUCCESS(f"Marked {replayed} outbox events for replay"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from delivery.dispatcher import get_dispatcher
+from foodapibackend.metrics import metrics
+
+
+class Command(BaseCommand):
+    help = "Run the delivery dispatcher worker, assigning queued deliveries in micro-batches."
+
+    def handle(self, *args, **options):
+        dispatcher = get_dispatcher()
+        self.stdout.write(f"Dispatching in {dispatcher.window}s windows (max {dispatcher.max_batch} per batch)")
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(str(metrics.snapshot()))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from delivery.outbox import get_outbox_relay
+from foodapibackend.metrics import metrics
+
+
+class Command(BaseCommand):
+    help = "Run the outbox relay, publishing committed delivery and order events in batches."
+
+    def handle(self, *args, **options):
+        relay = get_outbox_relay()
+        self.stdout.write(f"Relaying up to {relay.batch_size} events per batch (poll {relay.poll_interval}s)")
+        try:
+            relay.run_forever()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(str(metrics.snapshot()))
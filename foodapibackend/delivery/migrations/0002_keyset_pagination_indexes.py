@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0001_initial'),
+        ('restaurant', '0006_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_agent', 'created_at', 'id'], name='delivery_agent_created_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0002_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliverystatusupdate',
+            index=models.Index(fields=['delivery', 'updated_at', 'id'], name='status_update_history_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+from delivery.geo import GEOHASH_PRECISION, geohash_encode, parse_coordinates
+
+LOCATION_COLUMNS = {
+    'pickup_location': ('pickup_latitude', 'pickup_longitude', 'pickup_geohash'),
+    'dropoff_location': ('dropoff_latitude', 'dropoff_longitude', 'dropoff_geohash'),
+    'current_location': ('current_latitude', 'current_longitude', None),
+}
+
+
+def parse_locations(apps, schema_editor):
+    Delivery = apps.get_model('delivery', 'Delivery')
+    fields = [column for columns in LOCATION_COLUMNS.values() for column in columns if column]
+    batch = []
+    for delivery in Delivery.objects.only('pk', *LOCATION_COLUMNS).iterator(chunk_size=2000):
+        for field, (lat_field, lng_field, geohash_field) in LOCATION_COLUMNS.items():
+            coords = parse_coordinates(getattr(delivery, field))
+            # Set every column, even to empty, so bulk_update never reads a deferred field
+            setattr(delivery, lat_field, coords[0] if coords else None)
+            setattr(delivery, lng_field, coords[1] if coords else None)
+            if geohash_field:
+                setattr(delivery, geohash_field, geohash_encode(*coords, GEOHASH_PRECISION) if coords else '')
+        batch.append(delivery)
+        if len(batch) == 2000:
+            Delivery.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        Delivery.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0004_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='current_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='current_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='dropoff_geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='dropoff_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='dropoff_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='pickup_geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='pickup_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='pickup_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(parse_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0005_delivery_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
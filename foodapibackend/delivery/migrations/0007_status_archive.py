@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_delivery_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryStatusArchive',
+            fields=[
+                ('delivery', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status_archive', serialize=False, to='delivery.delivery')),
+                ('events', models.JSONField(default=list)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0007_status_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxRelayLease',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('holder', models.CharField(max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
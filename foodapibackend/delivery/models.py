@@ -1,9 +1,24 @@
+from datetime import datetime
+
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from accounts.models import User
+from foodapibackend.statemachine import VersionedModel
 from restaurant.models import Order
+from .geo import GEOHASH_PRECISION, geohash_encode, parse_coordinates
 import uuid
 
-class Delivery(models.Model):
+# "lat, lng" text field -> (latitude, longitude, geohash or None) columns parsed from it
+LOCATION_COLUMNS = {
+    'pickup_location': ('pickup_latitude', 'pickup_longitude', 'pickup_geohash'),
+    'dropoff_location': ('dropoff_latitude', 'dropoff_longitude', 'dropoff_geohash'),
+    'current_location': ('current_latitude', 'current_longitude', None),
+}
+
+# Terminal statuses whose history delivery.archive moves into DeliveryStatusArchive
+ARCHIVED_STATUSES = ('delivered', 'failed')
+
+class Delivery(VersionedModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('assigned', 'Assigned'),
@@ -14,17 +29,96 @@ class Delivery(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="delivery")
-    delivery_agent = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="deliveries")
+    delivery_agent = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="assigned_deliveries")
     delivery_address = models.TextField()
     pickup_location = models.CharField(max_length=255, null=True, blank=True)  # Geocoded restaurant location
     dropoff_location = models.CharField(max_length=255, null=True, blank=True)  # Geocoded customer address
     current_location = models.CharField(max_length=255, null=True, blank=True)  # Real-time tracking
+    # Parsed from the text locations on save so geo code reads numbers
+    pickup_latitude = models.FloatField(null=True, blank=True, editable=False)
+    pickup_longitude = models.FloatField(null=True, blank=True, editable=False)
+    pickup_geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    dropoff_latitude = models.FloatField(null=True, blank=True, editable=False)
+    dropoff_longitude = models.FloatField(null=True, blank=True, editable=False)
+    dropoff_geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    current_latitude = models.FloatField(null=True, blank=True, editable=False)
+    current_longitude = models.FloatField(null=True, blank=True, editable=False)
     cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Delivery cost
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     delivered_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_agent', 'created_at', 'id'], name='delivery_agent_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the stored status so saves can tell a status change apart from other edits.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.__dict__.get('status')
+
+    def sync_coordinates(self, fields=None):
+        """
+        Parse the text locations (or just ``fields``) into their numeric and
+        geohash columns. Returns the names of the columns it set.
+        """
+        updated = []
+        for field in fields or LOCATION_COLUMNS:
+            lat_field, lng_field, geohash_field = LOCATION_COLUMNS[field]
+            coords = parse_coordinates(getattr(self, field))
+            lat, lng = coords or (None, None)
+            setattr(self, lat_field, lat)
+            setattr(self, lng_field, lng)
+            updated += [lat_field, lng_field]
+            if geohash_field:
+                setattr(self, geohash_field, geohash_encode(lat, lng, GEOHASH_PRECISION) if coords else '')
+                updated.append(geohash_field)
+        return updated
+
+    @property
+    def pickup_coordinates(self):
+        if self.pickup_latitude is None:
+            return None
+        return self.pickup_latitude, self.pickup_longitude
+
+    @property
+    def dropoff_coordinates(self):
+        if self.dropoff_latitude is None:
+            return None
+        return self.dropoff_latitude, self.dropoff_longitude
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None:
+            self.sync_coordinates()
+        else:
+            update_fields = list(update_fields)
+            update_fields += self.sync_coordinates([field for field in update_fields if field in LOCATION_COLUMNS])
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    @property
+    def status_history(self):
+        """
+        Archived status updates followed by the ones still in the hot table.
+        Select ``status_archive`` and prefetch ``status_updates`` to read it without queries.
+        """
+        archived = []
+        # Only completed deliveries are ever archived, so the others skip the lookup
+        if self.status in ARCHIVED_STATUSES:
+            try:
+                archived = self.status_archive.unpack()
+            except ObjectDoesNotExist:
+                pass
+        return archived + list(self.status_updates.all())
+
     def __str__(self):
         return f"Delivery for Order {self.order.id}"
 
@@ -44,10 +138,47 @@ class DeliveryStatusUpdate(models.Model):
     updated_at = models.DateTimeField(auto_now_add=True)
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery', 'updated_at', 'id'], name='status_update_history_idx'),
+        ]
+
     def __str__(self):
         return f"{self.delivery.order.id} - {self.status} at {self.updated_at}"
 
 
+class DeliveryStatusArchive(models.Model):
+    """
+    Status history of a completed delivery, moved out of DeliveryStatusUpdate
+    by ``manage.py archive_status_history``. ``events`` packs one
+    ``[id, status, updated_at, updated_by_id, updated_by_email]`` list per
+    update, oldest first.
+    """
+    delivery = models.OneToOneField(Delivery, on_delete=models.CASCADE, primary_key=True,
+                                    related_name="status_archive")
+    events = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def pack(update_id, status, updated_at, user_id, email):
+        return [update_id.hex, status, updated_at.isoformat(), user_id.hex if user_id else None, email]
+
+    def unpack(self):
+        """
+        The archived updates as unsaved DeliveryStatusUpdate instances, users included.
+        """
+        updates = []
+        for update_id, status, updated_at, user_id, email in self.events:
+            update = DeliveryStatusUpdate(id=uuid.UUID(update_id), delivery_id=self.delivery_id, status=status,
+                                          updated_at=datetime.fromisoformat(updated_at))
+            update.updated_by = User(id=uuid.UUID(user_id), email=email) if user_id else None
+            updates.append(update)
+        return updates
+
+    def __str__(self):
+        return f"Archived history of delivery {self.delivery_id} ({len(self.events)} updates)"
+
+
 class DeliveryAgentLocation(models.Model):
     agent = models.OneToOneField(User, on_delete=models.CASCADE, related_name="location")
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
@@ -56,3 +187,40 @@ class DeliveryAgentLocation(models.Model):
 
     def __str__(self):
         return f"Location of {self.agent.email} - {self.latitude}, {self.longitude}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Domain event written in the same transaction as the change it describes
+    and published afterwards by the outbox relay, in ``id`` order.
+    ``published_at`` stays null until every side effect has been handed off.
+    """
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=100)
+    aggregate_id = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.aggregate_id} #{self.id}"
+
+
+class OutboxRelayLease(models.Model):
+    """
+    Which relay may publish outbox events, until ``expires_at``. One relay
+    at a time keeps each aggregate's events in order (see delivery.outbox).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder} until {self.expires_at}"
@@ -0,0 +1,334 @@
+import heapq
+import logging
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from foodapibackend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'TRANSPORT': 'delivery.notifications.FirebaseTransport',
+    'WINDOW_SECONDS': 0.5,
+    'MAX_BATCH': 500,
+    'MAX_RETRIES': 5,
+    'BACKOFF_SECONDS': 1.0,
+    'BACKOFF_MAX_SECONDS': 60.0,
+}
+
+# FCM error codes worth retrying; anything else is dropped.
+RETRYABLE_ERRORS = {'UNAVAILABLE', 'INTERNAL', 'RESOURCE_EXHAUSTED', 'DEADLINE_EXCEEDED', 'UNKNOWN'}
+# The token is gone for good; the user has to register a new one.
+INVALID_TOKEN_ERRORS = {'UNREGISTERED', 'NOT_FOUND', 'SENDER_ID_MISMATCH'}
+
+PushMessage = namedtuple('PushMessage', ['token', 'title', 'body', 'data'])
+
+
+class PushDeliveryError(Exception):
+    """
+    Some messages of a ``deliver`` call failed with a transient error.
+    """
+
+
+class FirebaseTransport:
+    """
+    Sends a batch through FCM. Messages with the same notification and data
+    go out as one multicast; the rest share a single ``send_each`` call.
+    """
+    max_batch = 500
+
+    def send(self, messages):
+        """
+        Returns one entry per message: None if delivered, else the FCM error code.
+        """
+        from firebase_admin import messaging
+
+        from .utils import get_firebase_app
+
+        app = get_firebase_app()
+        groups = {}
+        for index, message in enumerate(messages):
+            key = (message.title, message.body, tuple(sorted((message.data or {}).items())))
+            groups.setdefault(key, []).append(index)
+
+        results = [None] * len(messages)
+        singles = []
+        for (title, body, data), indexes in groups.items():
+            if len(indexes) == 1:
+                singles.extend(indexes)
+                continue
+            for start in range(0, len(indexes), self.max_batch):
+                chunk = indexes[start:start + self.max_batch]
+                response = messaging.send_each_for_multicast(messaging.MulticastMessage(
+                    tokens=[messages[i].token for i in chunk],
+                    notification=messaging.Notification(title=title, body=body),
+                    data=dict(data) or None,
+                ), app=app)
+                self._collect(results, chunk, response)
+        for start in range(0, len(singles), self.max_batch):
+            chunk = singles[start:start + self.max_batch]
+            response = messaging.send_each([
+                messaging.Message(
+                    token=messages[i].token,
+                    notification=messaging.Notification(title=messages[i].title, body=messages[i].body),
+                    data=messages[i].data or None,
+                )
+                for i in chunk
+            ], app=app)
+            self._collect(results, chunk, response)
+        return results
+
+    @staticmethod
+    def _collect(results, indexes, batch_response):
+        for index, response in zip(indexes, batch_response.responses):
+            if not response.success:
+                results[index] = getattr(response.exception, 'code', None) or 'UNKNOWN'
+
+
+class FakeTransport:
+    """
+    In-memory transport for tests and benchmarks. ``latency`` is paid once
+    per call (like one HTTP round trip), ``errors`` maps a token to the error
+    codes returned on its successive attempts.
+    """
+    max_batch = 500
+
+    def __init__(self, latency=0.0, errors=None):
+        self.latency = latency
+        self.errors = {token: list(codes) for token, codes in (errors or {}).items()}
+        self.calls = []
+        self.delivered = []
+        self._lock = threading.Lock()
+
+    def send(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        with self._lock:
+            self.calls.append(len(messages))
+            for message in messages:
+                codes = self.errors.get(message.token)
+                error = codes.pop(0) if codes else None
+                if error is None:
+                    self.delivered.append(message)
+                results.append(error)
+        return results
+
+
+class NotificationPipeline:
+    """
+    Non-blocking push notification queue.
+
+    ``enqueue`` only appends to an in-memory queue. A worker thread drains it
+    in batches (everything arriving within ``window`` seconds, up to
+    ``max_batch``) and hands each batch to the transport in one call.
+    Messages that fail with a transient error are retried with exponential
+    backoff and jitter, up to ``max_retries`` times; tokens FCM reports as
+    unregistered are cleared from their users.
+    """
+
+    def __init__(self, transport, window=0.5, max_batch=500, max_retries=5, backoff=1.0, backoff_max=60.0):
+        self.transport = transport
+        self.window = window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._queue = queue.Queue()
+        self._retries = []
+        self._retries_lock = threading.Lock()
+        self._sequence = 0
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def enqueue(self, token, title, body, data=None):
+        if not token:
+            metrics.incr('push.skipped')
+            return
+        self._queue.put((PushMessage(token, title, body, data), 0))
+        metrics.incr('push.enqueued')
+
+    def qsize(self):
+        return self._queue.qsize() + len(self._retries)
+
+    def _due_retries(self, limit):
+        now = time.monotonic()
+        due = []
+        with self._retries_lock:
+            while self._retries and self._retries[0][0] <= now and len(due) < limit:
+                due.append(heapq.heappop(self._retries)[2])
+        return due
+
+    def _schedule_retry(self, message, attempts):
+        delay = min(self.backoff * 2 ** (attempts - 1), self.backoff_max) * random.uniform(0.5, 1.0)
+        with self._retries_lock:
+            self._sequence += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, self._sequence, (message, attempts)))
+        metrics.incr('push.retried')
+
+    def collect_batch(self, timeout=None):
+        batch = self._due_retries(self.max_batch)
+        if not batch:
+            try:
+                batch.append(self._queue.get(block=timeout != 0, timeout=timeout or None))
+            except queue.Empty:
+                return []
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(block=remaining > 0, timeout=max(remaining, 0) or None))
+            except queue.Empty:
+                break
+        return batch
+
+    def send(self, batch):
+        if not batch:
+            return 0
+        messages = [message for message, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = self.transport.send(messages)
+        except Exception:
+            logger.exception("Push notification batch failed")
+            results = ['UNAVAILABLE'] * len(messages)
+        elapsed = time.perf_counter() - started
+
+        sent, invalid_tokens = 0, []
+        for (message, attempts), error in zip(batch, results):
+            if error is None:
+                sent += 1
+            elif error in RETRYABLE_ERRORS and attempts < self.max_retries:
+                self._schedule_retry(message, attempts + 1)
+            else:
+                metrics.incr('push.failed')
+                if error in INVALID_TOKEN_ERRORS:
+                    invalid_tokens.append(message.token)
+        if invalid_tokens:
+            self._clear_tokens(invalid_tokens)
+
+        metrics.incr('push.sent', sent)
+        metrics.incr('push.batches')
+        metrics.observe('push.batch_size', len(batch))
+        metrics.observe('push.send_seconds', elapsed)
+        if elapsed > 0:
+            metrics.gauge('push.messages_per_second', len(batch) / elapsed)
+        metrics.gauge('push.queue_depth', self.qsize())
+        return sent
+
+    def deliver(self, messages):
+        """
+        Send ``messages`` now, in the calling thread, bypassing the queue.
+        Transport errors propagate and transient FCM errors raise
+        PushDeliveryError, leaving the retry to the caller; unregistered
+        tokens are cleared and other permanent errors dropped, as in ``send``.
+        """
+        messages = [message for message in messages if message.token]
+        if not messages:
+            return 0
+        results = self.transport.send(messages)
+        transient = [error for error in results if error in RETRYABLE_ERRORS]
+        invalid_tokens = [message.token for message, error in zip(messages, results)
+                          if error in INVALID_TOKEN_ERRORS]
+        if invalid_tokens:
+            self._clear_tokens(invalid_tokens)
+        sent = results.count(None)
+        metrics.incr('push.sent', sent)
+        metrics.incr('push.failed', len(messages) - sent - len(transient))
+        if transient:
+            raise PushDeliveryError(f"{len(transient)} of {len(messages)} messages failed: {sorted(set(transient))}")
+        return sent
+
+    def _clear_tokens(self, tokens):
+        from accounts.models import User
+
+        User.objects.filter(fcm_token__in=tokens).update(fcm_token=None)
+        metrics.incr('push.invalid_tokens', len(tokens))
+
+    def run_once(self, timeout=0):
+        return self.send(self.collect_batch(timeout=timeout))
+
+    def flush(self):
+        """
+        Send everything queued now, ignoring the window (retries wait for their backoff).
+        """
+        sent = 0
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            sent += self.send(batch)
+        return sent
+
+    def run_forever(self, poll_timeout=1.0):
+        while not self._stopping.is_set():
+            try:
+                batch = self.collect_batch(timeout=poll_timeout)
+                if batch:
+                    close_old_connections()
+                    self.send(batch)
+            except Exception:
+                logger.exception("Push notification worker failed")
+                metrics.incr('push.errors')
+        close_old_connections()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='push-notifications', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def notification_settings():
+    return {**DEFAULTS, **getattr(settings, 'PUSH_NOTIFICATIONS', {})}
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_notification_pipeline():
+    """
+    Return the process-wide NotificationPipeline, starting its worker on first use.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            config = notification_settings()
+            _pipeline = NotificationPipeline(
+                import_string(config['TRANSPORT'])(),
+                window=config['WINDOW_SECONDS'],
+                max_batch=config['MAX_BATCH'],
+                max_retries=config['MAX_RETRIES'],
+                backoff=config['BACKOFF_SECONDS'],
+                backoff_max=config['BACKOFF_MAX_SECONDS'],
+            )
+            _pipeline.start()
+        return _pipeline
+
+
+def notify(token, title, body, data=None):
+    get_notification_pipeline().enqueue(token, title, body, data)
+
+
+def deliver(messages):
+    """
+    Send PushMessages synchronously; see ``NotificationPipeline.deliver``.
+    """
+    return get_notification_pipeline().deliver(messages)
@@ -0,0 +1,261 @@
+"""
+Transactional outbox for delivery and order domain events.
+
+``record`` writes an OutboxEvent inside the caller's transaction, so an
+event exists exactly when the change it describes was committed. The
+relay reads pending events in ``id`` order, hands each run of same-topic
+events to its handler and only then marks them published. Handlers send
+synchronously (channel-layer ``group_send``, FCM) rather than through the
+in-memory fan-out and push queues, and raise if anything was not sent.
+Delivery is at-least-once: a crash between sending and marking, or a run
+that failed partway, sends the run again. A failing handler
+stops the batch so later events never overtake it; after MAX_ATTEMPTS
+the event is marked published with its ``last_error`` and left for
+``manage.py replay_outbox``.
+
+Order needs a single publisher: relays with disjoint batches would race
+each other's events for the same delivery. Every relay (one per web
+process, plus any ``run_outbox_relay`` worker) competes for one
+OutboxRelayLease row with a conditional UPDATE, and only the holder
+publishes, renewing the lease each batch. No row locks are taken, so
+handlers do their channel-layer and push I/O outside any transaction.
+A holder that stalls in a handler for longer than ``LEASE_SECONDS``
+loses the lease; its in-flight run can then land after, or twice
+alongside, what the next holder publishes.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from foodapibackend.metrics import metrics
+
+from .models import OutboxEvent, OutboxRelayLease
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'POLL_SECONDS': 1.0,
+    'MAX_ATTEMPTS': 10,
+    'LEASE_SECONDS': 30,
+    'IN_PROCESS_WORKER': True,
+}
+
+LEASE_NAME = 'outbox-relay'
+
+DELIVERY_STATUS_CHANGED = 'delivery.status_changed'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+
+ORDER_STATUS_MESSAGES = {
+    'accepted': ("Order Accepted", "Your order has been accepted!"),
+    'on_the_way': ("On the Way", "Your order is on the way!"),
+    'delivered': ("Delivered", "Your order has been delivered!"),
+    'cancelled': ("Order Cancelled", "Your order has been cancelled."),
+}
+
+
+def outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'DELIVERY_OUTBOX', {})}
+
+
+def record(topic, aggregate_id, payload):
+    """
+    Write one event in the current transaction and wake the relay once it commits.
+    """
+    event = OutboxEvent.objects.create(topic=topic, aggregate_id=str(aggregate_id), payload=payload)
+    transaction.on_commit(wake_relay)
+    return event
+
+
+def record_many(topic, events):
+    """
+    Bulk ``record`` for ``(aggregate_id, payload)`` pairs.
+    """
+    rows = OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic, aggregate_id=str(aggregate_id), payload=payload) for aggregate_id, payload in events
+    ])
+    if rows:
+        transaction.on_commit(wake_relay)
+    return rows
+
+
+def _customer_tokens(order_ids):
+    from restaurant.models import Order
+
+    return dict(Order.objects.filter(pk__in=set(order_ids)).exclude(customer__fcm_token=None)
+                .values_list('pk', 'customer__fcm_token'))
+
+
+def handle_delivery_status_changed(events):
+    from .fanout import get_fanout
+    from .notifications import PushMessage, deliver
+
+    tokens = _customer_tokens(event.payload['order_id'] for event in events)
+    fanout = get_fanout()
+    messages = []
+    for event in events:
+        order_id, status = event.payload['order_id'], event.payload['status']
+        fanout.send_now(order_id, {'status': status})
+        if tokens.get(order_id):
+            messages.append(PushMessage(tokens[order_id], "Delivery Status Update",
+                                        f"Your delivery is now {status.replace('_', ' ').title()}!", None))
+    deliver(messages)
+
+
+def handle_order_status_changed(events):
+    from .notifications import PushMessage, deliver
+
+    tokens = _customer_tokens(event.payload['order_id'] for event in events)
+    messages = []
+    for event in events:
+        message = ORDER_STATUS_MESSAGES.get(event.payload['status'])
+        token = tokens.get(event.payload['order_id'])
+        if message and token:
+            messages.append(PushMessage(token, *message, None))
+    deliver(messages)
+
+
+HANDLERS = {
+    DELIVERY_STATUS_CHANGED: handle_delivery_status_changed,
+    ORDER_STATUS_CHANGED: handle_order_status_changed,
+}
+
+
+class OutboxRelay:
+    """
+    Drains pending outbox events in batches while it holds the relay lease.
+    """
+
+    def __init__(self, batch_size=100, poll_interval=1.0, max_attempts=10, handlers=None, lease_seconds=30):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.handlers = HANDLERS if handlers is None else handlers
+        self.lease_seconds = lease_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+
+    def acquire_lease(self):
+        """
+        Take or renew the relay lease; False while another relay holds it.
+        """
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        if OutboxRelayLease.objects.filter(Q(holder=self.holder) | Q(expires_at__lt=now), name=LEASE_NAME).update(
+                holder=self.holder, expires_at=expires_at):
+            return True
+        try:
+            with transaction.atomic():
+                OutboxRelayLease.objects.create(name=LEASE_NAME, holder=self.holder, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
+
+    def release_lease(self):
+        OutboxRelayLease.objects.filter(name=LEASE_NAME, holder=self.holder).update(expires_at=timezone.now())
+
+    def run_once(self):
+        """
+        Publish one batch; returns the number of events marked published.
+        """
+        if not self.acquire_lease():
+            return 0
+        events = list(OutboxEvent.objects.filter(published_at__isnull=True).order_by('id')[:self.batch_size])
+        published = 0
+        for topic, run in groupby(events, key=lambda event: event.topic):
+            run = list(run)
+            handler = self.handlers.get(topic)
+            try:
+                if handler is None:
+                    raise LookupError(f"No outbox handler for {topic!r}")
+                handler(run)
+            except Exception as exc:
+                logger.exception("Outbox handler for %s failed", topic)
+                self._failed(run, exc)
+                break
+            OutboxEvent.objects.filter(pk__in=[event.pk for event in run]).update(published_at=timezone.now())
+            published += len(run)
+        metrics.incr('outbox.published', published)
+        metrics.observe('outbox.batch_size', len(events))
+        return published
+
+    def _failed(self, events, exc):
+        metrics.incr('outbox.failed')
+        attempts = events[0].attempts + 1
+        fields = {'attempts': attempts, 'last_error': repr(exc)[:1000]}
+        if attempts >= self.max_attempts:
+            fields['published_at'] = timezone.now()
+            metrics.incr('outbox.dead', len(events))
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(**fields)
+
+    def wake(self):
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stopping.is_set():
+            try:
+                close_old_connections()
+                if self.run_once() >= self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Outbox relay failed")
+                metrics.incr('outbox.errors')
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        try:
+            self.release_lease()
+        except Exception:
+            logger.exception("Releasing the outbox relay lease failed")
+        close_old_connections()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='outbox-relay', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_relay = None
+_relay_lock = threading.Lock()
+
+
+def get_outbox_relay():
+    global _relay
+    with _relay_lock:
+        if _relay is None:
+            config = outbox_settings()
+            _relay = OutboxRelay(
+                batch_size=config['BATCH_SIZE'],
+                poll_interval=config['POLL_SECONDS'],
+                max_attempts=config['MAX_ATTEMPTS'],
+                lease_seconds=config['LEASE_SECONDS'],
+            )
+        return _relay
+
+
+def wake_relay():
+    """
+    Nudge the relay after a commit, starting the in-process worker if configured.
+    """
+    if outbox_settings()['IN_PROCESS_WORKER']:
+        relay = get_outbox_relay()
+        relay.start()
+        relay.wake()
@@ -0,0 +1,5 @@
+from foodapibackend.pagination import CreatedAtCursorPagination
+
+
+class StatusHistoryPagination(CreatedAtCursorPagination):
+    timestamp_field = 'updated_at'
@@ -1,6 +1,16 @@
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAuthenticated
 
 
 class IsDeliveryAgent(IsAuthenticated):
     def has_permission(self, request, view):
         return request.user.role == 'delivery_agent'
+
+
+class IsAssignedAgent(IsAuthenticated):
+    def has_object_permission(self, request, view, obj):
+        return obj.delivery_agent_id == request.user.pk
+
+
+class IsAssignedAgentOrStaff(IsAssignedAgent):
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_staff or super().has_object_permission(request, view, obj)
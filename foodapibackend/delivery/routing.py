@@ -1,6 +1,7 @@
 from django.urls import re_path
-from .consumers import DeliveryTrackingConsumer
+from .consumers import AgentLocationConsumer, DeliveryTrackingConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/delivery/(?P<order_id>\w+)/$', DeliveryTrackingConsumer.as_asgi()),
+    re_path(r'ws/agent/location/$', AgentLocationConsumer.as_asgi()),
 ]
@@ -1,28 +1,45 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
+
+from foodapibackend.fieldsets import SparseFieldsetsMixin
 from .models import Delivery, DeliveryStatusUpdate
 from restaurant.models import Order
 from accounts.models import User
+from .geo import parse_coordinates
+from .location_store import buffered_delivery_location, format_location
 
 
-class DeliveryStatusUpdateSerializer(serializers.ModelSerializer):
+class DeliveryStatusUpdateSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Serializer for Delivery Status Updates
     """
 
     updated_by = serializers.StringRelatedField()  # Display the username or email of the user who updated the status
+    select_related_fields = {'updated_by': ['updated_by']}
 
     class Meta:
         model = DeliveryStatusUpdate
         fields = ['id', 'status', 'updated_at', 'updated_by']
 
 
-class DeliverySerializer(serializers.ModelSerializer):
+class DeliverySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Serializer for Delivery
     """
     order_details = serializers.SerializerMethodField()
     delivery_agent_name = serializers.StringRelatedField(source='delivery_agent', read_only=True)
-    status_updates = DeliveryStatusUpdateSerializer(many=True, read_only=True)
+    # Archived updates (see delivery.archive) followed by the hot ones
+    status_updates = DeliveryStatusUpdateSerializer(source='status_history', many=True, read_only=True)
+    select_related_fields = {
+        'order_details': ['order__customer', 'order__restaurant'],
+        'delivery_agent_name': ['delivery_agent'],
+        'status_updates': ['status_archive'],
+    }
+    prefetch_related_fields = {
+        'status_updates': [
+            Prefetch('status_updates', queryset=DeliveryStatusUpdate.objects.select_related('updated_by')),
+        ],
+    }
 
     class Meta:
         model = Delivery
@@ -38,12 +55,24 @@ class DeliverySerializer(serializers.ModelSerializer):
             'current_location',
             'cost',
             'status',
+            'version',  # Send back to update-status to make the change conditional
             'delivered_at',
             'created_at',
             'updated_at',
             'status_updates',  # History of status updates
         ]
-        read_only_fields = ['status_updates', 'created_at', 'updated_at']
+        # Status and agent only change through update-status and the dispatcher (delivery.transitions)
+        read_only_fields = ['delivery_agent', 'status', 'version', 'delivered_at', 'status_updates', 'created_at',
+                            'updated_at']
+        expandable_fields = ['status_updates']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'current_location' in data:
+            buffered = buffered_delivery_location(instance.pk)
+            if buffered:
+                data['current_location'] = format_location(*buffered)
+        return data
 
     def get_order_details(self, obj):
         """
@@ -57,6 +86,27 @@ class DeliverySerializer(serializers.ModelSerializer):
         }
 
 
+class DeliveryListSerializer(DeliverySerializer):
+    """
+    Compact Delivery for lists: no status history (see the status-history endpoint).
+    """
+    status_updates = None
+
+    class Meta(DeliverySerializer.Meta):
+        fields = [
+            'id',
+            'order',
+            'order_details',
+            'delivery_agent',
+            'delivery_agent_name',
+            'delivery_address',
+            'current_location',
+            'status',
+            'created_at',
+            'updated_at',
+        ]
+
+
 class DeliveryCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating deliveries
@@ -65,6 +115,14 @@ class DeliveryCreateSerializer(serializers.ModelSerializer):
         model = Delivery
         fields = ['order', 'delivery_address', 'pickup_location', 'dropoff_location']
 
+    def validate_location(self, value):
+        if value and parse_coordinates(value) is None:
+            raise serializers.ValidationError("Enter the location as \"lat, lng\".")
+        return value
+
+    validate_pickup_location = validate_location
+    validate_dropoff_location = validate_location
+
     def validate(self, data):
         """
         Validate that the order has not already been assigned a delivery.
@@ -1,121 +1,145 @@
-# from django.db.models import Q
-# from django.contrib.gis.geos import Point
-# from django.contrib.gis.db.models.functions import Distance
-# import googlemaps
-# from decimal import Decimal
-# import logging
-# from django.utils import timezone
-# from .models import DeliveryAgentLocation, DeliveryTask
-
-# logger = logging.getLogger(__name__)
-
-# class DeliveryService:
-#     def __init__(self):
-#         self.gmaps = googlemaps.Client(key='YOUR_GOOGLE_MAPS_API_KEY')
-
-#     def calculate_delivery_details(self, pickup_location, delivery_location):
-#         """Calculate distance, duration and fee for delivery."""
-#         try:
-#             # Get route details from Google Maps
-#             directions = self.gmaps.directions(
-#                 pickup_location,
-#                 delivery_location,
-#                 mode="driving"
-#             )
-
-#             if not directions:
-#                 raise ValueError("Could not calculate route")
-
-#             route = directions[0]['legs'][0]
-#             distance_km = route['distance']['value'] / 1000  # Convert meters to km
-#             duration_mins = route['duration']['value'] / 60  # Convert seconds to minutes
-
-#             # Calculate delivery fee
-#             base_fee = Decimal('5.00')
-#             fee_per_km = Decimal('2.00')
-#             delivery_fee = base_fee + (Decimal(str(distance_km)) * fee_per_km)
-
-#             return {
-#                 'distance': round(distance_km, 2),
-#                 'duration': round(duration_mins),
-#                 'fee': round(delivery_fee, 2)
-#             }
-#         except Exception as e:
-#             logger.error(f"Error calculating delivery details: {str(e)}")
-#             raise
-
-#     def find_available_agent(self, pickup_location, max_distance_km=5):
-#         """Find the nearest available delivery agent."""
-#         pickup_point = Point(
-#             float(pickup_location['longitude']), 
-#             float(pickup_location['latitude'])
-#         )
-
-#         # Query for available agents within radius
-#         available_agents = DeliveryAgentLocation.objects.filter(
-#             is_active=True,
-#             agent__availability_status=True,
-#             agent__user__is_active=True
-#         ).annotate(
-#             distance=Distance('longitude', 'latitude', pickup_point)
-#         ).filter(
-#             distance__lte=max_distance_km * 1000  # Convert km to meters
-#         ).order_by('distance')
-
-#         return available_agents.first().agent if available_agents.exists() else None
-
-#     def create_delivery_task(self, order):
-#         """Create a delivery task for an order."""
-#         try:
-#             # Get locations
-#             pickup_location = {
-#                 'latitude': order.restaurant.latitude,
-#                 'longitude': order.restaurant.longitude,
-#                 'address': order.restaurant.address
-#             }
-#             delivery_location = {
-#                 'latitude': order.delivery_latitude,
-#                 'longitude': order.delivery_longitude,
-#                 'address': order.delivery_address
-#             }
-
-#             # Calculate delivery details
-#             delivery_details = self.calculate_delivery_details(
-#                 pickup_location['address'],
-#                 delivery_location['address']
-#             )
-
-#             # Create delivery task
-#             task = DeliveryTask.objects.create(
-#                 order=order,
-#                 pickup_location=pickup_location,
-#                 delivery_location=delivery_location,
-#                 estimated_distance=delivery_details['distance'],
-#                 estimated_duration=delivery_details['duration'],
-#                 delivery_fee=delivery_details['fee']
-#             )
-
-#             # Try to assign an agent
-#             agent = self.find_available_agent(pickup_location)
-#             if agent:
-#                 self.assign_agent(task, agent)
-
-#             return task
-
-#         except Exception as e:
-#             logger.error(f"Error creating delivery task: {str(e)}")
-#             raise
-
-#     def assign_agent(self, task, agent):
-#         """Assign an agent to a delivery task."""
-#         task.agent = agent
-#         task.status = 'assigned'
-#         task.assigned_at = timezone.now()
-#         task.save()
-
-#         # Send notification to agent
-#         Notification.objects.create(
-#             user=agent.user,
-#             message=f"New delivery assignment for order #{task.order.id}",
-#             order=task.order
-#         )
\ No newline at end of file
+import logging
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .assignment import haversine_matrix, solve_assignment
+from .models import Delivery, DeliveryAgentLocation, DeliveryStatusUpdate
+from .outbox import DELIVERY_STATUS_CHANGED, record_many
+from .spatial import get_agent_index
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_DELIVERY_STATUSES = ('assigned', 'in_transit')
+
+
+class BatchDispatchService:
+    """
+    Assign all pending deliveries to free delivery agents in one batch.
+
+    Instead of greedily picking the nearest agent per delivery, a haversine
+    cost matrix (deliveries x agents) is built in one NumPy pass and solved as
+    a minimum-total-distance assignment. Results are written back with a
+    single ``bulk_update``.
+    """
+
+    def __init__(self, max_distance_km=None, delivery_ids=None, candidates_per_delivery=None):
+        self.max_distance_km = max_distance_km
+        self.delivery_ids = delivery_ids
+        self.candidates_per_delivery = candidates_per_delivery
+
+    def pending_deliveries(self):
+        deliveries = Delivery.objects.select_for_update(skip_locked=True).filter(
+            status='pending',
+            delivery_agent__isnull=True,
+        )
+        if self.delivery_ids is not None:
+            deliveries = deliveries.filter(id__in=self.delivery_ids)
+        return deliveries.only('id', 'order', 'pickup_latitude', 'pickup_longitude', 'status', 'version',
+                               'delivery_agent')
+
+    def busy_agents(self):
+        return Delivery.objects.filter(
+            status__in=ACTIVE_DELIVERY_STATUSES,
+            delivery_agent__isnull=False,
+        ).values_list('delivery_agent', flat=True)
+
+    def free_agents(self, located):
+        """
+        Return ``(agent_id, lat, lng)`` tuples for agents without an active delivery.
+
+        With ``candidates_per_delivery`` set, only the nearest free agents of each
+        delivery (looked up in the agent spatial index) are considered, which keeps
+        the cost matrix small for micro-batches.
+        """
+        if self.candidates_per_delivery is None:
+            return list(DeliveryAgentLocation.objects.filter(
+                agent__role='delivery_agent',
+                agent__is_active=True,
+            ).exclude(agent__in=self.busy_agents()).values_list('agent_id', 'latitude', 'longitude'))
+
+        index = get_agent_index()
+        busy = set(self.busy_agents())
+        agents = {}
+        for _, (lat, lng) in located:
+            for _, agent_id in index.nearest_agents(
+                lat, lng,
+                k=self.candidates_per_delivery,
+                max_radius_km=self.max_distance_km,
+                exclude=busy,
+            ):
+                agents[agent_id] = index.get(agent_id)
+        return [(agent_id, lat, lng) for agent_id, (lat, lng) in agents.items()]
+
+    def locate(self, deliveries):
+        """
+        Pair each delivery with its pickup coordinates, skipping those without any.
+        """
+        return [(delivery, delivery.pickup_coordinates) for delivery in deliveries if delivery.pickup_coordinates]
+
+    def solve(self, located, agents):
+        """
+        Match ``located`` deliveries to ``agents`` (``(agent_id, lat, lng)`` tuples).
+        Returns ``(delivery, agent_id, km)`` tuples.
+        """
+        if not located or not agents:
+            return []
+        cost = haversine_matrix(
+            [coords for _, coords in located],
+            [(float(lat), float(lng)) for _, lat, lng in agents],
+        )
+        return [
+            (located[row][0], agents[col][0], distance)
+            for row, col, distance in solve_assignment(cost, max_cost=self.max_distance_km)
+        ]
+
+    def run(self, user=None):
+        """
+        Collect, solve and persist one dispatch batch. Returns a summary dict.
+        """
+        started = time.perf_counter()
+        with transaction.atomic():
+            deliveries = list(self.pending_deliveries())
+            located = self.locate(deliveries)
+            agents = self.free_agents(located) if located else []
+            solve_started = time.perf_counter()
+            matches = self.solve(located, agents)
+            solve_seconds = time.perf_counter() - solve_started
+
+            updated_at = timezone.now()
+            assigned = []
+            for delivery, agent_id, _ in matches:
+                delivery.delivery_agent_id = agent_id
+                delivery.status = 'assigned'
+                # Rows are locked, so no conditional update is needed; the bump still fails stale writers
+                delivery.version += 1
+                delivery.updated_at = updated_at
+                assigned.append(delivery)
+            if assigned:
+                Delivery.objects.bulk_update(assigned, ['delivery_agent', 'status', 'version', 'updated_at'])
+                DeliveryStatusUpdate.objects.bulk_create([
+                    DeliveryStatusUpdate(delivery=delivery, status='assigned', updated_by=user)
+                    for delivery in assigned
+                ])
+                # bulk_update skips post_save, so record the status events here
+                record_many(DELIVERY_STATUS_CHANGED, [
+                    (delivery.pk, {'delivery_id': str(delivery.pk), 'order_id': delivery.order_id,
+                                   'status': 'assigned', 'previous_status': 'pending'})
+                    for delivery in assigned
+                ])
+
+        result = {
+            'pending': len(deliveries),
+            'agents': len(agents),
+            'assigned': len(assigned),
+            'total_distance_km': round(sum(distance for _, _, distance in matches), 3),
+            'solve_seconds': solve_seconds,
+            'total_seconds': time.perf_counter() - started,
+        }
+        logger.info("Batch dispatch: %s", result)
+        assigned_ids = {delivery.pk for delivery in assigned}
+        result['unassigned_ids'] = [str(delivery.pk) for delivery in deliveries if delivery.pk not in assigned_ids]
+        # No pickup coordinates: no agent can ever be matched until the delivery is edited
+        result['unlocated_ids'] = [str(delivery.pk) for delivery in deliveries if not delivery.pickup_coordinates]
+        return result
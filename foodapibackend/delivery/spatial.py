@@ -0,0 +1,271 @@
+import heapq
+import math
+import threading
+import time
+
+from geopy.distance import geodesic
+
+from .geo import KM_PER_DEGREE_LAT, haversine
+
+# Haversine (spherical) and geodesic (WGS-84) distances differ by at most ~0.56%.
+# Candidates are refined with the exact geodesic only inside this margin.
+HAVERSINE_MARGIN = 0.006
+
+
+class GridIndex:
+    """
+    In-memory grid-bucket index of points keyed by an arbitrary id.
+
+    Points are bucketed into square cells of ``cell_size_km`` so radius and
+    k-nearest queries only visit the cells around the query point. Distances
+    are prefiltered with haversine and, when ``exact=True``, the surviving
+    candidates are refined with geopy's geodesic.
+    """
+
+    def __init__(self, cell_size_km=1.0):
+        self.cell_size_km = cell_size_km
+        self.cell_deg = cell_size_km / KM_PER_DEGREE_LAT
+        self._cells = {}
+        self._items = {}
+        self._bounds = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def get(self, item_id):
+        entry = self._items.get(item_id)
+        return entry[:2] if entry else None
+
+    def clear(self):
+        self._cells = {}
+        self._items = {}
+        self._bounds = None
+
+    def insert(self, item_id, lat, lng):
+        """
+        Add a point, or move it if ``item_id`` is already indexed.
+        """
+        lat, lng = float(lat), float(lng)
+        cell = self._cell(lat, lng)
+        previous = self._items.get(item_id)
+        if previous and previous[2] != cell:
+            self._discard(item_id, previous[2])
+        self._cells.setdefault(cell, {})[item_id] = (lat, lng)
+        self._items[item_id] = (lat, lng, cell)
+
+        row, col = cell
+        if self._bounds is None:
+            self._bounds = [row, row, col, col]
+        else:
+            bounds = self._bounds
+            bounds[0], bounds[1] = min(bounds[0], row), max(bounds[1], row)
+            bounds[2], bounds[3] = min(bounds[2], col), max(bounds[3], col)
+
+    def remove(self, item_id):
+        entry = self._items.pop(item_id, None)
+        if entry:
+            self._discard(item_id, entry[2])
+
+    def _discard(self, item_id, cell):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(item_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _scan(self, cells, lat, lng, out, exclude=()):
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if bucket:
+                for item_id, (plat, plng) in bucket.items():
+                    if item_id not in exclude:
+                        out.append((haversine(lat, lng, plat, plng), item_id))
+
+    def _refine(self, lat, lng, candidates):
+        origin = (lat, lng)
+        refined = []
+        for _, item_id in candidates:
+            plat, plng = self._items[item_id][:2]
+            refined.append((geodesic(origin, (plat, plng)).km, item_id))
+        refined.sort()
+        return refined
+
+    def _lng_scale(self, lat_deg):
+        return KM_PER_DEGREE_LAT * max(math.cos(math.radians(min(abs(lat_deg), 89.9))), 1e-6)
+
+    def within(self, lat, lng, radius_km, exact=False):
+        """
+        Return ``(distance_km, item_id)`` pairs within ``radius_km``, nearest first.
+        """
+        lat, lng = float(lat), float(lng)
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        dlng = radius_km / self._lng_scale(max(abs(lat - dlat), abs(lat + dlat)))
+        row_min, col_min = self._cell(lat - dlat, lng - dlng)
+        row_max, col_max = self._cell(lat + dlat, lng + dlng)
+
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self._cells):
+            cells = [
+                (row, col) for row, col in self._cells
+                if row_min <= row <= row_max and col_min <= col <= col_max
+            ]
+        else:
+            cells = [
+                (row, col)
+                for row in range(row_min, row_max + 1)
+                for col in range(col_min, col_max + 1)
+            ]
+
+        candidates = []
+        self._scan(cells, lat, lng, candidates)
+        if exact:
+            limit = radius_km * (1 + HAVERSINE_MARGIN)
+            refined = self._refine(lat, lng, [c for c in candidates if c[0] <= limit])
+            return [c for c in refined if c[0] <= radius_km]
+        candidates = [c for c in candidates if c[0] <= radius_km]
+        candidates.sort()
+        return candidates
+
+    def _covered_km(self, lat, lng, row0, col0, ring):
+        """
+        Distance from the query point to the edge of the scanned square of cells;
+        nothing outside the square can be closer than this.
+        """
+        south = (row0 - ring) * self.cell_deg
+        north = (row0 + ring + 1) * self.cell_deg
+        west = (col0 - ring) * self.cell_deg
+        east = (col0 + ring + 1) * self.cell_deg
+        lat_km = min(lat - south, north - lat) * KM_PER_DEGREE_LAT
+        lng_km = min(lng - west, east - lng) * self._lng_scale(max(abs(south), abs(north)))
+        return min(lat_km, lng_km)
+
+    def _ring_cells(self, row0, col0, ring):
+        if ring == 0:
+            return [(row0, col0)]
+        cells = []
+        for col in range(col0 - ring, col0 + ring + 1):
+            cells.append((row0 - ring, col))
+            cells.append((row0 + ring, col))
+        for row in range(row0 - ring + 1, row0 + ring):
+            cells.append((row, col0 - ring))
+            cells.append((row, col0 + ring))
+        return cells
+
+    def nearest(self, lat, lng, k=1, max_radius_km=None, exact=True, exclude=()):
+        """
+        Return up to ``k`` ``(distance_km, item_id)`` pairs, nearest first,
+        ignoring ids in ``exclude``.
+
+        Rings of cells are scanned outwards from the query cell and the search
+        stops as soon as the k-th best candidate is provably closer than any
+        point outside the scanned area.
+        """
+        if not self._items or k <= 0:
+            return []
+        lat, lng = float(lat), float(lng)
+        margin = 1 + HAVERSINE_MARGIN if exact else 1
+        row0, col0 = self._cell(lat, lng)
+        row_lo, row_hi, col_lo, col_hi = self._bounds
+        max_ring = max(row0 - row_lo, row_hi - row0, col0 - col_lo, col_hi - col0, 0)
+
+        candidates = []
+        for ring in range(max_ring + 1):
+            if 8 * ring > len(self._cells):
+                # Sparse tail: cheaper to visit every remaining occupied cell.
+                self._scan(
+                    [c for c in self._cells if max(abs(c[0] - row0), abs(c[1] - col0)) >= ring],
+                    lat, lng, candidates, exclude,
+                )
+                break
+            self._scan(self._ring_cells(row0, col0, ring), lat, lng, candidates, exclude)
+            covered = self._covered_km(lat, lng, row0, col0, ring)
+            if max_radius_km is not None and covered >= max_radius_km * margin:
+                break
+            if len(candidates) >= k and heapq.nsmallest(k, candidates)[-1][0] * margin <= covered:
+                break
+
+        if max_radius_km is not None:
+            candidates = [c for c in candidates if c[0] <= max_radius_km * margin]
+        best = heapq.nsmallest(k, candidates)
+        if not best:
+            return []
+        if not exact:
+            return best
+        limit = best[-1][0] * margin
+        refined = self._refine(lat, lng, [c for c in candidates if c[0] <= limit])
+        if max_radius_km is not None:
+            refined = [c for c in refined if c[0] <= max_radius_km]
+        return refined[:k]
+
+
+class AgentLocationIndex(GridIndex):
+    """
+    Process-local GridIndex over DeliveryAgentLocation for active delivery agents.
+
+    The index is rebuilt from the database at most every ``refresh_interval``
+    seconds; location writes push individual moves in between via ``update``.
+    Searches hold the same lock as moves, since a move reshapes the buckets
+    a search is iterating.
+    """
+
+    def __init__(self, cell_size_km=1.0, refresh_interval=60):
+        super().__init__(cell_size_km)
+        self.refresh_interval = refresh_interval
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        from .models import DeliveryAgentLocation
+
+        rows = DeliveryAgentLocation.objects.filter(
+            agent__role='delivery_agent',
+            agent__is_active=True,
+        ).values_list('agent_id', 'latitude', 'longitude')
+
+        fresh = GridIndex(self.cell_size_km)
+        for agent_id, lat, lng in rows.iterator():
+            fresh.insert(agent_id, lat, lng)
+        with self._lock:
+            self._cells, self._items, self._bounds = fresh._cells, fresh._items, fresh._bounds
+            self._loaded_at = time.monotonic()
+
+    def update(self, agent_id, lat, lng):
+        with self._lock:
+            self.insert(agent_id, lat, lng)
+
+    def discard(self, agent_id):
+        with self._lock:
+            self.remove(agent_id)
+
+    def nearest_agents(self, lat, lng, k=1, max_radius_km=None, exclude=()):
+        """
+        Return up to ``k`` ``(distance_km, agent_id)`` pairs, skipping ``exclude``.
+        """
+        self.refresh()
+        with self._lock:
+            return self.nearest(lat, lng, k=k, max_radius_km=max_radius_km, exclude=exclude)
+
+
+_agent_index = None
+
+
+def get_agent_index():
+    """
+    Return the process-wide AgentLocationIndex, configured from settings.
+    """
+    global _agent_index
+    if _agent_index is None:
+        from django.conf import settings
+
+        _agent_index = AgentLocationIndex(
+            cell_size_km=getattr(settings, 'DELIVERY_AGENT_INDEX_CELL_KM', 1.0),
+            refresh_interval=getattr(settings, 'DELIVERY_AGENT_INDEX_REFRESH_SECONDS', 60),
+        )
+    return _agent_index
@@ -1,6 +1,7 @@
 from celery import shared_task
-from .utils import send_push_notification
+from .notifications import notify
 
 @shared_task
 def push_notification(token, title, body):
-    send_push_notification(token, title, body)
+    # Batched with every other message queued in this worker process
+    notify(token, title, body)
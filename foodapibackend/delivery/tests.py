@@ -1,3 +1,829 @@
-from django.test import TestCase
+import random
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from foodapibackend.metrics import metrics
+from foodapibackend.statemachine import InvalidTransition, TransitionConflict
+from foodapibackend.testing import QueryBudgetTestCase, full_scans, seed_marketplace
+from restaurant.models import Order
+from restaurant.transitions import transition_order
+
+from .archive import StatusHistoryArchiver
+from .dispatcher import Dispatcher, LocalDispatchQueue
+from .distance import HaversineProvider, RouteCache, build_distance_provider, get_distance_provider
+from .fanout import TrackingFanout
+from .geo import geohash_decode, geohash_encode, haversine
+from .location_store import LocationStore
+from .models import Delivery, DeliveryAgentLocation, DeliveryStatusArchive, DeliveryStatusUpdate, OutboxEvent
+from .notifications import FakeTransport, NotificationPipeline
+from .outbox import DELIVERY_STATUS_CHANGED, ORDER_STATUS_CHANGED, OutboxRelay
+from .routing import websocket_urlpatterns
+from .services import BatchDispatchService
+from .spatial import AgentLocationIndex, GridIndex
+from .transitions import transition_delivery
+from .views import DeliveryViewSet
+
+
+class DeliveryQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Query budgets for the delivery endpoints. Authentication hits the warm user cache.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace()
+        cls.customer = cls.data.customers[0]
+        cls.owner = cls.data.restaurant.user
+        cls.agent = cls.data.agents[0]
+        cls.delivery = Delivery.objects.filter(delivery_agent=cls.agent).first()
+
+    def url(self, suffix=''):
+        return f'/api/v1/deliveries/{self.delivery.pk}/{suffix}'
+
+    def test_list(self):
+        for user in (self.customer, self.owner, self.agent):
+            response = self.request('get', '/api/v1/deliveries/', queries=1, user=user, explain=True)
+            self.assertNotIn('status_updates', response.data['results'][0])
+
+    def test_list_deep_page_costs_the_same(self):
+        url = '/api/v1/deliveries/?page_size=5'
+        for _ in range(4):
+            url = self.request('get', url, queries=1, user=self.agent, explain=True).data['next']
+
+    def test_retrieve(self):
+        self.request('get', self.url(), queries=2, user=self.agent, explain=True)
+
+    def test_status_history(self):
+        url = self.url('status-history/?page_size=1')
+        first = self.request('get', url, queries=2, user=self.agent, explain=True).data
+        second = self.request('get', first['next'], queries=2, user=self.agent, explain=True).data
+        self.assertCountEqual([first['results'][0]['status'], second['results'][0]['status']], ['assigned', 'pending'])
+        self.assertIsNone(second['next'])
+
+    def test_create(self):
+        order = Order.objects.create(customer=self.customer, restaurant=self.data.restaurant, total_price=100)
+        self.request('post', '/api/v1/deliveries/', queries=7, user=self.customer, status=201, data={
+            'order': order.pk, 'delivery_address': 'Kenyatta Avenue',
+        })
+
+    def test_update_status(self):
+        # Includes the SAVEPOINT/RELEASE pair the test transaction turns the atomic block into
+        response = self.request('post', self.url('update-status/'), queries=6, user=self.agent,
+                                data={'status': 'in_transit'})
+        self.assertEqual(response.data['version'], 1)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.payload['status'], 'in_transit')
+        self.assertEqual(event.payload['order_id'], self.delivery.order_id)
+
+    def test_update_status_persists_the_last_buffered_position(self):
+        self.request('post', self.url('update-location/'), queries=1, user=self.agent,
+                     data={'latitude': -1.31, 'longitude': 36.81})
+        # The scoped flush (savepoint, delivery row, agent lookup and row, release) comes before the transition
+        self.request('post', self.url('update-status/'), queries=11, user=self.agent, data={'status': 'in_transit'})
+        self.assertEqual(Delivery.objects.values_list('status', 'current_latitude', 'current_longitude')
+                         .get(pk=self.delivery.pk), ('in_transit', -1.31, 36.81))
+        location = DeliveryAgentLocation.objects.get(agent=self.agent)
+        self.assertEqual((float(location.latitude), float(location.longitude)), (-1.31, 36.81))
+
+    def test_update_status_rejects_invalid_and_stale_transitions(self):
+        self.request('post', self.url('update-status/'), queries=1, user=self.agent, data={'status': 'delivered'},
+                     status=400)
+        # The failed UPDATE rolls back to its savepoint, then the current status is read for the 409
+        response = self.request('post', self.url('update-status/'), queries=6, user=self.agent,
+                                data={'status': 'in_transit', 'version': 7}, status=409)
+        self.assertEqual((response.data['status'], response.data['version']), ('assigned', 0))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_only_the_assigned_agent_or_staff_change_status(self):
+        customer = self.delivery.order.customer
+        for user in (customer, self.owner):
+            self.request('post', self.url('update-status/'), queries=1, user=user, data={'status': 'in_transit'},
+                         status=403)
+        # A PATCH leaves the status, agent and version alone
+        response = self.request('patch', self.url(), queries=11, user=customer, data={
+            'status': 'delivered', 'delivery_agent': None, 'version': 9, 'delivery_address': 'Moi Avenue',
+        })
+        self.assertEqual((response.data['status'], response.data['delivery_agent']), ('assigned', self.agent.pk))
+        self.assertEqual(Delivery.objects.values_list('status', 'delivery_address').get(pk=self.delivery.pk),
+                         ('assigned', 'Moi Avenue'))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        staff = User.objects.create(email='staff@example.com', role='customer', is_staff=True)
+        self.request('post', self.url('update-status/'), queries=6, user=staff, data={'status': 'in_transit'})
+
+    def test_stale_patch_is_a_conflict(self):
+        stale = Delivery.objects.get(pk=self.delivery.pk)
+        transition_delivery(Delivery.objects.get(pk=self.delivery.pk), 'in_transit')
+        with mock.patch.object(DeliveryViewSet, 'get_object', return_value=stale):
+            response = self.request('patch', self.url(), queries=6, user=self.agent,
+                                    data={'delivery_address': 'Moi Avenue'}, status=409)
+        self.assertEqual((response.data['status'], response.data['version']), ('in_transit', 1))
+
+    def test_update_location(self):
+        self.request('post', self.url('update-location/'), queries=1, user=self.agent,
+                     data={'latitude': -1.29, 'longitude': 36.82})
+        for user in (self.delivery.order.customer, self.owner):
+            self.request('post', self.url('update-location/'), queries=1, user=user,
+                         data={'latitude': -1.30, 'longitude': 36.83}, status=403)
+
+    def test_track(self):
+        self.request('get', self.url('track/'), queries=1, user=self.delivery.order.customer)
+
+    def test_estimate_cost(self):
+        response = self.request('get', self.url('estimate-cost/'), queries=1, user=self.delivery.order.customer)
+        self.assertAlmostEqual(response.data['distance'], 1.12, delta=0.2)
+
+    @override_settings(DELIVERY_DISTANCE={'PROVIDER': 'delivery.tests.CountingRoutingProvider',
+                                          'OPTIONS': {'speed_kmh': 20}})
+    def test_estimate_cost_through_the_route_cache(self):
+        CountingRoutingProvider.calls = 0
+        metrics.reset()
+        with mock.patch('delivery.distance._provider', None):
+            self.assertIsInstance(get_distance_provider(), RouteCache)
+            quotes = [self.request('get', self.url('estimate-cost/'), queries=1, user=self.delivery.order.customer)
+                      for _ in range(3)]
+        self.assertEqual(CountingRoutingProvider.calls, 1)
+        self.assertEqual((metrics.counter('distance.cache.miss'), metrics.counter('distance.cache.hit')), (1, 2))
+        self.assertEqual({quote.data['distance'] for quote in quotes}, {quotes[0].data['distance']})
+        self.assertAlmostEqual(quotes[0].data['distance'], 1.3 * 1.12, delta=0.3)
+
+    def test_create_rejects_unparsable_location(self):
+        order = Order.objects.create(customer=self.customer, restaurant=self.data.restaurant, total_price=100)
+        response = self.request('post', '/api/v1/deliveries/', queries=2, user=self.customer, status=400, data={
+            'order': order.pk, 'delivery_address': 'Kenyatta Avenue', 'dropoff_location': 'Kenyatta Avenue',
+        })
+        self.assertIn('dropoff_location', response.data)
+
+    def test_plan_check_detects_full_scans(self):
+        unindexed = str(Delivery.objects.filter(cost__isnull=True).query)
+        self.assertEqual([table for table, _ in full_scans([unindexed])], ['delivery_delivery'])
+
+    def test_list_sparse_fields(self):
+        response = self.request('get', '/api/v1/deliveries/?fields=id,status', queries=1, user=self.agent, explain=True)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status'})
+
+    def test_retrieve_without_history(self):
+        response = self.request('get', self.url('?fields=id,order_details'), queries=1, user=self.agent)
+        self.assertEqual(set(response.data), {'id', 'order_details'})
+
+
+class NotificationPipelineTests(TestCase):
+    """
+    Batching, retries and token cleanup of the push notification pipeline.
+    """
+
+    def pipeline(self, **kwargs):
+        self.transport = FakeTransport(errors=kwargs.pop('errors', None))
+        return NotificationPipeline(self.transport, window=0, backoff=0, **kwargs)
+
+    def test_messages_are_sent_in_batches(self):
+        pipeline = self.pipeline(max_batch=4)
+        for i in range(10):
+            pipeline.enqueue(f'token-{i}', 'Title', 'Body')
+        pipeline.enqueue(None, 'Title', 'Body')
+        self.assertEqual(pipeline.flush(), 10)
+        self.assertEqual(self.transport.calls, [4, 4, 2])
+
+    def test_transient_errors_are_retried(self):
+        pipeline = self.pipeline(errors={'flaky': ['UNAVAILABLE', 'INTERNAL']})
+        pipeline.enqueue('flaky', 'Title', 'Body')
+        sent = [pipeline.run_once() for _ in range(3)]
+        self.assertEqual(sent, [0, 0, 1])
+        self.assertEqual(pipeline.qsize(), 0)
+
+    def test_retries_stop_after_max_retries(self):
+        pipeline = self.pipeline(max_retries=1, errors={'down': ['UNAVAILABLE'] * 5})
+        pipeline.enqueue('down', 'Title', 'Body')
+        self.assertEqual([pipeline.run_once() for _ in range(3)], [0, 0, 0])
+        self.assertEqual(self.transport.calls, [1, 1])
+
+    def test_unregistered_tokens_are_cleared(self):
+        user = User.objects.create(email='stale@example.com', role='customer', fcm_token='stale')
+        pipeline = self.pipeline(errors={'stale': ['UNREGISTERED']})
+        pipeline.enqueue('stale', 'Title', 'Body')
+        pipeline.flush()
+        user.refresh_from_db()
+        self.assertIsNone(user.fcm_token)
+        self.assertEqual(pipeline.qsize(), 0)
+
+
+class OutboxRelayTests(TestCase):
+    """
+    Events are written with the change and published in order by the relay.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=2, orders_per_customer=2, agents=2)
+        User.objects.filter(pk=cls.data.customers[0].pk).update(fcm_token='customer-token')
+
+    def test_status_changes_are_recorded(self):
+        delivery = Delivery.objects.get(pk=self.data.deliveries[0].pk)
+        delivery.cost = 10
+        delivery.save()
+        delivery.status = 'in_transit'
+        delivery.save()
+        order = Order.objects.get(pk=delivery.order_id)
+        order.status = 'accepted'
+        order.save()
+        self.assertEqual(list(OutboxEvent.objects.order_by('id').values_list('topic', 'payload__status')),
+                         [(DELIVERY_STATUS_CHANGED, 'in_transit'), (ORDER_STATUS_CHANGED, 'accepted')])
+
+    def test_refresh_resyncs_the_previous_status(self):
+        delivery = Delivery.objects.get(pk=self.data.deliveries[0].pk)
+        order = Order.objects.get(pk=delivery.order_id)
+        transition_delivery(Delivery.objects.get(pk=delivery.pk), 'in_transit')
+        transition_order(Order.objects.get(pk=order.pk), 'accepted')
+        OutboxEvent.objects.all().delete()
+        for instance, status in ((delivery, 'delivered'), (order, 'preparing')):
+            instance.refresh_from_db()
+            instance.status = status
+            instance.save()
+        self.assertEqual(list(OutboxEvent.objects.order_by('id').values_list('payload__previous_status', flat=True)),
+                         ['in_transit', 'accepted'])
+
+    def transports(self, errors=None, layer_error=None):
+        """
+        Patch the process fan-out and push pipeline with a recording channel layer and FakeTransport.
+        """
+        layer = mock.Mock(group_send=mock.AsyncMock(side_effect=layer_error))
+        transport = FakeTransport(errors=errors)
+        for target, value in (('delivery.fanout._fanout', TrackingFanout(window=0, channel_layer=layer)),
+                              ('delivery.notifications._pipeline', NotificationPipeline(transport, window=0))):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return layer, transport
+
+    def test_relay_publishes_in_order(self):
+        layer, transport = self.transports()
+        for status in ('in_transit', 'delivered'):
+            delivery = Delivery.objects.get(pk=self.data.deliveries[0].pk)
+            delivery.status = status
+            delivery.save()
+        order = self.data.deliveries[0].order
+        relay = OutboxRelay()
+        relay.acquire_lease()
+        # Renew the lease, read the batch, look up push tokens, mark published; no transaction or row locks
+        with self.assertNumQueries(4):
+            self.assertEqual(relay.run_once(), 2)
+        self.assertEqual([(call.args[0], call.args[1]['data']['status']) for call in layer.group_send.call_args_list],
+                         [(f'delivery_{order.pk}', 'in_transit'), (f'delivery_{order.pk}', 'delivered')])
+        self.assertEqual([message.token for message in transport.delivered], ['customer-token'] * 2)
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        self.assertEqual(relay.run_once(), 0)
+
+    def test_events_stay_pending_until_sent(self):
+        transition_delivery(Delivery.objects.get(pk=self.data.deliveries[0].pk), 'in_transit')
+        relay = OutboxRelay()
+        for failure in ({'layer_error': OSError('channel layer down')},
+                        {'errors': {'customer-token': ['UNAVAILABLE']}}):
+            with self.subTest(**failure):
+                self.transports(**failure)
+                self.assertEqual(relay.run_once(), 0)
+                self.assertTrue(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        # Both transports work again: the event is sent and only then marked
+        _, transport = self.transports()
+        self.assertEqual(relay.run_once(), 1)
+        self.assertEqual([message.token for message in transport.delivered], ['customer-token'])
+        self.assertEqual(OutboxEvent.objects.get().attempts, 2)
+
+    def test_only_the_lease_holder_publishes(self):
+        handler = mock.Mock()
+        first, second = (OutboxRelay(handlers={DELIVERY_STATUS_CHANGED: handler}, lease_seconds=30)
+                         for _ in range(2))
+        for status in ('in_transit', 'delivered'):
+            transition_delivery(Delivery.objects.get(pk=self.data.deliveries[0].pk), status)
+        self.assertEqual(first.run_once(), 2)
+        transition_delivery(Delivery.objects.get(pk=self.data.deliveries[1].pk), 'in_transit')
+        self.assertEqual(second.run_once(), 0)
+        # A stopped or stalled holder's lease runs out and another relay takes over
+        first.release_lease()
+        self.assertEqual(second.run_once(), 1)
+        self.assertEqual(first.run_once(), 0)
+        self.assertEqual(handler.call_count, 2)
+
+    def test_failing_handler_blocks_later_events(self):
+        OutboxEvent.objects.create(topic='first', aggregate_id='1')
+        OutboxEvent.objects.create(topic='second', aggregate_id='1')
+        handled = []
+        relay = OutboxRelay(max_attempts=2, handlers={
+            'first': mock.Mock(side_effect=RuntimeError('down')),
+            'second': lambda events: handled.extend(events),
+        })
+        self.assertEqual([relay.run_once() for _ in range(2)], [0, 0])
+        self.assertEqual(handled, [])
+        self.assertEqual(relay.run_once(), 1)
+        first = OutboxEvent.objects.get(topic='first')
+        self.assertEqual((first.attempts, first.last_error), (2, "RuntimeError('down')"))
+        self.assertIsNotNone(first.published_at)
+
+
+class StatusTransitionTests(TestCase):
+    """
+    Transitions are conditional on the status and version they were based on.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=1, orders_per_customer=1, agents=1)
+        cls.delivery = cls.data.deliveries[0]
+
+    def test_lost_race_is_a_conflict(self):
+        first, second = Delivery.objects.get(pk=self.delivery.pk), Delivery.objects.get(pk=self.delivery.pk)
+        transition_delivery(first, 'in_transit')
+        with self.assertRaises(TransitionConflict):
+            transition_delivery(second, 'failed')
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertEqual((delivery.status, delivery.version), ('in_transit', 1))
+        self.assertEqual(DeliveryStatusUpdate.objects.filter(delivery=delivery, status__in=['in_transit', 'failed'])
+                         .count(), 1)
+        transition_delivery(first, 'delivered')
+        self.assertIsNotNone(Delivery.objects.get(pk=self.delivery.pk).delivered_at)
+
+    def test_stale_save_cannot_undo_a_transition(self):
+        stale = Delivery.objects.get(pk=self.delivery.pk)
+        transition_delivery(Delivery.objects.get(pk=self.delivery.pk), 'in_transit')
+        stale.cost = 5
+        with self.assertRaises(TransitionConflict):
+            stale.save()
+        # Saves that leave the status out are not version checked
+        stale.save(update_fields=['cost'])
+        self.assertEqual(Delivery.objects.values_list('status', 'cost').get(pk=self.delivery.pk), ('in_transit', 5))
+
+    def test_refresh_resyncs_the_version(self):
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        transition_delivery(Delivery.objects.get(pk=self.delivery.pk), 'in_transit')
+        delivery.refresh_from_db()
+        delivery.cost = 5
+        delivery.save()
+        self.assertEqual(Delivery.objects.values_list('status', 'version').get(pk=self.delivery.pk),
+                         ('in_transit', 2))
+
+    def test_order_transitions(self):
+        order = Order.objects.get(pk=self.delivery.order_id)
+        with self.assertRaises(InvalidTransition):
+            transition_order(order, 'delivered')
+        transition_order(order, 'accepted')
+        self.assertEqual(Order.objects.values_list('status', 'version').get(pk=order.pk), ('accepted', 1))
+        self.assertEqual(OutboxEvent.objects.get().payload,
+                         {'order_id': order.pk, 'status': 'accepted', 'previous_status': 'pending'})
+
+
+class StatusHistoryArchiveTests(QueryBudgetTestCase):
+    """
+    Completed deliveries' history moves to one archive row and still reads the same.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=1, orders_per_customer=2, agents=1)
+        cls.agent = cls.data.agents[0]
+        cls.done, cls.active = (Delivery.objects.get(pk=delivery.pk) for delivery in cls.data.deliveries[:2])
+        transition_delivery(cls.done, 'in_transit', user=cls.agent)
+        transition_delivery(cls.done, 'delivered', user=cls.agent)
+        cls.later = timezone.now() + timedelta(days=31)
+
+    def history(self, delivery, queries=2):
+        url = f'/api/v1/deliveries/{delivery.pk}/status-history/?page_size=2'
+        statuses = []
+        while url:
+            data = self.request('get', url, queries=queries, user=self.agent).data
+            statuses += [update['status'] for update in data['results']]
+            url = data['next']
+        return statuses
+
+    def test_archive_moves_completed_history(self):
+        before = self.history(self.done)
+        self.assertEqual(StatusHistoryArchiver(batch_size=1).run(now=self.later), 1)
+        self.assertFalse(DeliveryStatusUpdate.objects.filter(delivery=self.done).exists())
+        self.assertTrue(DeliveryStatusUpdate.objects.filter(delivery=self.active).exists())
+        archive = DeliveryStatusArchive.objects.get(pk=self.done.pk)
+        self.assertEqual([event[1] for event in archive.events], list(reversed(before)))
+        self.assertEqual(self.history(self.done), before)
+        self.assertEqual(archive.unpack()[-1].updated_by.email, self.agent.email)
+
+        response = self.request('get', f'/api/v1/deliveries/{self.done.pk}/', queries=2, user=self.agent)
+        self.assertEqual([update['status'] for update in response.data['status_updates']], list(reversed(before)))
+
+    def test_recent_and_active_deliveries_are_kept(self):
+        self.assertEqual(StatusHistoryArchiver().run(), 0)
+        self.assertFalse(DeliveryStatusArchive.objects.exists())
+
+    def test_rerun_merges_new_updates(self):
+        count = DeliveryStatusUpdate.objects.filter(delivery=self.done).count()
+        StatusHistoryArchiver().run(now=self.later)
+        DeliveryStatusUpdate.objects.create(delivery=self.done, status='delivered')
+        self.assertEqual(StatusHistoryArchiver().run(now=self.later), 1)
+        self.assertEqual(len(DeliveryStatusArchive.objects.get(pk=self.done.pk).events), count + 1)
+        self.assertFalse(DeliveryStatusUpdate.objects.filter(delivery=self.done).exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DeliveryTrackingConsumerTests(TestCase):
+    """
+    Only the parties to an order can track it; frames from several publishers all arrive.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=2, orders_per_customer=1, agents=1)
+        Delivery.objects.filter(pk=cls.data.deliveries[0].pk).update(current_latitude=-1.29, current_longitude=36.82)
+        cls.delivery = Delivery.objects.select_related('order__customer').get(pk=cls.data.deliveries[0].pk)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns),
+                                             f'/ws/delivery/{self.delivery.order_id}/')
+        communicator.scope['user'] = user
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    @async_to_sync
+    async def test_only_parties_to_the_order_connect(self):
+        other = self.data.customers[1]
+        for user, expected in ((other, 4403), (self.delivery.order.customer, True)):
+            communicator, connected, code = await self.connect(user)
+            self.assertEqual(connected or code, expected)
+            await communicator.disconnect()
+
+    @async_to_sync
+    async def test_frames_from_each_publisher_arrive(self):
+        communicator, _, _ = await self.connect(self.delivery.order.customer)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['data'], {'status': 'assigned', 'latitude': -1.29, 'longitude': 36.82})
+        relay, worker = TrackingFanout(window=0), TrackingFanout(window=0)
+        await worker.apublish(self.delivery.order_id, {'latitude': 1.0, 'longitude': 2.0})
+        await worker.apublish(self.delivery.order_id, {'latitude': 1.5, 'longitude': 2.0})
+        # The relay's frames are numbered apart from the worker's: its delta (seq 2) is not stale
+        await relay.apublish(self.delivery.order_id, {'status': 'in_transit'})
+        await relay.apublish(self.delivery.order_id, {'status': 'delivered'})
+        frames = [await communicator.receive_json_from() for _ in range(4)]
+        self.assertEqual([frame['data'] for frame in frames], [
+            {'latitude': 1.0, 'longitude': 2.0}, {'latitude': 1.5}, {'status': 'in_transit'}, {'status': 'delivered'},
+        ])
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AgentLocationConsumerTests(TestCase):
+    """
+    Agents can stream positions only for deliveries they currently own.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=1, orders_per_customer=1, agents=2)
+        cls.delivery = Delivery.objects.select_related('delivery_agent').get(pk=cls.data.deliveries[0].pk)
+
+    def setUp(self):
+        self.store = LocationStore(flush_interval=0)
+        self.layer = mock.Mock(group_send=mock.AsyncMock())
+        for target, value in (('delivery.consumers.get_location_store', lambda: self.store),
+                              ('delivery.consumers.get_fanout', lambda: TrackingFanout(window=0,
+                                                                                      channel_layer=self.layer))):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def ping(self, communicator, latitude):
+        await communicator.send_json_to({'delivery_id': str(self.delivery.pk), 'latitude': latitude, 'longitude': 36.8})
+        if await communicator.receive_nothing():
+            return None
+        return await communicator.receive_json_from()
+
+    @override_settings(DELIVERY_AGENT_OWNERSHIP_TTL_SECONDS=0)
+    @async_to_sync
+    async def test_ping_is_rejected_after_reassignment(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/agent/location/')
+        communicator.scope['user'] = self.delivery.delivery_agent
+        self.assertTrue((await communicator.connect())[0])
+        self.assertIsNone(await self.ping(communicator, -1.29))
+        self.assertEqual(self.store.delivery_location(self.delivery.pk), (-1.29, 36.8))
+
+        other_agent = next(agent for agent in self.data.agents if agent.pk != self.delivery.delivery_agent_id)
+        await database_sync_to_async(Delivery.objects.filter(pk=self.delivery.pk).update)(delivery_agent=other_agent)
+        self.assertEqual(await self.ping(communicator, -1.30), {'error': "Unknown delivery"})
+        self.assertEqual(self.store.delivery_location(self.delivery.pk), (-1.29, 36.8))
+        self.assertEqual(self.layer.group_send.await_count, 1)
+        await communicator.disconnect()
+
+
+class TrackingFanoutTests(SimpleTestCase):
+    """
+    Per-order publisher state is bounded even when no terminal status comes through.
+    """
+
+    def test_idle_groups_are_dropped(self):
+        fanout = TrackingFanout(window=1.0, idle_seconds=60, channel_layer=mock.Mock())
+        fanout.publish(1, {'latitude': 1.0, 'longitude': 2.0})
+        fanout.publish(2, {'latitude': 3.0, 'longitude': 4.0})
+        first = dict(fanout.build_frames())
+        fanout.publish(2, {'latitude': 3.5})
+        fanout.build_frames()
+        self.assertEqual(fanout.evict_idle(now=time.monotonic() + 30), 0)
+        self.assertEqual(fanout.evict_idle(now=time.monotonic() + 61), 2)
+        self.assertEqual((fanout._state, fanout._frames, len(fanout._last_sent)), ({}, {}, 0))
+        # The next frame is a keyframe whose seq still follows the ones sent before
+        fanout.publish(1, {'latitude': 1.1})
+        (group, event), = fanout.build_frames()
+        self.assertEqual((event['delta'], event['data']), (False, {'latitude': 1.1}))
+        self.assertGreater(event['seq'], first['delivery_1']['seq'])
+
+    def test_only_idle_groups_are_dropped(self):
+        fanout = TrackingFanout(window=1.0, idle_seconds=60, channel_layer=mock.Mock())
+        fanout.publish(1, {'latitude': 1.0})
+        fanout.build_frames()
+        fanout._last_sent['delivery_1'] -= 120
+        fanout.publish(2, {'latitude': 3.0})
+        fanout.build_frames()
+        self.assertEqual(set(fanout._state), {'delivery_2'})
+
+
+class LocationStoreTests(TestCase):
+    """
+    Buffered pings are written behind in bulk and kept for the next flush if a write fails.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=1, orders_per_customer=2, agents=2)
+
+    def test_flush_writes_the_latest_positions(self):
+        store = LocationStore(flush_interval=0)
+        first, second = self.data.deliveries[:2]
+        store.record(first.pk, first.delivery_agent_id, -1.0, 36.0)
+        store.record(first.pk, first.delivery_agent_id, -1.1, 36.1)
+        store.record(second.pk, None, -1.2, 36.2)
+        self.assertEqual(store.delivery_location(first.pk), (-1.1, 36.1))
+        self.assertEqual(store.flush(), (2, 1))
+        self.assertEqual(store.flush(), (0, 0))
+        self.assertEqual(Delivery.objects.values_list('current_latitude', 'current_longitude').get(pk=first.pk),
+                         (-1.1, 36.1))
+        self.assertEqual(Delivery.objects.get(pk=second.pk).current_location, '-1.2, 36.2')
+        location = DeliveryAgentLocation.objects.get(agent_id=first.delivery_agent_id)
+        self.assertEqual((float(location.latitude), float(location.longitude)), (-1.1, 36.1))
+
+    def test_scoped_flush_leaves_other_positions_buffered(self):
+        store = LocationStore(flush_interval=0)
+        first, second = self.data.deliveries[:2]
+        store.record(first.pk, first.delivery_agent_id, -1.0, 36.0)
+        store.record(second.pk, second.delivery_agent_id, -1.2, 36.2)
+        self.assertEqual(store.flush(delivery_ids=[first.pk], agent_ids=[first.delivery_agent_id]), (1, 1))
+        self.assertEqual(Delivery.objects.get(pk=second.pk).current_location, second.current_location)
+        self.assertEqual(store.flush(), (1, 1))
+
+    def test_failed_flush_is_requeued(self):
+        store = LocationStore(flush_interval=0)
+        delivery = self.data.deliveries[0]
+        store.record(delivery.pk, delivery.delivery_agent_id, -1.0, 36.0)
+        with mock.patch.object(store, '_write', side_effect=RuntimeError('down')):
+            with self.assertRaises(RuntimeError):
+                store.flush()
+        # A ping that arrives meanwhile wins over the one that failed to write
+        store.record(delivery.pk, delivery.delivery_agent_id, -1.5, 36.5)
+        self.assertEqual(store.flush(), (1, 1))
+        self.assertEqual(Delivery.objects.values_list('current_latitude', 'current_longitude').get(pk=delivery.pk),
+                         (-1.5, 36.5))
+
+    def test_reads_do_not_start_the_store(self):
+        with mock.patch('delivery.location_store._location_store', None), \
+                mock.patch.object(LocationStore, 'start') as start:
+            client = APIClient()
+            client.force_authenticate(self.data.deliveries[0].delivery_agent)
+            response = client.get(f'/api/v1/deliveries/{self.data.deliveries[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        start.assert_not_called()
+
+
+class DispatcherTests(TestCase):
+    """
+    Deliveries the dispatcher could not assign are retried with backoff, not dropped.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=1, orders_per_customer=3, agents=2)
+        Delivery.objects.update(status='pending', delivery_agent=None)
+
+    def setUp(self):
+        # candidates_per_delivery=None reads agents from the database, not the process-wide index
+        self.dispatcher = Dispatcher(LocalDispatchQueue(), window=0, candidates_per_delivery=None,
+                                     retry_backoff=1, retry_max_backoff=4)
+
+    def test_unassigned_deliveries_are_retried(self):
+        self.assertEqual(self.dispatcher.sweep(), 3)
+        self.assertEqual(self.dispatcher.run_once()['assigned'], 2)
+        self.assertEqual(self.dispatcher.queue.qsize(), 0)
+        now = time.monotonic()
+        self.assertEqual(self.dispatcher.requeue_due(now), 0)
+        self.assertEqual(self.dispatcher.requeue_due(now + 1.5), 1)
+
+        # One agent finishes their delivery and is free for the retried one
+        Delivery.objects.filter(pk__in=Delivery.objects.filter(status='assigned').values('pk')[:1]).update(
+            status='delivered')
+        self.assertEqual(self.dispatcher.run_once()['assigned'], 1)
+        self.assertFalse(Delivery.objects.filter(status='pending').exists())
+        self.assertEqual(self.dispatcher.requeue_due(now + 3600), 0)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        for attempts, due in ((0, 1), (1, 2), (2, 4), (5, 4)):
+            self.dispatcher.retry([{'id': 'x', 'enqueued_at': 0, 'attempts': attempts}], now=0)
+            self.assertEqual(self.dispatcher.requeue_due(due - 0.1), 0)
+            self.assertEqual(self.dispatcher.requeue_due(due), 1)
+            self.assertEqual(self.dispatcher.queue.get(timeout=0)['attempts'], attempts + 1)
+
+    def test_retries_stop_after_max_attempts(self):
+        dispatcher = Dispatcher(LocalDispatchQueue(), window=0, retry_backoff=1, retry_max_attempts=2)
+        with self.assertLogs('delivery.dispatcher', 'WARNING') as logs:
+            dispatcher.retry([{'id': 'x', 'enqueued_at': 0, 'attempts': 1},
+                              {'id': 'y', 'enqueued_at': 0, 'attempts': 2}], now=0)
+        self.assertIn("['y']", logs.output[0])
+        self.assertEqual(dispatcher.requeue_due(3600), 1)
+        self.assertEqual(dispatcher.queue.get(timeout=0)['id'], 'x')
+
+    def test_deliveries_without_pickup_coordinates_are_not_retried(self):
+        unlocated = self.data.deliveries[0]
+        Delivery.objects.filter(pk=unlocated.pk).update(pickup_latitude=None, pickup_longitude=None)
+        self.dispatcher.sweep()
+        with self.assertLogs('delivery.dispatcher', 'WARNING'):
+            self.assertEqual(self.dispatcher.run_once()['assigned'], 2)
+        self.assertEqual(self.dispatcher.requeue_due(time.monotonic() + 3600), 0)
+        self.assertEqual(Delivery.objects.get(pk=unlocated.pk).status, 'pending')
+
+    def test_latency_leaves_out_the_backoff(self):
+        self.dispatcher.retry([{'id': 'x', 'enqueued_at': 0}], now=0)
+        before = time.time()
+        self.dispatcher.requeue_due(1)
+        self.assertGreaterEqual(self.dispatcher.queue.get(timeout=0)['enqueued_at'], before)
+
+    def test_failed_batches_are_retried(self):
+        self.dispatcher.sweep()
+        with mock.patch.object(BatchDispatchService, 'run', side_effect=RuntimeError('down')):
+            with self.assertRaises(RuntimeError):
+                self.dispatcher.run_once()
+        self.assertEqual(self.dispatcher.requeue_due(time.monotonic() + 1), 3)
+        self.assertEqual(self.dispatcher.run_once()['assigned'], 2)
+
+
+class GridIndexTests(SimpleTestCase):
+    """
+    Grid searches agree with a brute-force scan, and moves keep the buckets consistent.
+    """
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = {i: (-1.29 + rng.uniform(-0.2, 0.2), 36.82 + rng.uniform(-0.2, 0.2)) for i in range(500)}
+        self.index = GridIndex(cell_size_km=1.0)
+        for item_id, (lat, lng) in self.points.items():
+            self.index.insert(item_id, lat, lng)
+
+    def brute_force(self, lat, lng):
+        return sorted((haversine(lat, lng, plat, plng), item_id) for item_id, (plat, plng) in self.points.items())
+
+    def test_within(self):
+        expected = [(d, i) for d, i in self.brute_force(-1.3, 36.8) if d <= 3]
+        self.assertEqual(self.index.within(-1.3, 36.8, 3), expected)
+        # Geodesic refinement may only disagree with haversine right at the edge
+        exact = self.index.within(-1.3, 36.8, 3, exact=True)
+        edge = {i for d, i in self.brute_force(-1.3, 36.8) if 2.97 <= d <= 3.03}
+        self.assertLessEqual({i for _, i in exact} ^ {i for _, i in expected}, edge)
+        self.assertTrue(all(d <= 3 for d, _ in exact))
+
+    def test_nearest(self):
+        expected = self.brute_force(-1.25, 36.9)
+        self.assertEqual([i for _, i in self.index.nearest(-1.25, 36.9, k=5, exact=False)],
+                         [i for _, i in expected[:5]])
+        excluded = {expected[0][1]}
+        self.assertEqual(self.index.nearest(-1.25, 36.9, k=1, exact=False, exclude=excluded), [expected[1]])
+        self.assertEqual(self.index.nearest(-1.25, 36.9, k=5, max_radius_km=expected[0][0] / 2), [])
+        # Far outside the points: the search widens until it reaches them
+        self.assertEqual(self.index.nearest(0.0, 36.8, k=1, exact=False)[0][1], self.brute_force(0.0, 36.8)[0][1])
+
+    def test_insert_moves_and_remove(self):
+        self.index.insert(0, 10.0, 10.0)
+        self.assertEqual(self.index.get(0), (10.0, 10.0))
+        self.assertEqual(self.index.nearest(10.0, 10.0, k=1, exact=False), [(0.0, 0)])
+        self.assertNotIn(0, [i for _, i in self.index.within(*self.points[0], 0.5)])
+        self.index.remove(0)
+        self.assertNotIn(0, self.index)
+        self.assertEqual((sum(len(bucket) for bucket in self.index._cells.values()), len(self.index)), (499, 499))
+
+    def test_searches_run_alongside_moves(self):
+        index = AgentLocationIndex(refresh_interval=3600)
+        index._loaded_at = float('inf')
+        for item_id, (lat, lng) in self.points.items():
+            index.update(item_id, lat, lng)
+        stop, errors = threading.Event(), []
+
+        def move():
+            rng = random.Random(1)
+            while not stop.is_set():
+                item_id = rng.randrange(1000)
+                index.update(item_id, -1.29 + rng.uniform(-0.2, 0.2), 36.82 + rng.uniform(-0.2, 0.2))
+                index.discard(rng.randrange(1000))
+
+        thread = threading.Thread(target=move)
+        thread.start()
+        try:
+            for _ in range(300):
+                index.nearest_agents(-1.29, 36.82, k=5, max_radius_km=20)
+        except RuntimeError as exc:
+            errors.append(exc)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class CountingRoutingProvider:
+    """
+    Stands in for a routing API: cacheable, configured through OPTIONS, and counts its calls.
+    """
+    calls = 0
+
+    def __init__(self, speed_kmh):
+        self.provider = HaversineProvider(road_factor=1.3, speed_kmh=speed_kmh)
+
+    def route(self, start, end):
+        CountingRoutingProvider.calls += 1
+        return self.provider.route(start, end)
+
+
+class RouteCacheTests(SimpleTestCase):
+    """
+    Quotes are cached per pair of geohash cells.
+    """
+    restaurant = (-1.2833, 36.8167)
+
+    def setUp(self):
+        self.provider = mock.Mock(wraps=HaversineProvider(road_factor=1.3))
+
+    def test_geohash(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        lat, lng = geohash_decode('u4pruydqqvj')
+        self.assertAlmostEqual(lat, 57.64911, places=5)
+        self.assertAlmostEqual(lng, 10.40744, places=5)
+
+    def test_nearby_dropoffs_share_one_route(self):
+        cache = RouteCache(self.provider)
+        first = cache.route(self.restaurant, (-1.29210, 36.82190))
+        second = cache.route(self.restaurant, (-1.29215, 36.82185))
+        self.assertEqual(first, second)
+        self.assertEqual(self.provider.route.call_count, 1)
+        cache.route(self.restaurant, (-1.30, 36.83))
+        self.assertEqual(self.provider.route.call_count, 2)
+        self.assertAlmostEqual(first.distance_km, 1.3 * 1.12, delta=0.2)
+
+    def test_same_cell_is_routed_exactly(self):
+        cache = RouteCache(self.provider)
+        self.assertEqual(cache.cell(*self.restaurant), cache.cell(-1.2838, 36.8167))
+        route = cache.route(self.restaurant, (-1.2838, 36.8167))
+        self.assertAlmostEqual(route.distance_km, 1.3 * 0.0556, delta=0.01)
+        self.assertIsInstance(build_distance_provider(), HaversineProvider)
+
+    def test_entries_expire_and_evict(self):
+        cache = RouteCache(self.provider, ttl=0)
+        cache.route(self.restaurant, (-1.2921, 36.8219))
+        cache.route(self.restaurant, (-1.2921, 36.8219))
+        self.assertEqual(self.provider.route.call_count, 2)
+
+        cache = RouteCache(self.provider, maxsize=1)
+        cache.route(self.restaurant, (-1.2921, 36.8219))
+        cache.route(self.restaurant, (-1.30, 36.83))
+        cache.route(self.restaurant, (-1.2921, 36.8219))
+        self.assertEqual((self.provider.route.call_count, len(cache)), (5, 1))
+
+
+class DeliveryCoordinatesTests(TestCase):
+    """
+    Text locations are parsed into numeric and geohash columns on save.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, customers=1, orders_per_customer=1, agents=1)
+
+    def test_save_parses_locations(self):
+        delivery = Delivery.objects.get(pk=self.data.deliveries[0].pk)
+        self.assertEqual(delivery.pickup_coordinates, (-1.2833, 36.8167))
+        self.assertEqual(delivery.pickup_geohash, geohash_encode(-1.2833, 36.8167, 9))
+
+        delivery.dropoff_location = '-1.30, 36.80'
+        delivery.current_location = 'somewhere'
+        delivery.save(update_fields=['dropoff_location', 'current_location'])
+        delivery = Delivery.objects.get(pk=delivery.pk)
+        self.assertEqual(delivery.dropoff_coordinates, (-1.30, 36.80))
+        self.assertEqual(delivery.dropoff_geohash[:5], geohash_encode(-1.30, 36.80, 5))
+        self.assertIsNone(delivery.current_latitude)
@@ -0,0 +1,47 @@
+"""
+Delivery status transitions.
+
+Each transition is one conditional UPDATE (see ``foodapibackend.statemachine``)
+committed together with its DeliveryStatusUpdate row and outbox event.
+Batch assignment (``services.BatchDispatchService``) performs the
+``pending -> assigned`` move itself, under row locks.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from foodapibackend.statemachine import StateMachine
+
+from .models import Delivery, DeliveryStatusUpdate
+from .outbox import DELIVERY_STATUS_CHANGED, record
+
+DELIVERY_TRANSITIONS = {
+    'pending': {'assigned', 'failed'},
+    'assigned': {'in_transit', 'failed'},
+    'in_transit': {'delivered', 'failed'},
+    'delivered': set(),
+    'failed': set(),
+}
+
+delivery_states = StateMachine(Delivery, DELIVERY_TRANSITIONS)
+
+
+def transition_delivery(delivery, status, user=None, version=None):
+    """
+    Move ``delivery`` to ``status``. ``version`` is what the caller last saw
+    (default: the version ``delivery`` was loaded at). Raises
+    InvalidTransition or TransitionConflict; nothing is written then.
+    """
+    previous = getattr(delivery, '_loaded_status', delivery.status)
+    changes = {'delivered_at': timezone.now()} if status == 'delivered' else {}
+    delivery_states.check(previous, status)
+    with transaction.atomic():
+        delivery_states.apply_to(delivery, status, version=version, **changes)
+        DeliveryStatusUpdate.objects.create(delivery=delivery, status=status, updated_by=user)
+        # QuerySet.update() sends no post_save, so the event is recorded here
+        record(DELIVERY_STATUS_CHANGED, delivery.pk, {
+            'delivery_id': str(delivery.pk),
+            'order_id': delivery.order_id,
+            'status': status,
+            'previous_status': previous,
+        })
+    return delivery
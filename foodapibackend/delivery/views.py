@@ -2,24 +2,36 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.utils.timezone import now
-from .models import Delivery, DeliveryStatusUpdate
-from .serializers import DeliverySerializer, DeliveryCreateSerializer
-from .utils import calculate_delivery_cost, get_distance, send_push_notification_to_user
+from django.db import transaction
+from .models import Delivery
+from .pagination import StatusHistoryPagination
+from .permissions import IsAssignedAgent, IsAssignedAgentOrStaff
+from .serializers import (
+    DeliverySerializer, DeliveryListSerializer, DeliveryCreateSerializer, DeliveryStatusUpdateSerializer,
+)
+from .dispatcher import enqueue_delivery
+from .location_store import (
+    buffered_delivery_location, flush_delivery_location, format_location, get_location_store,
+)
+from .fanout import publish_location
+from .distance import get_distance_provider
+from .transitions import transition_delivery
+from .utils import calculate_delivery_cost
 from accounts.models import User
-import environ
-import os
-
-# Initialize environment variables
-env = environ.Env()
+from foodapibackend.fieldsets import eager_load
+from foodapibackend.statemachine import InvalidTransition, TransitionConflict
+from foodapibackend.pagination import CreatedAtCursorPagination
 
 
 class DeliveryViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing deliveries.
+    Lists use the compact DeliveryListSerializer; the status history is
+    included on retrieve and paginated under ``status-history/``.
     """
     queryset = Delivery.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         """
@@ -27,15 +39,24 @@ class DeliveryViewSet(viewsets.ModelViewSet):
         - Customers see their own deliveries.
         - Delivery agents see their assigned deliveries.
         - Owners see deliveries for their restaurant's orders.
+        - Staff see every delivery.
         """
         user = self.request.user
+        queryset = self.queryset
+        if self.action in ('list', 'retrieve'):
+            # Everything the list/detail serializer renders for this request, loaded up front
+            queryset = eager_load(queryset, self.get_serializer_class(), self.request)
+        elif self.action == 'status_history':
+            queryset = queryset.select_related('status_archive')
+        if user.is_staff:
+            return queryset
         if user.role == 'customer':
-            return self.queryset.filter(order__customer=user)
+            return queryset.filter(order__customer=user)
         elif user.role == 'delivery_agent':
-            return self.queryset.filter(delivery_agent=user)
+            return queryset.filter(delivery_agent=user)
         elif user.role == 'owner':
-            return self.queryset.filter(order__restaurant__user=user)
-        return self.queryset.none()
+            return queryset.filter(order__restaurant__user=user)
+        return queryset.none()
 
     def get_serializer_class(self):
         """
@@ -43,48 +64,68 @@ class DeliveryViewSet(viewsets.ModelViewSet):
         """
         if self.action == 'create':
             return DeliveryCreateSerializer
+        if self.action == 'list':
+            return DeliveryListSerializer
+        if self.action == 'status_history':
+            return DeliveryStatusUpdateSerializer
         return DeliverySerializer
 
     def create(self, request, *args, **kwargs):
         """
-        Create a new delivery.
+        Create a new delivery. It is returned as 'pending' and handed to the
+        dispatcher for agent assignment once the transaction commits.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         delivery = serializer.save()
+        transaction.on_commit(lambda: enqueue_delivery(delivery.pk))
         response_serializer = DeliverySerializer(delivery)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
-    @action(detail=True, methods=['post'], url_path='update-status')
+    def update(self, request, *args, **kwargs):
+        """
+        Update the editable fields (addresses, locations, cost); the status
+        only changes through ``update-status``. A save from a stale read is a 409.
+        """
+        try:
+            return super().update(request, *args, **kwargs)
+        except TransitionConflict:
+            return self.conflict_response(kwargs['pk'])
+
+    def conflict_response(self, pk):
+        current = Delivery.objects.filter(pk=pk).values('status', 'version').first()
+        return Response({"error": "The delivery was changed by someone else", **(current or {})},
+                        status=status.HTTP_409_CONFLICT)
+
+    @action(detail=True, methods=['post'], url_path='update-status', permission_classes=[IsAssignedAgentOrStaff])
     def update_status(self, request, pk=None):
         """
-        Update the delivery status and log the change.
+        Move the delivery to ``status`` if the state machine allows it, and log the change.
+        Only the assigned agent (or staff) may change it.
+        An optional ``version`` (from a previous response) makes the change
+        conditional on nothing having happened since; a lost race is a 409.
         """
         delivery = self.get_object()
         status_value = request.data.get('status')
-        if status_value in dict(Delivery.STATUS_CHOICES):
-            delivery.status = status_value
-            if status_value == 'delivered':
-                delivery.delivered_at = now()
-            delivery.save()
-
-            # Log status update
-            DeliveryStatusUpdate.objects.create(
-                delivery=delivery,
-                status=status_value,
-                updated_by=request.user
-            )
-
-            # Notify the customer about the status update
-            if delivery.order.customer and delivery.order.customer.fcm_token:
-                send_push_notification_to_user(
-                    delivery.order.customer,
-                    "Delivery Status Update",
-                    f"Your delivery is now {status_value.replace('_', ' ').title()}!"
-                )
-
-            return Response({"message": f"Status updated to {status_value}"}, status=status.HTTP_200_OK)
-        return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+        if status_value not in dict(Delivery.STATUS_CHOICES):
+            return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+        version = request.data.get('version')
+        if version is not None:
+            try:
+                version = int(version)
+            except (TypeError, ValueError):
+                return Response({"error": "Invalid version"}, status=status.HTTP_400_BAD_REQUEST)
+        # Persist the last buffered position first, so it is not a flush interval behind the new status
+        flush_delivery_location(delivery.pk, delivery.delivery_agent_id)
+        try:
+            # One conditional UPDATE, committed with the status log row and outbox event
+            transition_delivery(delivery, status_value, user=request.user, version=version)
+        except InvalidTransition as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except TransitionConflict:
+            return self.conflict_response(delivery.pk)
+        return Response({"message": f"Status updated to {status_value}", "version": delivery.version},
+                        status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['get'], url_path='estimate-cost')
     def estimate_cost(self, request, pk=None):
@@ -92,37 +133,56 @@ class DeliveryViewSet(viewsets.ModelViewSet):
         Estimate the delivery cost based on the distance between pickup and dropoff locations.
         """
         delivery = self.get_object()
-        distance, _ = get_distance(
-            delivery.pickup_location,
-            delivery.dropoff_location,
-            api_key=env('GOOGLE_MAPS_API_KEY')
-        )
+        if delivery.pickup_coordinates is None or delivery.dropoff_coordinates is None:
+            return Response({"error": "Pickup and dropoff locations must be \"lat, lng\" strings"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        distance, _ = get_distance_provider().route(delivery.pickup_coordinates, delivery.dropoff_coordinates)
         cost = calculate_delivery_cost(distance)
         return Response({"distance": distance, "cost": cost}, status=status.HTTP_200_OK)
 
-    @action(detail=True, methods=['post'], url_path='update-location')
+    @action(detail=True, methods=['post'], url_path='update-location', permission_classes=[IsAssignedAgent])
     def update_location(self, request, pk=None):
         """
-        Update the real-time location of the delivery agent.
+        Update the real-time location of the delivery agent; only the assigned agent may.
+        Positions are buffered in memory and written behind in bulk.
         """
         delivery = self.get_object()
-        latitude = request.data.get('latitude')
-        longitude = request.data.get('longitude')
-        if latitude and longitude:
-            delivery.current_location = f"{latitude}, {longitude}"
-            delivery.save()
+        try:
+            latitude = float(request.data.get('latitude'))
+            longitude = float(request.data.get('longitude'))
+        except (TypeError, ValueError):
+            latitude = longitude = None
+        if latitude is not None and -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            get_location_store().record(delivery.pk, delivery.delivery_agent_id, latitude, longitude)
+            publish_location(delivery.order_id, latitude, longitude)
             return Response({"message": "Location updated successfully"}, status=status.HTTP_200_OK)
         return Response({"error": "Invalid location data"}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'], url_path='status-history')
+    def status_history(self, request, pk=None):
+        """
+        Paginated status history of a delivery, newest first. Archived
+        history is unpacked and paginated in memory with the same cursors.
+        """
+        delivery = self.get_object()
+        paginator = StatusHistoryPagination()
+        updates = eager_load(delivery.status_updates.all(), DeliveryStatusUpdateSerializer, request)
+        if hasattr(delivery, 'status_archive'):
+            updates = delivery.status_archive.unpack() + list(updates)
+        updates = paginator.paginate_queryset(updates, request, view=self)
+        serializer = self.get_serializer(updates, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['get'], url_path='track')
     def track_order(self, request, pk=None):
         """
         Track the delivery's current status and location.
         """
         delivery = self.get_object()
+        buffered = buffered_delivery_location(delivery.pk)
         data = {
             "status": delivery.status,
-            "current_location": delivery.current_location,
+            "current_location": format_location(*buffered) if buffered else delivery.current_location,
             "estimated_delivery_time": "15 minutes",  # Example placeholder for ETA
         }
         return Response(data, status=status.HTTP_200_OK)
@@ -0,0 +1,81 @@
+"""
+Lazily created external clients (Firebase), one per process.
+
+Nothing here runs at import time: ``clients.get('firebase')`` builds the
+client on first use, under a per-name lock so concurrent first calls
+share one instance, and caches it for the life of the process. Missing
+credentials therefore only fail the code path that needs them.
+"""
+import json
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class ClientRegistry:
+    """
+    Name -> factory map whose clients are created once, on first ``get``.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._clients.pop(name, None)
+        return factory
+
+    def get(self, name):
+        try:
+            return self._clients[name]
+        except KeyError:
+            pass
+        try:
+            lock = self._locks[name]
+        except KeyError:
+            raise LookupError(f"No client registered as {name!r}") from None
+        with lock:
+            if name not in self._clients:
+                self._clients[name] = self._factories[name]()
+            return self._clients[name]
+
+    def initialized(self, name):
+        return name in self._clients
+
+    def reset(self, name=None):
+        """
+        Forget created clients so the next ``get`` builds them again (tests, settings changes).
+        """
+        with self._lock:
+            if name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(name, None)
+
+
+clients = ClientRegistry()
+
+
+def create_firebase_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
+    config = getattr(settings, 'FIREBASE_CONFIG', None)
+    if not config:
+        raise ImproperlyConfigured("FIREBASE_CONFIG must be set to send push notifications")
+    if isinstance(config, str):
+        config = json.loads(config)
+    return firebase_admin.initialize_app(credentials.Certificate(config))
+
+
+clients.register('firebase', create_firebase_app)
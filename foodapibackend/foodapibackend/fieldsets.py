@@ -0,0 +1,70 @@
+"""
+Sparse fieldsets for read endpoints: ``?fields=id,name`` and ``?expand=menu_items``.
+
+``fields`` limits the top-level fields rendered; names listed in
+``Meta.expandable_fields`` (usually nested lists) are then only rendered
+when also named in ``expand``. ``expand`` on its own keeps every regular
+field and drops the expandable ones that are not named. Without either
+parameter the full representation is rendered.
+
+Serializers declare which relations each field needs in
+``select_related_fields`` / ``prefetch_related_fields`` so views can load
+only those with ``eager_load``.
+"""
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+
+def selected_fields(serializer_class, request, all_fields):
+    """
+    Names out of ``all_fields`` to render for ``request``, or None for all of them.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = _split(request.query_params.get('fields'))
+    expand = _split(request.query_params.get('expand'))
+    if not fields and not expand:
+        return None
+    expandable = set(getattr(getattr(serializer_class, 'Meta', None), 'expandable_fields', ()))
+    if fields:
+        return {name for name in all_fields if name in fields or name in expand}
+    return {name for name in all_fields if name not in expandable or name in expand}
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer mixin that drops the fields a GET request did not ask for.
+    Only the top-level serializer (or the child of a top-level ``many=True``)
+    is trimmed; nested serializers render in full.
+    """
+    select_related_fields = {}
+    prefetch_related_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = selected_fields(type(self), self.context.get('request'), self.fields)
+        if keep is not None:
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+def eager_load(queryset, serializer_class, request):
+    """
+    Apply the select_related/prefetch_related lookups of the fields that
+    ``serializer_class`` will render for ``request``.
+    """
+    names = list(serializer_class().fields)
+    keep = selected_fields(serializer_class, request, names)
+    selects, prefetches = [], []
+    for name in names:
+        if keep is None or name in keep:
+            selects.extend(serializer_class.select_related_fields.get(name, ()))
+            prefetches.extend(serializer_class.prefetch_related_fields.get(name, ()))
+    if selects:
+        queryset = queryset.select_related(*selects)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
@@ -0,0 +1,78 @@
+"""
+Minimal in-process metrics: counters, gauges and timing samples.
+
+Everything lives in process memory; ``metrics.snapshot()`` is what the
+benchmarks and management commands print.
+"""
+import threading
+from collections import defaultdict, deque
+
+
+class Metrics:
+    def __init__(self, max_samples=2048):
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = defaultdict(int)
+            self._gauges = {}
+            self._samples = defaultdict(lambda: deque(maxlen=self._max_samples))
+            self._totals = defaultdict(lambda: [0, 0.0])
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            self._samples[name].append(value)
+            total = self._totals[name]
+            total[0] += 1
+            total[1] += value
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def ratio(self, numerator, denominator):
+        """
+        ``numerator / (numerator + denominator)`` of two counters, e.g. a hit rate.
+        """
+        hits, misses = self.counter(numerator), self.counter(denominator)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def summary(self, name):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+            count, total = self._totals.get(name, (0, 0.0))
+        if not samples:
+            return {'count': 0}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            'count': count,
+            'mean': total / count,
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'max': samples[-1],
+        }
+
+    def snapshot(self):
+        with self._lock:
+            names = list(self._samples)
+            data = {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+            }
+        data['timings'] = {name: self.summary(name) for name in names}
+        return data
+
+
+metrics = Metrics()
@@ -0,0 +1,125 @@
+"""
+Keyset pagination on ``(created_at, id)``, newest first.
+
+Each page is fetched with ``WHERE (created_at, id) < (cursor)`` and an
+``ORDER BY created_at DESC, id DESC LIMIT n``, so with a composite index
+ending in ``(created_at, id)`` page 1000 costs the same as page 1.
+Subclasses can key on another timestamp with ``timestamp_field``.
+"""
+import base64
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CreatedAtCursorPagination(BasePagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    timestamp_field = 'created_at'
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, reverse, obj):
+        raw = f"{'p' if reverse else 'n'}|{getattr(obj, self.timestamp_field).isoformat()}|{obj.pk}"
+        cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|', 2)
+            if direction not in ('n', 'p'):
+                raise ValueError(direction)
+            return direction == 'p', datetime.fromisoformat(created_at), pk
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Paginate a queryset, or a list of model instances (which is sorted and
+        filtered in memory with the same cursors).
+        """
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[0]
+        if isinstance(queryset, (list, tuple)):
+            rows = self.slice_sequence(queryset, cursor, reverse, size + 1)
+        else:
+            rows = self.slice_queryset(queryset, cursor, reverse, size + 1)
+        has_more = len(rows) > size
+        page = rows[:size]
+        if reverse:
+            page.reverse()
+
+        # Coming back from a later page there is always a next page; going
+        # forward from a cursor there is always a previous one.
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else cursor is not None
+        self.next_link = self.encode_cursor(False, page[-1]) if page and has_next else None
+        self.previous_link = self.encode_cursor(True, page[0]) if page and has_previous else None
+        if not page and cursor is not None:
+            self.previous_link = remove_query_param(self.base_url, self.cursor_query_param)
+        return page
+
+    def slice_queryset(self, queryset, cursor, reverse, limit):
+        field = self.timestamp_field
+        if cursor is not None:
+            _, timestamp, pk = cursor
+            try:
+                if reverse:
+                    queryset = queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk}))
+                else:
+                    queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk}))
+            except (ValueError, ValidationError):
+                # primary key in the cursor does not fit the model (e.g. a malformed UUID)
+                raise NotFound(self.invalid_cursor_message)
+        ordering = (field, 'pk') if reverse else (f'-{field}', '-pk')
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def slice_sequence(self, items, cursor, reverse, limit):
+        def key(obj):
+            return getattr(obj, self.timestamp_field), obj.pk
+
+        items = sorted(items, key=key, reverse=not reverse)
+        if cursor is not None and items:
+            _, timestamp, pk = cursor
+            try:
+                position = (timestamp, items[0]._meta.pk.to_python(pk))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            items = [obj for obj in items if (key(obj) > position if reverse else key(obj) < position)]
+        return items[:limit]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -86,6 +86,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodapibackend.wsgi.application'
+ASGI_APPLICATION = 'foodapibackend.asgi.application'
 
 
 # Database
@@ -120,7 +121,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # JWT Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ],
      'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -152,7 +153,24 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_TOKEN_CLASSES': (
         'rest_framework_simplejwt.tokens.AccessToken',
-    )
+    ),
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.authentication.RoleTokenObtainPairSerializer',
+}
+
+# Authorization fields (id, role, is_active, is_staff) of authenticated users
+# are kept in the CACHE alias; saves evict, QuerySet.update waits for the TTL.
+# Saves only reach other workers if that cache is shared (set CACHE_URL to
+# Redis or Memcached); with locmem they wait for the TTL too.
+# TRUST_TOKEN_CLAIMS uses the role signed into the token and skips the cache.
+JWT_USER_CACHE = {
+    'CACHE': 'default',
+    'TTL_SECONDS': 60,
+    'TRUST_TOKEN_CLAIMS': env.bool('JWT_TRUST_TOKEN_CLAIMS', default=False),
+}
+
+# Full-text search (restaurant.search): how many of the newest matches get ranked
+RESTAURANT_SEARCH = {
+    'MAX_CANDIDATES': 2000,
 }
 
 
@@ -180,9 +198,22 @@ DJOSER = {
     }
 }
 
-import json
-
-FIREBASE_CONFIG = json.loads(env('FIREBASE_CONFIG'))
+# Service account JSON; parsed when the Firebase app is first needed (foodapibackend.clients)
+FIREBASE_CONFIG = env('FIREBASE_CONFIG', default=None)
+
+GOOGLE_MAPS_API_KEY = env('GOOGLE_MAPS_API_KEY', default=None)
+
+# Delivery quotes: offline great-circle distance times road_factor. OPTIONS are
+# passed to the PROVIDER class. Costly providers (routing APIs) are cached per
+# pair of geohash cells (precision 7 is ~150 m) in an LRU with a TTL; the
+# offline provider is never cached.
+DELIVERY_DISTANCE = {
+    'PROVIDER': 'delivery.distance.HaversineProvider',
+    'OPTIONS': {'road_factor': 1.0, 'speed_kmh': 30},
+    'CACHE_PRECISION': 7,
+    'CACHE_SIZE': 10000,
+    'CACHE_TTL_SECONDS': 3600,
+}
 
 CHANNEL_LAYERS = {
     "default": {
@@ -193,6 +224,87 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Read cache for restaurant detail and menus. Cache versions must be seen by
+# every worker, so it is off unless CACHE_URL points to a shared backend;
+# RESTAURANT_CACHE_ALLOW_LOCAL enables it on locmem for a single process.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+RESTAURANT_CACHE_TIMEOUT = 300
+RESTAURANT_CACHE_ALLOW_LOCAL = env.bool('RESTAURANT_CACHE_ALLOW_LOCAL', default=False)
+
+# Idempotency-Key support for order placement. STORE is
+# restaurant.idempotency.DatabaseIdempotencyStore (shared by all workers)
+# or restaurant.idempotency.LocalMemoryIdempotencyStore (single process).
+IDEMPOTENCY = {
+    'STORE': 'restaurant.idempotency.DatabaseIdempotencyStore',
+    'TTL_SECONDS': 24 * 60 * 60,
+    'LOCK_SECONDS': 30,
+    'WAIT_SECONDS': 10,
+}
+
+# Delivery dispatch: grid cell size and DB reload interval of the agent spatial index
+DELIVERY_AGENT_INDEX_CELL_KM = 1.0
+DELIVERY_AGENT_INDEX_REFRESH_SECONDS = 60
+
+# Agent GPS pings are buffered in memory and written behind every N seconds
+DELIVERY_LOCATION_FLUSH_SECONDS = env.float('DELIVERY_LOCATION_FLUSH_SECONDS', default=5.0)
+# Agent location sockets re-check that the agent still owns a delivery this often
+DELIVERY_AGENT_OWNERSHIP_TTL_SECONDS = 5.0
+
+# Tracking WebSocket fan-out: updates per order are coalesced over this window,
+# with a full keyframe every N frames between delta frames. A publisher forgets
+# an order after IDLE_SECONDS without frames.
+DELIVERY_TRACKING_WINDOW_SECONDS = 1.0
+DELIVERY_TRACKING_KEYFRAME_EVERY = 20
+DELIVERY_TRACKING_IDLE_SECONDS = 300
+
+# Background dispatcher: QUEUE_URL=None uses an in-process memory queue,
+# a redis:// URL shares the queue with `manage.py run_dispatcher` workers.
+DELIVERY_DISPATCHER = {
+    'QUEUE_URL': env('DELIVERY_DISPATCH_QUEUE_URL', default=None),
+    'WINDOW_SECONDS': 0.5,
+    'MAX_BATCH': 200,
+    'CANDIDATES_PER_DELIVERY': 10,
+    'MAX_DISTANCE_KM': None,
+    'IN_PROCESS_WORKER': env.bool('DELIVERY_DISPATCH_IN_PROCESS', default=True),
+    # Unassigned deliveries are retried after 5 s, 10 s, ... up to every 5 minutes,
+    # at most 20 times (about 75 minutes); after that only a sweep queues them again
+    'RETRY_BACKOFF_SECONDS': 5.0,
+    'RETRY_MAX_BACKOFF_SECONDS': 300.0,
+    'RETRY_MAX_ATTEMPTS': 20,
+}
+
+# Push notifications are queued and sent to FCM in batches by a background
+# thread; failed messages are retried with exponential backoff and jitter.
+PUSH_NOTIFICATIONS = {
+    'TRANSPORT': 'delivery.notifications.FirebaseTransport',
+    'WINDOW_SECONDS': 0.5,
+    'MAX_BATCH': 500,
+    'MAX_RETRIES': 5,
+    'BACKOFF_SECONDS': 1.0,
+    'BACKOFF_MAX_SECONDS': 60.0,
+}
+
+# Transactional outbox: delivery/order status events are written with the
+# change and published (channel broadcast, push) by a relay after commit.
+# Set IN_PROCESS_WORKER=False when running `manage.py run_outbox_relay`.
+DELIVERY_OUTBOX = {
+    'BATCH_SIZE': 100,
+    'POLL_SECONDS': 1.0,
+    'MAX_ATTEMPTS': 10,
+    # Only the relay holding the lease publishes, so events stay in order
+    'LEASE_SECONDS': 30,
+    'IN_PROCESS_WORKER': env.bool('DELIVERY_OUTBOX_IN_PROCESS', default=True),
+}
+
+# Status history archival: run `manage.py archive_status_history` periodically
+DELIVERY_STATUS_ARCHIVE = {
+    'AFTER_DAYS': env.int('DELIVERY_STATUS_ARCHIVE_AFTER_DAYS', default=30),
+    'BATCH_SIZE': 500,
+    'PAUSE_SECONDS': 0.0,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -0,0 +1,149 @@
+"""
+Status state machines applied as conditional updates, with optimistic locking.
+
+A transition is one ``UPDATE ... SET status=<target>, version=version+1
+WHERE id=<pk> AND status=<expected> AND version=<n>``. Zero rows updated
+means someone else got there first, and the caller gets a
+``TransitionConflict`` instead of silently overwriting their change. There
+is no read-modify-write of the row and no row lock held across a round
+trip.
+
+Models opt in by subclassing ``VersionedModel``. Its ``save()`` applies the
+same version check, so a full-row save from a stale instance (the admin, a
+shell) raises ``TransitionConflict`` rather than undoing a transition that
+happened since the instance was loaded.
+"""
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+class InvalidTransition(Exception):
+    """
+    The state machine does not allow moving from ``source`` to ``target``.
+    """
+
+    def __init__(self, source, target):
+        super().__init__(f"Cannot change status from {source} to {target}")
+        self.source = source
+        self.target = target
+
+
+class TransitionConflict(Exception):
+    """
+    The row no longer has the status or version the change was based on.
+    """
+
+
+class VersionedModel(models.Model):
+    """
+    Abstract model with a ``version`` counter bumped by every status change
+    and checked by ``save()``.
+    """
+    state_field = 'status'
+
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_version = instance.__dict__.get('version')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # The reloaded version is what the next save() is based on
+        if fields is None or 'version' in fields:
+            self._loaded_version = self.__dict__.get('version')
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # Saves that can't change the status (e.g. location columns only) are left unchecked
+        locked = getattr(self, '_loaded_version', None) is not None and not self._state.adding and (
+            update_fields is None or self.state_field in update_fields)
+        if not locked:
+            return super().save(*args, update_fields=update_fields, **kwargs)
+        if update_fields is not None:
+            update_fields = [*update_fields, 'version']
+        self.version = self._loaded_version + 1
+        try:
+            # A savepoint, so a conflict leaves the caller's transaction usable
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, update_fields=update_fields, **kwargs)
+        except TransitionConflict:
+            self.version = self._loaded_version
+            raise
+        self._loaded_version = self.version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = getattr(self, '_loaded_version', None)
+        if expected is None or self.version == expected:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update):
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise TransitionConflict(f"{self._meta.object_name} {pk_val} changed since it was loaded")
+        return False
+
+
+class StateMachine:
+    """
+    Allowed ``source -> targets`` moves of a VersionedModel's status, and
+    ``apply`` to perform one as a single conditional UPDATE.
+    """
+
+    def __init__(self, model, transitions):
+        self.model = model
+        self.field = model.state_field
+        self.transitions = {source: frozenset(targets) for source, targets in transitions.items()}
+        self._auto_now = [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+    def allowed(self, source, target):
+        return target in self.transitions.get(source, ())
+
+    def targets(self, source):
+        return self.transitions.get(source, frozenset())
+
+    def with_timestamps(self, changes):
+        # QuerySet.update() skips auto_now fields, so stamp them explicitly
+        now = timezone.now()
+        return {**{name: now for name in self._auto_now}, **changes}
+
+    def check(self, source, target):
+        if not self.allowed(source, target):
+            raise InvalidTransition(source, target)
+
+    def apply(self, pk, source, version, target, **changes):
+        """
+        Move row ``pk`` from ``source`` at ``version`` to ``target``, setting
+        ``changes`` too. Returns the new version.
+        """
+        self.check(source, target)
+        changes = self.with_timestamps(changes)
+        updated = self.model._default_manager.filter(pk=pk, **{self.field: source}, version=version).update(
+            **{self.field: target}, version=F('version') + 1, **changes,
+        )
+        if not updated:
+            raise TransitionConflict(
+                f"{self.model._meta.object_name} {pk} is no longer {source} at version {version}"
+            )
+        return version + 1
+
+    def apply_to(self, instance, target, version=None, **changes):
+        """
+        ``apply`` from the instance's loaded status and ``version`` (default:
+        the version it was loaded at), then update the instance to match.
+        """
+        source = getattr(instance, '_loaded_status', getattr(instance, self.field))
+        if version is None:
+            version = getattr(instance, '_loaded_version', instance.version)
+        changes = self.with_timestamps(changes)
+        instance.version = self.apply(instance.pk, source, version, target, **changes)
+        instance._loaded_version = instance.version
+        setattr(instance, self.field, target)
+        instance._loaded_status = target
+        for name, value in changes.items():
+            setattr(instance, name, value)
+        return instance
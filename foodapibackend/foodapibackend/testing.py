@@ -0,0 +1,192 @@
+"""
+Test harness for per-endpoint query budgets and SQLite query plans.
+
+``QueryBudgetTestCase.request`` performs an API call, asserts its exact
+query count and optionally runs ``EXPLAIN QUERY PLAN`` on every SELECT it
+issued, failing on full table scans. Each call adds a row (queries, time,
+rows returned) to a report printed when the test class finishes.
+"""
+import re
+import sys
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def seed_marketplace(restaurants=20, menu_items=15, customers=10, reviews_per_restaurant=25,
+                     orders_per_customer=30, lines_per_order=3, agents=10):
+    """
+    Bulk-create a marketplace large enough that an N+1 shows up as hundreds
+    of queries. Returns the created objects in a namespace.
+    """
+    from accounts.models import User
+    from delivery.geo import GEOHASH_PRECISION, geohash_encode
+    from delivery.models import Delivery, DeliveryAgentLocation, DeliveryStatusUpdate
+    from restaurant.models import MenuItem, Order, OrderItem, Restaurant, Review
+    from restaurant.ratings import rebuild_rating_aggregates
+
+    owners = User.objects.bulk_create([
+        User(email=f'owner{i}@example.com', role='owner') for i in range(restaurants)
+    ])
+    customer_users = User.objects.bulk_create([
+        User(email=f'customer{i}@example.com', role='customer') for i in range(customers)
+    ])
+    agent_users = User.objects.bulk_create([
+        User(email=f'agent{i}@example.com', role='delivery_agent') for i in range(agents)
+    ])
+    DeliveryAgentLocation.objects.bulk_create([
+        DeliveryAgentLocation(agent=agent, latitude=-1.28 + i / 1000, longitude=36.81)
+        for i, agent in enumerate(agent_users)
+    ])
+    restaurant_rows = Restaurant.objects.bulk_create([
+        Restaurant(user=owner, name=f'Restaurant {i}', address=f'{i} Moi Avenue', contact_number='0700000000',
+                   latitude=-1.2833 + i / 100, longitude=36.8167 + i / 100,
+                   geohash=geohash_encode(-1.2833 + i / 100, 36.8167 + i / 100, GEOHASH_PRECISION))
+        for i, owner in enumerate(owners)
+    ])
+    menu = MenuItem.objects.bulk_create([
+        MenuItem(restaurant=restaurant, name=f'Dish {j}', price=100 + j)
+        for restaurant in restaurant_rows for j in range(menu_items)
+    ])
+    Review.objects.bulk_create([
+        Review(restaurant=restaurant, customer=customer_users[j % customers], rating=1 + j % 5)
+        for restaurant in restaurant_rows for j in range(reviews_per_restaurant)
+    ])
+    rebuild_rating_aggregates()
+
+    restaurant = restaurant_rows[0]
+    restaurant_menu = [item for item in menu if item.restaurant_id == restaurant.pk]
+    orders = Order.objects.bulk_create([
+        Order(customer=customer, restaurant=restaurant, total_price=lines_per_order * 100,
+              delivery_agent=agent_users[i % agents])
+        for customer in customer_users for i in range(orders_per_customer)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menu_item=restaurant_menu[j], quantity=1, price=restaurant_menu[j].price)
+        for order in orders for j in range(lines_per_order)
+    ])
+    deliveries = [
+        Delivery(order=order, delivery_agent=order.delivery_agent, delivery_address='Kenyatta Avenue',
+                 pickup_location='-1.2833, 36.8167', dropoff_location='-1.2921, 36.8219', status='assigned')
+        for order in orders
+    ]
+    for delivery in deliveries:
+        delivery.sync_coordinates()
+    Delivery.objects.bulk_create(deliveries)
+    DeliveryStatusUpdate.objects.bulk_create([
+        DeliveryStatusUpdate(delivery=delivery, status=status, updated_by=delivery.delivery_agent)
+        for delivery in deliveries for status in ('pending', 'assigned')
+    ])
+    return SimpleNamespace(
+        owners=owners, customers=customer_users, agents=agent_users, restaurants=restaurant_rows,
+        restaurant=restaurant, menu=restaurant_menu, orders=orders, deliveries=deliveries,
+    )
+
+
+def full_scans(sql_statements, allow=()):
+    """
+    Run EXPLAIN QUERY PLAN for each SELECT and return ``(table, sql)`` for
+    every full table scan outside ``allow``. Only meaningful on SQLite.
+    """
+    scans = []
+    with connection.cursor() as cursor:
+        for sql in sql_statements:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            for row in cursor.fetchall():
+                match = FULL_SCAN.match(row[-1])
+                if match and match.group(1) not in allow:
+                    scans.append((match.group(1), sql))
+    return scans
+
+
+def result_rows(data):
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return len(data['results'])
+    if isinstance(data, list):
+        return len(data)
+    return 1 if data else 0
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    DELIVERY_LOCATION_FLUSH_SECONDS=0,
+    DELIVERY_TRACKING_WINDOW_SECONDS=0,
+    DELIVERY_DISPATCHER={'IN_PROCESS_WORKER': False},
+    PUSH_NOTIFICATIONS={'TRANSPORT': 'delivery.notifications.FakeTransport'},
+    DELIVERY_OUTBOX={'IN_PROCESS_WORKER': False},
+)
+class QueryBudgetTestCase(TestCase):
+    """
+    Base class for endpoint query-budget tests. Requests authenticate with a
+    real JWT against a warm user cache, so authentication costs no query.
+    """
+    report = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.report:
+            width = max(len(row[0]) for row in cls.report)
+            lines = [f"\n{cls.__name__}", f"{'endpoint':<{width}} {'status':>6} {'queries':>7} {'ms':>8} {'rows':>5}"]
+            lines += [f"{name:<{width}} {code:>6} {queries:>7} {ms:>8.1f} {rows:>5}"
+                      for name, code, queries, ms, rows in cls.report]
+            sys.stdout.write('\n'.join(lines) + '\n')
+        super().tearDownClass()
+
+    def setUp(self):
+        from accounts.authentication import get_user_cache
+        from delivery.location_store import get_location_store
+
+        # Process-wide buffers must not carry writes from one test into the next one's budget.
+        cache.clear()
+        get_location_store().reset()
+        get_user_cache().clear()
+
+    def client_for(self, user=None):
+        from accounts.authentication import resolve_user
+
+        client = APIClient()
+        if user is not None:
+            token = AccessToken.for_user(user)
+            # Budgets are for the hot path, where the user's auth fields are already cached
+            resolve_user(token)
+            client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        return client
+
+    def request(self, method, url, queries, user=None, data=None, status=200, explain=False,
+                allow_scans=(), **extra):
+        """
+        Call ``url`` and assert the response status and exact query count.
+        With ``explain`` every SELECT must avoid full scans of tables not in ``allow_scans``.
+        """
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data, format='json', **extra)
+            elapsed = (time.perf_counter() - started) * 1000
+        statements = [query['sql'] for query in captured.captured_queries]
+        path = urlsplit(url)
+        name = f"{method.upper()} {path.path}" + (f"?{path.query}" if path.query else '')
+        self.report.append((name[:90], response.status_code, len(statements), elapsed,
+                            result_rows(getattr(response, 'data', None))))
+
+        self.assertEqual(response.status_code, status, getattr(response, 'data', response))
+        self.assertEqual(len(statements), queries, "\n".join(statements))
+        if explain and connection.vendor == 'sqlite':
+            self.assertEqual(full_scans(statements, allow_scans), [])
+        return response
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from .clients import ClientRegistry, create_firebase_app
+
+
+class ClientRegistryTests(SimpleTestCase):
+    """
+    External clients are built on first use, once per process.
+    """
+
+    def test_client_is_created_once_under_concurrent_first_use(self):
+        created = []
+
+        def factory():
+            time.sleep(0.01)
+            created.append(object())
+            return created[-1]
+
+        registry = ClientRegistry()
+        registry.register('slow', factory)
+        self.assertFalse(registry.initialized('slow'))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get('slow'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual({id(result) for result in results}, {id(created[0])})
+        registry.reset('slow')
+        self.assertIsNot(registry.get('slow'), created[0])
+
+    def test_unknown_client(self):
+        with self.assertRaises(LookupError):
+            ClientRegistry().get('missing')
+
+    @override_settings(FIREBASE_CONFIG=None)
+    def test_missing_firebase_config_fails_on_use(self):
+        import firebase_admin
+
+        if firebase_admin._apps:
+            self.skipTest("A Firebase app is already initialized in this process")
+        with self.assertRaises(ImproperlyConfigured):
+            create_firebase_app()
+
+    def test_app_starts_without_firebase_credentials(self):
+        env = {key: value for key, value in os.environ.items() if key != 'FIREBASE_CONFIG'}
+        env['DJANGO_SETTINGS_MODULE'] = 'foodapibackend.settings'
+        code = ("import sys; from foodapibackend.asgi import application; "
+                "from django.urls import get_resolver; get_resolver().url_patterns; "
+                "print(sorted(name for name in ('firebase_admin', 'scipy') if name in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
@@ -25,6 +25,7 @@ urlpatterns = [
     path('auth/', include('djoser.urls.jwt')),  # JWT Endpoints
     path('api/v1/restaurant/', include('restaurant.urls')),  # Restaurant Endpoints
     path('api/v1/', include('delivery.urls')),  # Delivery Endpoints
+    path('api/v1/accounts/', include('accounts.urls')),  # Account Endpoints
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),  # OpenAPI schema
     path('api/docs/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/docs/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
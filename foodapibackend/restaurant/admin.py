@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Restaurant, MenuItem, Order, Notification, Review
+from .models import Restaurant, MenuItem, Order, Notification, Review, IdempotencyKey
 # Register your models here.
 
 admin.site.register(Restaurant)
@@ -7,3 +7,4 @@ admin.site.register(MenuItem)
 admin.site.register(Order)
 admin.site.register(Notification)
 admin.site.register(Review)
+admin.site.register(IdempotencyKey)
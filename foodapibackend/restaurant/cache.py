@@ -0,0 +1,97 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from foodapibackend.metrics import metrics
+
+
+def version_key(restaurant_id):
+    return f"restaurant:{restaurant_id}:version"
+
+
+def get_version(restaurant_id):
+    """
+    Current cache version of a restaurant. Versions are nanosecond timestamps,
+    so one recreated after eviction never collides with payloads cached under
+    an older version.
+    """
+    key = version_key(restaurant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(restaurant_id):
+    cache.set(version_key(restaurant_id), time.time_ns(), timeout=None)
+    metrics.incr('cache.restaurant.invalidations')
+
+
+def cache_enabled():
+    """
+    Whether restaurant reads may be cached. Versions are bumped in the
+    default cache, so it has to be shared by every worker (Redis,
+    Memcached); a per-process locmem cache is only accepted with
+    ``RESTAURANT_CACHE_ALLOW_LOCAL`` for single-process deployments.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, DummyCache):
+        return False
+    if isinstance(backend, LocMemCache):
+        return getattr(settings, 'RESTAURANT_CACHE_ALLOW_LOCAL', False)
+    return True
+
+
+class VersionedCacheMixin:
+    """
+    Serve GET responses of a per-restaurant view from the cache.
+
+    Payloads are stored under the restaurant's current version, which the
+    signals in ``restaurant.signals`` bump whenever the restaurant, its menu
+    or its reviews change. Responses carry an ``ETag`` derived from the
+    version, so a GET with a matching ``If-None-Match`` gets a 304 without
+    touching the database or the serializer. There is no ``Last-Modified``:
+    its one-second resolution would answer 304 across two changes made
+    within the same second. Without a shared cache (``cache_enabled``) the
+    view is served uncached.
+    """
+    cache_name = None
+    cache_restaurant_kwarg = 'restaurant_id'
+
+    def cache_key(self, restaurant_id, version):
+        query = self.request.GET.urlencode()
+        digest = hashlib.md5(query.encode()).hexdigest()[:12] if query else '-'
+        return f"restaurant:{restaurant_id}:{version}:{self.cache_name}:{digest}"
+
+    def get(self, request, *args, **kwargs):
+        if not cache_enabled():
+            return super().get(request, *args, **kwargs)
+        restaurant_id = kwargs[self.cache_restaurant_kwarg]
+        version = get_version(restaurant_id)
+        etag = f'"{self.cache_name}-{restaurant_id}-{version}"'
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            metrics.incr('cache.restaurant.not_modified')
+            return not_modified
+
+        key = self.cache_key(restaurant_id, version)
+        data = cache.get(key)
+        if data is not None:
+            metrics.incr('cache.restaurant.hit')
+            response = Response(data)
+        else:
+            metrics.incr('cache.restaurant.miss')
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, getattr(settings, 'RESTAURANT_CACHE_TIMEOUT', 300))
+        response['ETag'] = etag
+        return response
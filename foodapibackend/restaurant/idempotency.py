@@ -0,0 +1,225 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from foodapibackend.metrics import metrics
+from .models import IdempotencyKey
+
+DEFAULTS = {
+    'STORE': 'restaurant.idempotency.DatabaseIdempotencyStore',
+    'TTL_SECONDS': 24 * 60 * 60,
+    'LOCK_SECONDS': 30,
+    'WAIT_SECONDS': 10,
+}
+
+# status_code is None while the request that claimed the key is still running.
+StoredResponse = namedtuple('StoredResponse', ['fingerprint', 'status_code', 'body'])
+
+
+class LocalMemoryIdempotencyStore:
+    """
+    Per-process store. Waiters are woken as soon as the response is saved.
+    """
+
+    def __init__(self, ttl, lock_ttl):
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self._condition = threading.Condition()
+        self._entries = {}
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def claim(self, key, fingerprint):
+        """
+        Claim ``key`` for this request. Returns None if claimed, otherwise the
+        StoredResponse already held for the key.
+        """
+        with self._condition:
+            entry = self._live(key)
+            if entry is not None:
+                return entry[0]
+            self._entries[key] = (StoredResponse(fingerprint, None, None), time.monotonic() + self.lock_ttl)
+            return None
+
+    def save(self, key, fingerprint, status_code, body):
+        with self._condition:
+            self._entries[key] = (StoredResponse(fingerprint, status_code, body), time.monotonic() + self.ttl)
+            self._condition.notify_all()
+
+    def release(self, key):
+        with self._condition:
+            self._entries.pop(key, None)
+            self._condition.notify_all()
+
+    def wait(self, key, timeout):
+        """
+        Block until the response for ``key`` is saved or released. Returns the
+        StoredResponse, or None if the key was released or ``timeout`` ran out.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                entry = self._live(key)
+                if entry is None or entry[0].status_code is not None:
+                    return entry[0] if entry else None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+
+class DatabaseIdempotencyStore:
+    """
+    Store backed by the IdempotencyKey table, shared by every worker process.
+    The unique key column makes the claim atomic; waiters poll.
+    """
+    poll_interval = 0.1
+
+    def __init__(self, ttl, lock_ttl):
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+
+    @staticmethod
+    def _stored(row):
+        return StoredResponse(row.fingerprint, row.status_code, row.response_body)
+
+    def claim(self, key, fingerprint):
+        now = timezone.now()
+        IdempotencyKey.objects.filter(key=key, expires_at__lt=now).delete()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key, fingerprint=fingerprint, expires_at=now + timedelta(seconds=self.lock_ttl),
+                )
+            return None
+        except IntegrityError:
+            row = IdempotencyKey.objects.filter(key=key).first()
+            # Released between our insert and this read: report it as still running.
+            return self._stored(row) if row else StoredResponse(fingerprint, None, None)
+
+    def save(self, key, fingerprint, status_code, body):
+        IdempotencyKey.objects.update_or_create(key=key, defaults={
+            'fingerprint': fingerprint,
+            'status_code': status_code,
+            'response_body': body,
+            'expires_at': timezone.now() + timedelta(seconds=self.ttl),
+        })
+
+    def release(self, key):
+        IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+
+    def wait(self, key, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            row = IdempotencyKey.objects.filter(key=key, expires_at__gte=timezone.now()).first()
+            if row is None or row.status_code is not None:
+                return self._stored(row) if row else None
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def purge_expired(self):
+        return IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()[0]
+
+
+def idempotency_settings():
+    return {**DEFAULTS, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = idempotency_settings()
+            _store = import_string(config['STORE'])(ttl=config['TTL_SECONDS'], lock_ttl=config['LOCK_SECONDS'])
+        return _store
+
+
+def request_fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def replay(stored):
+    metrics.incr('idempotency.replayed')
+    response = Response(stored.body, status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class IdempotencyMixin:
+    """
+    Honour an ``Idempotency-Key`` header on POST.
+
+    The first request with a key runs normally and its response is stored
+    for ``TTL_SECONDS``; retries with the same key and body get the stored
+    response back. Requests that raise (validation errors included) or
+    return a 5xx release the key, since nothing was created. A duplicate arriving while the first
+    request is still running waits up to ``WAIT_SECONDS`` for it instead of
+    executing again. Keys are scoped per user. The replay rate is
+    ``metrics.ratio('idempotency.replayed', 'idempotency.executed')``.
+    """
+
+    def post(self, request, *args, **kwargs):
+        raw_key = request.headers.get('Idempotency-Key')
+        if not raw_key:
+            return super().post(request, *args, **kwargs)
+        if len(raw_key) > 200:
+            return Response({'detail': "Idempotency-Key must be at most 200 characters."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        store = get_idempotency_store()
+        key = f"{request.user.pk}:{self.__class__.__name__}:{raw_key}"
+        fingerprint = request_fingerprint(request)
+
+        stored = store.claim(key, fingerprint)
+        if stored is not None and stored.status_code is None:
+            metrics.incr('idempotency.waited')
+            stored = store.wait(key, idempotency_settings()['WAIT_SECONDS'])
+            if stored is None:
+                # The first request failed and released the key, or is taking too long.
+                stored = store.claim(key, fingerprint)
+            if stored is not None and stored.status_code is None:
+                metrics.incr('idempotency.conflicts')
+                response = Response({'detail': "A request with this Idempotency-Key is still in progress."},
+                                    status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                metrics.incr('idempotency.mismatches')
+                return Response({'detail': "Idempotency-Key was already used with a different request body."},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return replay(stored)
+
+        metrics.incr('idempotency.executed')
+        try:
+            response = super().post(request, *args, **kwargs)
+        except BaseException:
+            store.release(key)
+            raise
+        if response.status_code >= 500:
+            store.release(key)
+        else:
+            body = json.loads(JSONRenderer().render(response.data) or b'null')
+            store.save(key, fingerprint, response.status_code, body)
+        return response
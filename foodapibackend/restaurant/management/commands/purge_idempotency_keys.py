@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.idempotency import DatabaseIdempotencyStore
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key responses from the database store."
+
+    def handle(self, *args, **options):
+        deleted = DatabaseIdempotencyStore(ttl=0, lock_ttl=0).purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.models import Restaurant
+from restaurant.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute restaurant rating sums, counts and averages from the reviews table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'restaurant_ids',
+            nargs='*',
+            type=int,
+            help="Only rebuild these restaurants (default: all).",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Restaurant.objects.all()
+        if options['restaurant_ids']:
+            queryset = queryset.filter(pk__in=options['restaurant_ids'])
+        updated = rebuild_rating_aggregates(queryset)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} restaurants"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Re-index restaurant and menu item names and descriptions for full-text search."
+
+    def handle(self, *args, **options):
+        if rebuild_search_index():
+            self.stdout.write(self.style.SUCCESS("Rebuilt the search index"))
+        else:
+            self.stdout.write("This database has no search index; search falls back to LIKE matching")
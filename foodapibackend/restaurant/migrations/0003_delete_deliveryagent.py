@@ -0,0 +1,16 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0002_alter_restaurant_user'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='DeliveryAgent',
+        ),
+    ]
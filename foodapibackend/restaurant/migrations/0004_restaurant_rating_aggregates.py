@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:10
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Restaurant = apps.get_model('restaurant', 'Restaurant')
+    Review = apps.get_model('restaurant', 'Review')
+    reviews = Review.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+    total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0, output_field=IntegerField())
+    count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), 0, output_field=IntegerField())
+    Restaurant.objects.update(
+        rating_sum=total,
+        rating_count=count,
+        rating=Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0), output_field=FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0003_delete_deliveryagent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
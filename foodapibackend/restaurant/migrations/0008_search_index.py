@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# External-content FTS5 tables over the name and description of restaurants
+# and menu items, keyed by the row's id. Triggers keep them in sync with
+# every write, including bulk_create, QuerySet.update and raw SQL; updates
+# that don't touch the indexed columns (price, availability) skip the index.
+# ``prefix`` adds 2- and 3-character prefix indexes so autocomplete queries
+# don't scan every term, and ``rank`` weights a name match over a
+# description match.
+SEARCH_INDEXES = {
+    'restaurant_restaurant': 'restaurant_restaurant_fts',
+    'restaurant_menuitem': 'restaurant_menuitem_fts',
+}
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE {fts} USING fts5(
+        name, description, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    "INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    """
+    CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER {fts}_update AFTER UPDATE OF name, description ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {fts}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS {fts}_insert",
+    "DROP TRIGGER IF EXISTS {fts}_delete",
+    "DROP TRIGGER IF EXISTS {fts}_update",
+    "DROP TABLE IF EXISTS {fts}",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Other databases fall back to unranked LIKE matching in restaurant.search
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for table, fts in SEARCH_INDEXES.items():
+            for statement in statements:
+                schema_editor.execute(statement.format(table=table, fts=fts))
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_restaurant_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
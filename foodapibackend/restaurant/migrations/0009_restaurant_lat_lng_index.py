@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['latitude', 'longitude'], name='restaurant_lat_lng_idx'),
+        ),
+    ]
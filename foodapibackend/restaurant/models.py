@@ -1,15 +1,46 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from accounts.models import User
+from delivery.geo import GEOHASH_PRECISION, geohash_encode
+from foodapibackend.statemachine import VersionedModel
 
 class Restaurant(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='owner')
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     address = models.TextField()
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     contact_number = models.CharField(max_length=15)
     rating = models.FloatField(default=0.0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Bounding-box prefilter of nearby searches: a latitude range, longitude checked in the index
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='restaurant_lat_lng_idx'),
+        ]
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0.0
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    def save(self, *args, update_fields=None, **kwargs):
+        coords = self.coordinates
+        self.geohash = geohash_encode(*coords, GEOHASH_PRECISION) if coords else ''
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            update_fields = [*update_fields, 'geohash']
+        super().save(*args, update_fields=update_fields, **kwargs)
+
 
 class MenuItem(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='menu_items')
@@ -20,7 +51,7 @@ class MenuItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-class Order(models.Model):
+class Order(VersionedModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('accepted', 'Accepted'),
@@ -38,6 +69,26 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Keyset pagination of each role's order list on (created_at, id)
+        indexes = [
+            models.Index(fields=['customer', 'created_at', 'id'], name='order_customer_created_idx'),
+            models.Index(fields=['restaurant', 'created_at', 'id'], name='order_restaurant_created_idx'),
+            models.Index(fields=['delivery_agent', 'created_at', 'id'], name='order_agent_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the stored status so saves can tell a status change apart from other edits.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.__dict__.get('status')
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -54,10 +105,39 @@ class Notification(models.Model):
 class Review(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='reviews')
-    rating = models.IntegerField()
+    rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'created_at', 'id'], name='review_restaurant_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember what was stored so edits can adjust the restaurant aggregates by the difference.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = (instance.__dict__.get('restaurant_id'), instance.__dict__.get('rating'))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or {'rating', 'restaurant', 'restaurant_id'} & set(fields):
+            self._loaded_rating = (self.__dict__.get('restaurant_id'), self.__dict__.get('rating'))
+
+class IdempotencyKey(models.Model):
+    """
+    Response stored for an ``Idempotency-Key`` request. ``status_code`` is
+    null while the first request is still running.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
 # class DeliveryAgent(models.Model):
 #     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='delivery_agent')
 #     vehicle_details = models.CharField(max_length=255, blank=True, null=True)
@@ -0,0 +1,57 @@
+"""
+Restaurants within a radius, without a spatial database extension.
+
+A bounding box around the query point is matched against the
+``(latitude, longitude)`` index, reading only ids and coordinates. The few
+rows inside the box are refined with haversine, which drops the box's
+corners, and sorted by distance. Callers paginate the sorted ``(distance,
+id)`` pairs and load full rows for one page only.
+"""
+import time
+
+from django.db.models import Q
+
+from delivery.geo import bounding_box, haversine
+from foodapibackend.metrics import metrics
+
+from .models import Restaurant
+
+
+def within_box(queryset, lat, lng, radius_km):
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lng <= max_lng:
+        return queryset.filter(longitude__gte=min_lng, longitude__lte=max_lng)
+    return queryset.filter(Q(longitude__gte=min_lng) | Q(longitude__lte=max_lng))
+
+
+def nearby_restaurant_ids(lat, lng, radius_km, queryset=None):
+    """
+    ``(distance_km, restaurant_id)`` for every restaurant within ``radius_km``, nearest first.
+    """
+    started = time.perf_counter()
+    queryset = Restaurant.objects.all() if queryset is None else queryset
+    candidates = within_box(queryset, lat, lng, radius_km).values_list('id', 'latitude', 'longitude')
+    results = []
+    for restaurant_id, restaurant_lat, restaurant_lng in candidates:
+        distance = haversine(lat, lng, restaurant_lat, restaurant_lng)
+        if distance <= radius_km:
+            results.append((distance, restaurant_id))
+    results.sort()
+    metrics.observe('nearby.candidates', len(candidates))
+    metrics.observe('nearby.seconds', time.perf_counter() - started)
+    return results
+
+
+def load_page(page):
+    """
+    Restaurants for a page of ``(distance_km, id)`` pairs, in order, each with ``distance_km`` set.
+    """
+    restaurants = Restaurant.objects.in_bulk([restaurant_id for _, restaurant_id in page])
+    loaded = []
+    for distance, restaurant_id in page:
+        restaurant = restaurants.get(restaurant_id)
+        if restaurant is not None:
+            restaurant.distance_km = distance
+            loaded.append(restaurant)
+    return loaded
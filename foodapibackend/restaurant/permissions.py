@@ -11,8 +11,9 @@ class IsOwnerOrReadOnly(IsAuthenticatedOrReadOnly):
     def has_object_permission(self, request, view, obj):
         if request.method in ['GET', 'HEAD', 'OPTIONS']:
             return True
-        # Check if the menu item's restaurant's user matches the request user
-        return obj.restaurant.user == request.user and request.user.role == 'owner'
+        # Check if the restaurant (or the menu item's restaurant) belongs to the request user
+        restaurant = getattr(obj, 'restaurant', obj)
+        return restaurant.user_id == request.user.pk and request.user.role == 'owner'
 
 class IsCustomer(IsAuthenticated):
     def has_permission(self, request, view):
@@ -0,0 +1,41 @@
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Restaurant, Review
+
+
+def average_expression(rating_sum, rating_count):
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_change(restaurant_id, sum_delta, count_delta):
+    """
+    Shift a restaurant's rating aggregates in a single UPDATE. The right-hand
+    sides read the pre-update row, so ``rating`` is derived from the new totals.
+    """
+    if not sum_delta and not count_delta:
+        return
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    Restaurant.objects.filter(pk=restaurant_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating=average_expression(new_sum, new_count),
+    )
+
+
+def rebuild_rating_aggregates(queryset=None):
+    """
+    Recompute ``rating_sum``, ``rating_count`` and ``rating`` from the reviews
+    table with one UPDATE over ``queryset`` (all restaurants by default).
+    Returns the number of restaurants updated.
+    """
+    queryset = Restaurant.objects.all() if queryset is None else queryset
+    reviews = Review.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+    total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0, output_field=IntegerField())
+    count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), 0, output_field=IntegerField())
+    return queryset.update(rating_sum=total, rating_count=count, rating=average_expression(total, count))
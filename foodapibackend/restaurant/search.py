@@ -0,0 +1,173 @@
+"""
+Full-text search over restaurants and menu items.
+
+On SQLite the FTS5 tables created in migration 0008 are the index: triggers
+keep them in step with every write, and a query walks only the posting
+lists of its terms, so its cost follows the number of matches rather than
+the size of the catalog. Results are ordered by bm25 with name matches
+weighted over description matches. The last term of a query also matches
+as a prefix, which is what autocomplete needs.
+
+Finding matches is cheap, scoring them is not: bm25 runs once per match,
+so a common word or a two-letter prefix would cost time proportional to
+the catalog. Ranking is therefore bounded, in two passes:
+
+1. rows whose name matches every term: the ``MAX_CANDIDATES`` newest
+   (by id, which the index walks backwards for free) are ranked first;
+2. the rest of the matches fill the remaining places, again ranking only
+   the ``MAX_CANDIDATES`` newest.
+
+Price and availability filters apply while picking those candidates, so
+a filter never empties a window that older matches would have filled.
+The cost is recall on very common queries: beyond ``MAX_CANDIDATES``
+matches in a pass, older rows are not considered at all.
+
+Other databases fall back to an unranked ``icontains`` filter.
+"""
+import re
+import time
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import F, Q
+
+from foodapibackend.metrics import metrics
+
+from .models import MenuItem, Restaurant
+
+RESTAURANT_INDEX = 'restaurant_restaurant_fts'
+MENU_ITEM_INDEX = 'restaurant_menuitem_fts'
+
+DEFAULTS = {
+    'MAX_CANDIDATES': 2000,
+}
+
+TERM_RE = re.compile(r'\w+')
+
+
+def search_settings():
+    return {**DEFAULTS, **getattr(settings, 'RESTAURANT_SEARCH', {})}
+
+
+def search_terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+def match_expression(terms, prefix=True):
+    """
+    FTS5 query matching every term, the last one also as a prefix. Terms
+    are quoted, so user input never reaches the FTS5 query syntax.
+    """
+    expression = ' '.join(f'"{term}"' for term in terms)
+    return expression + '*' if prefix else expression
+
+
+def uses_fts(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def ranked(model, select, index, joins, expression, limit, filters=(), params=()):
+    """
+    Up to ``limit`` rows of ``model`` matching the FTS5 ``expression`` and the
+    SQL ``filters``, best first: full name matches, then the others, each
+    ranked within its newest ``MAX_CANDIDATES`` candidates. ``joins`` and
+    ``filters`` are repeated in the candidate window, so they must only use
+    their own aliases.
+    """
+    window = search_settings()['MAX_CANDIDATES']
+    results = []
+    for pass_expression, excluded in ((f'name : ({expression})', False), (expression, True)):
+        where = [*filters]
+        where_params = [*params]
+        if excluded and results:
+            where.append(f"{index}.rowid NOT IN ({', '.join(['%s'] * len(results))})")
+            where_params += [row.pk for row in results]
+        conditions = ''.join(f" AND {condition}" for condition in where)
+        results += model.objects.raw(
+            f"SELECT {select} FROM {index} {joins} WHERE {index} MATCH %s{conditions} "
+            f"AND {index}.rowid >= coalesce((SELECT {index}.rowid FROM {index} {joins} "
+            f"WHERE {index} MATCH %s{conditions} ORDER BY {index}.rowid DESC LIMIT 1 OFFSET %s), 0) "
+            f"ORDER BY {index}.rank LIMIT %s",
+            [pass_expression, *where_params, pass_expression, *where_params, window - 1, limit - len(results)],
+        )
+        if len(results) >= limit:
+            break
+    return results
+
+
+def search_restaurants(query, limit=20, prefix=True):
+    """
+    Best-ranked restaurants whose name or description match ``query``.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    started = time.perf_counter()
+    if uses_fts():
+        results = ranked(
+            Restaurant, 'r.*', RESTAURANT_INDEX, f"JOIN restaurant_restaurant r ON r.id = {RESTAURANT_INDEX}.rowid",
+            match_expression(terms, prefix), limit,
+        )
+    else:
+        results = list(Restaurant.objects.filter(_contains_all(terms)).order_by('name', 'id')[:limit])
+    metrics.observe('search.seconds', time.perf_counter() - started)
+    return results
+
+
+def search_menu_items(query, limit=20, prefix=True, min_price=None, max_price=None, is_available=None):
+    """
+    Best-ranked menu items matching ``query`` within the given price range
+    and availability. Each item carries its ``restaurant_name``.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    started = time.perf_counter()
+    if uses_fts():
+        filters, params = [], []
+        if min_price is not None:
+            filters.append("m.price >= %s")
+            params.append(min_price)
+        if max_price is not None:
+            filters.append("m.price <= %s")
+            params.append(max_price)
+        if is_available is not None:
+            filters.append("m.is_available = %s")
+            params.append(is_available)
+        results = ranked(
+            MenuItem, 'm.*, r.name AS restaurant_name', MENU_ITEM_INDEX,
+            f"JOIN restaurant_menuitem m ON m.id = {MENU_ITEM_INDEX}.rowid "
+            f"JOIN restaurant_restaurant r ON r.id = m.restaurant_id",
+            match_expression(terms, prefix), limit, filters, params,
+        )
+    else:
+        queryset = MenuItem.objects.filter(_contains_all(terms)).annotate(restaurant_name=F('restaurant__name'))
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if is_available is not None:
+            queryset = queryset.filter(is_available=is_available)
+        results = list(queryset.order_by('name', 'id')[:limit])
+    metrics.observe('search.seconds', time.perf_counter() - started)
+    return results
+
+
+def _contains_all(terms):
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(description__icontains=term)
+    return condition
+
+
+def rebuild_search_index():
+    """
+    Re-index every restaurant and menu item from their tables (after a
+    restore, or writes made with the triggers dropped).
+    """
+    if not uses_fts():
+        return False
+    with connection.cursor() as cursor:
+        for index in (RESTAURANT_INDEX, MENU_ITEM_INDEX):
+            cursor.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+    return True
@@ -1,4 +1,10 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
+
+from foodapibackend.fieldsets import SparseFieldsetsMixin
 from .models import Restaurant, MenuItem, Order, OrderItem, Review
 
 class MenuItemCreateSerializer(serializers.ModelSerializer):
@@ -6,7 +12,7 @@ class MenuItemCreateSerializer(serializers.ModelSerializer):
         model = MenuItem
         fields = ['name', 'description', 'price', 'is_available']
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = MenuItem
         fields = ['id', 'name', 'description', 'price', 'is_available', 'created_at', 'updated_at']
@@ -28,8 +34,9 @@ class ReviewCreateSerializer(serializers.ModelSerializer):
         )
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     customer_email = serializers.EmailField(source='customer.email', read_only=True)
+    select_related_fields = {'customer_email': ['customer']}
 
     class Meta:
         model = Review
@@ -37,17 +44,16 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at']
 
 class OrderItemCreateSerializer(serializers.ModelSerializer):
+    # Resolved in bulk by OrderCreateSerializer.validate instead of one query per line.
+    menu_item = serializers.IntegerField()
+
     class Meta:
         model = OrderItem
         fields = ['menu_item', 'quantity']
 
-    def validate_menu_item(self, value):
-        if not value.is_available:
-            raise serializers.ValidationError("This menu item is currently unavailable")
-        return value
-
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     menu_item_name = serializers.CharField(source='menu_item.name', read_only=True)
+    select_related_fields = {'menu_item_name': ['menu_item']}
     
     class Meta:
         model = OrderItem
@@ -55,12 +61,35 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['price']
 
 class OrderCreateSerializer(serializers.ModelSerializer):
-    order_items = OrderItemCreateSerializer(many=True)
+    order_items = OrderItemCreateSerializer(many=True, allow_empty=False)
 
     class Meta:
         model = Order
         fields = ['restaurant', 'order_items']
 
+    def validate(self, attrs):
+        """
+        Load every referenced menu item in one query and check that each one
+        exists, is available and belongs to the ordered restaurant.
+        """
+        order_items = attrs['order_items']
+        menu_items = MenuItem.objects.in_bulk({item['menu_item'] for item in order_items})
+        errors = []
+        for item in order_items:
+            menu_item = menu_items.get(item['menu_item'])
+            if menu_item is None:
+                errors.append({'menu_item': [f"Invalid pk \"{item['menu_item']}\" - object does not exist."]})
+            elif menu_item.restaurant_id != attrs['restaurant'].pk:
+                errors.append({'menu_item': ["This menu item belongs to a different restaurant"]})
+            elif not menu_item.is_available:
+                errors.append({'menu_item': ["This menu item is currently unavailable"]})
+            else:
+                errors.append({})
+                item['menu_item'] = menu_item
+        if any(errors):
+            raise serializers.ValidationError({'order_items': errors})
+        return attrs
+
     def create(self, validated_data):
         order_items_data = validated_data.pop('order_items')
         user = self.context['request'].user
@@ -73,42 +102,48 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             for item in order_items_data
         )
 
-        # Create order
-        order = Order.objects.create(
-            customer=user,
-            total_price=total_price,
-            **validated_data
-        )
-
-        # Create order items
-        for item_data in order_items_data:
-            OrderItem.objects.create(
-                order=order,
-                price=item_data['menu_item'].price,
-                **item_data
+        # Create the order and all of its items together or not at all
+        with transaction.atomic():
+            order = Order.objects.create(
+                customer=user,
+                total_price=total_price,
+                **validated_data
             )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, price=item_data['menu_item'].price, **item_data)
+                for item_data in order_items_data
+            ])
 
         return order
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
     customer_email = serializers.EmailField(source='customer.email', read_only=True)
     delivery_agent_email = serializers.EmailField(source='delivery_agent.email', read_only=True)
     restaurant_name = serializers.CharField(source='restaurant.name', read_only=True)
+    select_related_fields = {
+        'customer_email': ['customer'],
+        'delivery_agent_email': ['delivery_agent'],
+        'restaurant_name': ['restaurant'],
+    }
+    prefetch_related_fields = {
+        'order_items': [Prefetch('order_items', queryset=OrderItem.objects.select_related('menu_item'))],
+    }
 
     class Meta:
         model = Order
         fields = ['id', 'customer_email', 'restaurant_name', 'delivery_agent_email',
                  'status', 'total_price', 'created_at', 'updated_at', 'order_items']
         read_only_fields = ['total_price', 'created_at', 'updated_at']
+        expandable_fields = ['order_items']
 
 class RestaurantCreateSerializer(serializers.ModelSerializer):
     menu_items = MenuItemCreateSerializer(many=True, required=False)
 
     class Meta:
         model = Restaurant
-        fields = ['name', 'description', 'address', 'contact_number', 'menu_items']
+        fields = ['name', 'description', 'address', 'latitude', 'longitude', 'contact_number', 'menu_items']
 
     def create(self, validated_data):
         menu_items_data = validated_data.pop('menu_items', [])
@@ -125,28 +160,82 @@ class RestaurantCreateSerializer(serializers.ModelSerializer):
 class RestaurantUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Restaurant
-        fields = ['name', 'description', 'address', 'contact_number']
+        fields = ['name', 'description', 'address', 'latitude', 'longitude', 'contact_number']
 
     def validate_contact_number(self, value):
         if not value.replace('+', '').replace('-', '').isdigit():
             raise serializers.ValidationError("Contact number must contain only digits, '+', and '-'")
         return value
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     menu_items = MenuItemSerializer(many=True, read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
     owner_email = serializers.EmailField(source='user.email', read_only=True)
-    average_rating = serializers.SerializerMethodField()
+    average_rating = serializers.FloatField(read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
+    select_related_fields = {'owner_email': ['user']}
+    prefetch_related_fields = {
+        'menu_items': ['menu_items'],
+        'reviews': [Prefetch('reviews', queryset=Review.objects.select_related('customer'))],
+    }
 
     class Meta:
         model = Restaurant
-        fields = ['id', 'name', 'description', 'address', 'contact_number',
+        fields = ['id', 'name', 'description', 'address', 'latitude', 'longitude', 'contact_number',
                  'rating', 'created_at', 'owner_email', 'menu_items',
-                 'reviews', 'average_rating']
+                 'reviews', 'average_rating', 'review_count']
         read_only_fields = ['rating', 'created_at']
+        expandable_fields = ['menu_items', 'reviews']
+
 
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if not reviews:
-            return 0.0
-        return sum(review.rating for review in reviews) / len(reviews)
+class RestaurantSummarySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Lightweight representation for browse screens: no nested lists.
+    """
+    average_rating = serializers.FloatField(read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
+
+    class Meta:
+        model = Restaurant
+        fields = ['id', 'name', 'address', 'latitude', 'longitude', 'rating', 'average_rating', 'review_count']
+
+
+class NearbyRestaurantSerializer(RestaurantSummarySerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(RestaurantSummarySerializer.Meta):
+        fields = RestaurantSummarySerializer.Meta.fields + ['distance_km']
+
+
+class NearbyQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the nearby restaurants endpoint.
+    """
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(min_value=0, max_value=50, default=5)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the search endpoint.
+    """
+    q = serializers.CharField(max_length=200, trim_whitespace=True)
+    prefix = serializers.BooleanField(default=True)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    available = serializers.BooleanField(required=False, allow_null=True, default=None)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+
+    def validate(self, attrs):
+        if 'min_price' in attrs and 'max_price' in attrs and attrs['min_price'] > attrs['max_price']:
+            raise serializers.ValidationError({'max_price': ["Must not be below min_price"]})
+        return attrs
+
+
+class MenuItemSearchResultSerializer(serializers.ModelSerializer):
+    restaurant_name = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = MenuItem
+        fields = ['id', 'restaurant', 'restaurant_name', 'name', 'description', 'price', 'is_available']
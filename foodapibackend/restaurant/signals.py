@@ -0,0 +1,62 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .models import MenuItem, Order, Restaurant, Review
+from .ratings import apply_rating_change
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        apply_rating_change(instance.restaurant_id, instance.rating, 1)
+    else:
+        restaurant_id, rating = getattr(instance, '_loaded_rating', (None, None))
+        if rating is None:
+            # Loaded without the rating column; let rebuild_ratings repair it.
+            return
+        if restaurant_id == instance.restaurant_id:
+            apply_rating_change(instance.restaurant_id, instance.rating - rating, 0)
+        else:
+            apply_rating_change(restaurant_id, -rating, -1)
+            apply_rating_change(instance.restaurant_id, instance.rating, 1)
+    instance._loaded_rating = (instance.restaurant_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Restaurant):
+        # The restaurant itself is being deleted along with its reviews.
+        return
+    restaurant_id, rating = getattr(instance, '_loaded_rating', (instance.restaurant_id, instance.rating))
+    apply_rating_change(restaurant_id, -rating, -1)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_cache(sender, instance, **kwargs):
+    bump_version(instance.pk)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_restaurant_cache_for_child(sender, instance, **kwargs):
+    bump_version(instance.restaurant_id)
+
+
+@receiver(post_save, sender=Order)
+def record_order_status_change(sender, instance, created, raw=False, **kwargs):
+    from delivery.outbox import ORDER_STATUS_CHANGED, record
+
+    if raw or created or instance.status == getattr(instance, '_loaded_status', instance.status):
+        return
+    record(ORDER_STATUS_CHANGED, instance.pk, {
+        'order_id': instance.pk,
+        'status': instance.status,
+        'previous_status': instance._loaded_status,
+    })
+    instance._loaded_status = instance.status
@@ -1,3 +1,396 @@
-from django.test import TestCase
+import hashlib
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User
+from delivery.geo import GEOHASH_PRECISION, geohash_encode
+from foodapibackend.testing import QueryBudgetTestCase, seed_marketplace
+
+from .idempotency import LocalMemoryIdempotencyStore
+from .models import IdempotencyKey, MenuItem, Order, Restaurant, Review
+from .nearby import nearby_restaurant_ids
+from .search import search_menu_items, search_restaurants
+from .views import OrderCreateView
+
+
+class RestaurantQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Query budgets for the restaurant, menu, order and review endpoints.
+    Authentication hits the warm user cache.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace()
+        cls.restaurant = cls.data.restaurant
+        cls.owner = cls.restaurant.user
+        cls.customer = cls.data.customers[0]
+        cls.agent = cls.data.agents[0]
+
+    def test_restaurant_list(self):
+        self.request('get', '/api/v1/restaurant/all/', queries=4, explain=True,
+                     allow_scans=('restaurant_restaurant',))
+
+    def test_restaurant_list_summary(self):
+        self.request('get', '/api/v1/restaurant/all/?mode=summary', queries=2, explain=True,
+                     allow_scans=('restaurant_restaurant',))
+
+    @override_settings(RESTAURANT_CACHE_ALLOW_LOCAL=True)
+    def test_restaurant_detail_is_cached(self):
+        url = f'/api/v1/restaurant/{self.restaurant.pk}/'
+        first = self.request('get', url, queries=3, explain=True)
+        self.request('get', url, queries=0)
+        self.request('get', url, queries=0, status=304, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertNotIn('Last-Modified', first)
+
+    @override_settings(RESTAURANT_CACHE_ALLOW_LOCAL=True)
+    def test_etag_changes_with_every_bump(self):
+        url = f'/api/v1/restaurant/{self.restaurant.pk}/'
+        first = self.request('get', url, queries=3)
+        self.restaurant.save()
+        # Same second, new version: the old validator no longer matches
+        second = self.request('get', url, queries=3, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_restaurant_detail_is_not_cached_in_a_process_local_cache(self):
+        url = f'/api/v1/restaurant/{self.restaurant.pk}/'
+        first = self.request('get', url, queries=3)
+        self.request('get', url, queries=3)
+        self.assertNotIn('ETag', first)
+
+    def test_restaurant_create(self):
+        owner = User.objects.create(email='new-owner@example.com', role='owner')
+        self.request('post', '/api/v1/restaurant/create/', queries=4, user=owner, status=201, data={
+            'name': 'New', 'address': 'Tom Mboya Street', 'contact_number': '0711111111',
+            'latitude': -1.2841, 'longitude': 36.8233, 'menu_items': [{'name': 'Chapati', 'price': '20.00'}],
+        })
+        self.assertEqual(owner.owner.geohash, geohash_encode(-1.2841, 36.8233, GEOHASH_PRECISION))
+
+    def test_restaurant_update(self):
+        self.request('patch', f'/api/v1/restaurant/{self.restaurant.pk}/update/', queries=4, user=self.owner,
+                     data={'name': 'Renamed'})
+
+    def test_restaurant_delete(self):
+        restaurant = self.data.restaurants[-1]
+        self.request('delete', f'/api/v1/restaurant/{restaurant.pk}/delete/', queries=9, user=restaurant.user,
+                     status=204)
+
+    @override_settings(RESTAURANT_CACHE_ALLOW_LOCAL=True)
+    def test_menu_list_is_cached(self):
+        url = f'/api/v1/restaurant/{self.restaurant.pk}/menu-items/'
+        self.request('get', url, queries=1, explain=True)
+        self.request('get', url, queries=0)
+
+    def test_menu_item_create(self):
+        self.request('post', f'/api/v1/restaurant/{self.restaurant.pk}/menu-items/create/', queries=2,
+                     user=self.owner, status=201, data={'name': 'Samosa', 'price': '50.00'})
+
+    def test_menu_item_update(self):
+        item = self.data.menu[0]
+        self.request('patch', f'/api/v1/restaurant/menu-items/{item.pk}/update/', queries=5, user=self.owner,
+                     data={'price': '120.00'})
+
+    def test_menu_item_delete(self):
+        item = MenuItem.objects.create(restaurant=self.restaurant, name='Unused', price=1)
+        self.request('delete', f'/api/v1/restaurant/menu-items/{item.pk}/delete/', queries=5, user=self.owner,
+                     status=204)
+
+    def test_order_list(self):
+        self.request('get', '/api/v1/restaurant/orders/', queries=2, user=self.customer, explain=True)
+        self.request('get', '/api/v1/restaurant/orders/', queries=2, user=self.owner, explain=True)
+        self.request('get', '/api/v1/restaurant/orders/', queries=2, user=self.agent, explain=True)
+
+    def test_order_list_deep_page_costs_the_same(self):
+        url = '/api/v1/restaurant/orders/?page_size=5'
+        for _ in range(4):
+            url = self.request('get', url, queries=2, user=self.customer, explain=True).data['next']
+
+    def test_order_detail(self):
+        order = Order.objects.filter(customer=self.customer).first()
+        self.request('get', f'/api/v1/restaurant/orders/{order.pk}/', queries=2, user=self.customer, explain=True)
+
+    def test_order_create(self):
+        self.request('post', '/api/v1/restaurant/orders/create/', queries=8, user=self.customer, status=201, data={
+            'restaurant': self.restaurant.pk,
+            'order_items': [{'menu_item': item.pk, 'quantity': 2} for item in self.data.menu[:10]],
+        })
+
+    def test_review_list(self):
+        self.request('get', f'/api/v1/restaurant/{self.restaurant.pk}/reviews/', queries=1, explain=True)
+
+    def test_review_create(self):
+        self.request('post', f'/api/v1/restaurant/{self.restaurant.pk}/reviews/create/', queries=2,
+                     user=self.customer, status=201, data={'rating': 4, 'comment': 'Good'})
+        self.restaurant.refresh_from_db()
+        self.assertEqual(self.restaurant.rating_count, Review.objects.filter(restaurant=self.restaurant).count())
+
+    def test_review_rating_out_of_range_is_rejected(self):
+        before = Restaurant.objects.values_list('rating_sum', 'rating_count').get(pk=self.restaurant.pk)
+        for rating in (0, -3, 6):
+            response = self.request('post', f'/api/v1/restaurant/{self.restaurant.pk}/reviews/create/', queries=0,
+                                    user=self.customer, status=400, data={'rating': rating})
+            self.assertIn('rating', response.data)
+        self.assertEqual(Restaurant.objects.values_list('rating_sum', 'rating_count').get(pk=self.restaurant.pk),
+                         before)
+
+    def test_owner_review_list(self):
+        self.request('get', '/api/v1/restaurant/my-restaurant/reviews/', queries=1, user=self.owner, explain=True)
+
+    def test_restaurant_list_sparse_fields_skip_prefetches(self):
+        response = self.request('get', '/api/v1/restaurant/all/?fields=id,name,rating', queries=2, explain=True,
+                                allow_scans=('restaurant_restaurant',))
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'rating'})
+
+    def test_restaurant_detail_expand(self):
+        url = f'/api/v1/restaurant/{self.restaurant.pk}/?fields=id,name&expand=menu_items'
+        response = self.request('get', url, queries=2, explain=True)
+        self.assertEqual(set(response.data), {'id', 'name', 'menu_items'})
+        response = self.request('get', f'/api/v1/restaurant/{self.restaurant.pk}/?expand=menu_items', queries=2)
+        self.assertIn('owner_email', response.data)
+        self.assertNotIn('reviews', response.data)
+
+    def test_order_list_sparse_fields(self):
+        response = self.request('get', '/api/v1/restaurant/orders/?fields=id,status,total_price', queries=1,
+                                user=self.customer, explain=True)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status', 'total_price'})
+
+    def test_nearby(self):
+        response = self.request('get', '/api/v1/restaurant/nearby/?lat=-1.2833&lng=36.8167&radius_km=5', queries=2,
+                                explain=True)
+        self.assertEqual([row['name'] for row in response.data['results']],
+                         [f'Restaurant {i}' for i in range(4)])
+        self.request('get', '/api/v1/restaurant/nearby/?lat=-1.2833', queries=0, status=400)
+
+    def test_search(self):
+        # No restaurant name matches, so restaurants take both ranking passes; menu name matches fill the page
+        response = self.request('get', '/api/v1/restaurant/search/?q=dish+1&max_price=110', queries=3, explain=True)
+        self.assertTrue(response.data['menu_items'])
+        self.assertTrue(all(float(item['price']) <= 110 for item in response.data['menu_items']))
+
+
+class IdempotencyTests(QueryBudgetTestCase):
+    """
+    Order placement with an Idempotency-Key runs once per key and body.
+    """
+    url = '/api/v1/restaurant/orders/create/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(restaurants=1, menu_items=3, customers=1, reviews_per_restaurant=0,
+                                    orders_per_customer=0, agents=1)
+        cls.customer = cls.data.customers[0]
+        cls.order = {'restaurant': cls.data.restaurant.pk,
+                     'order_items': [{'menu_item': cls.data.menu[0].pk, 'quantity': 1}]}
+
+    def post(self, data, key='key-1'):
+        return self.client_for(self.customer).post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def store_key(self, key='key-1'):
+        return f"{self.customer.pk}:{OrderCreateView.__name__}:{key}"
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post(self.order)
+        second = self.post(self.order)
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 1)
+
+    def test_key_reused_with_a_different_body_is_rejected(self):
+        self.post(self.order)
+        other = {**self.order, 'order_items': [{'menu_item': self.data.menu[1].pk, 'quantity': 1}]}
+        self.assertEqual(self.post(other).status_code, 422)
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 1)
+
+    def test_duplicate_waits_for_the_running_request(self):
+        store = LocalMemoryIdempotencyStore(ttl=60, lock_ttl=30)
+        fingerprint = hashlib.sha256(JSONRenderer().render(self.order)).hexdigest()
+        # The first request holds the key and finishes while the duplicate waits
+        self.assertIsNone(store.claim(self.store_key(), fingerprint))
+        finish = threading.Timer(0.2, store.save, args=(self.store_key(), fingerprint, 201, {'id': 'first'}))
+        with mock.patch('restaurant.idempotency._store', store):
+            finish.start()
+            response = self.post(self.order)
+        finish.join()
+        self.assertEqual((response.status_code, response.json()), (201, {'id': 'first'}))
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertFalse(Order.objects.filter(customer=self.customer).exists())
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self.post({'restaurant': self.data.restaurant.pk}).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key=self.store_key()).exists())
+        with mock.patch.object(OrderCreateView, 'create', side_effect=RuntimeError('down')):
+            with self.assertRaises(RuntimeError):
+                self.post(self.order)
+        self.assertFalse(IdempotencyKey.objects.filter(key=self.store_key()).exists())
+        # A retry with the corrected body runs instead of being replayed or rejected
+        response = self.post(self.order)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+class RatingAggregateTests(TestCase):
+    """
+    Review writes keep the restaurant's rating_sum, rating_count and rating in step.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        owners = User.objects.bulk_create([
+            User(email=f'rating-owner{i}@example.com', role='owner') for i in range(2)
+        ])
+        cls.customer = User.objects.create(email='rating-customer@example.com', role='customer')
+        cls.first, cls.second = [
+            Restaurant.objects.create(user=owner, name=f'Rated {i}', address='Kenyatta Avenue',
+                                      contact_number=f'070000001{i}')
+            for i, owner in enumerate(owners)
+        ]
+
+    def setUp(self):
+        self.review = Review.objects.create(customer=self.customer, restaurant=self.first, rating=4)
+        Review.objects.create(customer=self.customer, restaurant=self.first, rating=2)
+
+    def assertAggregates(self, restaurant, rating_sum, rating_count):
+        restaurant.refresh_from_db()
+        self.assertEqual((restaurant.rating_sum, restaurant.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(restaurant.rating, rating_sum / rating_count if rating_count else 0)
+
+    def test_create(self):
+        self.assertAggregates(self.first, 6, 2)
+
+    def test_edit_rating(self):
+        review = Review.objects.get(pk=self.review.pk)
+        review.rating = 5
+        review.save()
+        self.assertAggregates(self.first, 7, 2)
+        # A second save of the same instance applies only the new difference
+        review.rating = 1
+        review.save()
+        self.assertAggregates(self.first, 3, 2)
+
+    def test_edit_after_refresh_uses_the_refreshed_rating(self):
+        Review.objects.filter(pk=self.review.pk).update(rating=3)
+        Restaurant.objects.filter(pk=self.first.pk).update(rating_sum=5)
+        self.review.refresh_from_db()
+        self.review.rating = 5
+        self.review.save()
+        self.assertAggregates(self.first, 7, 2)
+
+    def test_move_to_another_restaurant(self):
+        self.review.restaurant = self.second
+        self.review.save()
+        self.assertAggregates(self.first, 2, 1)
+        self.assertAggregates(self.second, 4, 1)
+
+    def test_delete(self):
+        Review.objects.get(pk=self.review.pk).delete()
+        self.assertAggregates(self.first, 2, 1)
+        Review.objects.filter(restaurant=self.first).delete()
+        self.assertAggregates(self.first, 0, 0)
+
+
+class SearchTests(TestCase):
+    """
+    The FTS index follows writes made through any path and ranks name matches first.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        owners = User.objects.bulk_create([
+            User(email=f'search-owner{i}@example.com', role='owner') for i in range(2)
+        ])
+        cls.grill = Restaurant.objects.create(user=owners[0], name='Nyama Grill', address='Moi Avenue',
+                                              description='Charcoal chicken and chips', contact_number='0700000000')
+        cls.cafe = Restaurant.objects.create(user=owners[1], name='Java Cafe', address='Mama Ngina Street',
+                                             description='Coffee, pastries and chicken wraps',
+                                             contact_number='0700000001')
+        cls.items = MenuItem.objects.bulk_create([
+            MenuItem(restaurant=cls.grill, name='Chicken Tikka', description='Spiced grilled chicken', price=650),
+            MenuItem(restaurant=cls.grill, name='Chips Masala', description='Fries with chicken spice', price=250),
+            MenuItem(restaurant=cls.cafe, name='Chicken Wrap', price=450, is_available=False),
+            MenuItem(restaurant=cls.cafe, name='Café Latte', price=300),
+        ])
+
+    def names(self, results):
+        return [result.name for result in results]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.names(search_restaurants('chicken')), ['Nyama Grill', 'Java Cafe'])
+        self.assertEqual(self.names(search_menu_items('chicken'))[-1], 'Chips Masala')
+
+    def test_last_term_matches_as_prefix(self):
+        self.assertEqual(self.names(search_menu_items('chicken tik')), ['Chicken Tikka'])
+        self.assertEqual(search_menu_items('chicken tik', prefix=False), [])
+        self.assertEqual(self.names(search_menu_items('cafe lat')), ['Café Latte'])
+
+    def test_filters(self):
+        self.assertEqual(set(self.names(search_menu_items('chicken', min_price=300, max_price=700))),
+                         {'Chicken Tikka', 'Chicken Wrap'})
+        self.assertEqual(self.names(search_menu_items('wrap', is_available=True)), [])
+        self.assertEqual(search_menu_items('chicken', is_available=False)[0].restaurant_name, 'Java Cafe')
+
+    def test_index_follows_updates_and_deletes(self):
+        item = self.items[1]
+        MenuItem.objects.filter(pk=item.pk).update(name='Masala Fries')
+        self.assertEqual(self.names(search_menu_items('fries')), ['Masala Fries'])
+        self.assertEqual(search_menu_items('chips'), [])
+        MenuItem.objects.filter(pk=item.pk).delete()
+        self.assertEqual(search_menu_items('fries'), [])
+
+    @override_settings(RESTAURANT_SEARCH={'MAX_CANDIDATES': 1})
+    def test_bounded_ranking_keeps_name_matches_and_filters(self):
+        # The newest match of each pass is ranked: a name match first, then the rest
+        self.assertEqual(self.names(search_menu_items('chicken')), ['Chicken Wrap', 'Chips Masala'])
+        # Filters pick the candidates, so the unavailable newest match does not hide an older one
+        self.assertEqual(self.names(search_menu_items('chicken', is_available=True, max_price=700)),
+                         ['Chicken Tikka', 'Chips Masala'])
+        # The documented recall loss: only the newest description match is considered
+        self.assertEqual(self.names(search_restaurants('chicken')), ['Java Cafe'])
+
+    def test_user_input_is_not_query_syntax(self):
+        self.assertEqual(search_menu_items('"'), [])
+        self.assertEqual(self.names(search_menu_items('chicken OR "tikka" NEAR(')), [])
+        self.assertEqual(self.names(search_menu_items('tikka) (chicken')), ['Chicken Tikka'])
+
+
+class NearbyRestaurantTests(TestCase):
+    """
+    Bounding-box candidates are refined to the exact radius, including across the antimeridian.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        places = {
+            'centre': (-1.2833, 36.8167),
+            'north 2km': (-1.2653, 36.8167),
+            # Inside the 5 km bounding box but ~5.5 km away diagonally
+            'corner': (-1.2833 + 0.035, 36.8167 + 0.035),
+            'east 4km': (-1.2833, 36.8527),
+            'far': (-4.0435, 39.6682),
+            'no coordinates': (None, None),
+            'west of 180': (10.0, 179.99),
+            'east of -180': (10.0, -179.99),
+        }
+        owners = User.objects.bulk_create([
+            User(email=f'nearby-owner{i}@example.com', role='owner') for i in range(len(places))
+        ])
+        for owner, (name, (lat, lng)) in zip(owners, places.items()):
+            Restaurant.objects.create(user=owner, name=name, latitude=lat, longitude=lng, address='-',
+                                      contact_number='0700000000')
+        cls.names = dict(Restaurant.objects.values_list('id', 'name'))
+
+    def nearby(self, lat, lng, radius_km):
+        return [(self.names[restaurant_id], round(distance, 1))
+                for distance, restaurant_id in nearby_restaurant_ids(lat, lng, radius_km)]
+
+    def test_sorted_by_distance_within_radius(self):
+        self.assertEqual(self.nearby(-1.2833, 36.8167, 5), [('centre', 0.0), ('north 2km', 2.0), ('east 4km', 4.0)])
+        self.assertEqual([name for name, _ in self.nearby(-1.2833, 36.8167, 6)],
+                         ['centre', 'north 2km', 'east 4km', 'corner'])
+
+    def test_box_wraps_across_the_antimeridian(self):
+        self.assertEqual(self.nearby(10.0, 179.999, 5), [('west of 180', 1.0), ('east of -180', 1.2)])
+        self.assertEqual(self.nearby(10.0, -179.999, 5), [('east of -180', 1.0), ('west of 180', 1.2)])
@@ -0,0 +1,40 @@
+"""
+Order status transitions, each one conditional UPDATE committed with its
+outbox event (see ``foodapibackend.statemachine``).
+"""
+from django.db import transaction
+
+from foodapibackend.statemachine import StateMachine
+
+from .models import Order
+
+ORDER_TRANSITIONS = {
+    'pending': {'accepted', 'cancelled'},
+    'accepted': {'preparing', 'cancelled'},
+    'preparing': {'ready', 'cancelled'},
+    'ready': {'on_the_way'},
+    'on_the_way': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+
+order_states = StateMachine(Order, ORDER_TRANSITIONS)
+
+
+def transition_order(order, status, version=None):
+    """
+    Move ``order`` to ``status``; raises InvalidTransition or TransitionConflict.
+    """
+    from delivery.outbox import ORDER_STATUS_CHANGED, record
+
+    previous = getattr(order, '_loaded_status', order.status)
+    order_states.check(previous, status)
+    with transaction.atomic():
+        order_states.apply_to(order, status, version=version)
+        # QuerySet.update() sends no post_save, so the event is recorded here
+        record(ORDER_STATUS_CHANGED, order.pk, {
+            'order_id': order.pk,
+            'status': status,
+            'previous_status': previous,
+        })
+    return order
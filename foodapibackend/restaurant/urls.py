@@ -1,4 +1,4 @@
-from .views import RestaurantListView, RestaurantCreateView, RestaurantDetailView, RestaurantUpdateView, RestaurantDeleteView, MenuItemListView, MenuItemCreateView, MenuItemUpdateView, MenuItemDeleteView, OrderListView, OrderCreateView, OrderDetailView, ReviewListView, ReviewCreateView, RestaurantReviewListView
+from .views import RestaurantListView, RestaurantCreateView, RestaurantDetailView, RestaurantUpdateView, RestaurantDeleteView, MenuItemListView, MenuItemCreateView, MenuItemUpdateView, MenuItemDeleteView, OrderListView, OrderCreateView, OrderDetailView, ReviewListView, ReviewCreateView, RestaurantReviewListView, SearchView, NearbyRestaurantListView
 from django.urls import path
 
 urlpatterns = [
@@ -8,6 +8,8 @@ urlpatterns = [
     path('<int:pk>/', RestaurantDetailView.as_view(), name='restaurant-detail'),
     path('<int:pk>/update/', RestaurantUpdateView.as_view(), name='restaurant-update'),
     path('<int:pk>/delete/', RestaurantDeleteView.as_view(), name='restaurant-delete'),
+    path('search/', SearchView.as_view(), name='restaurant-search'),
+    path('nearby/', NearbyRestaurantListView.as_view(), name='restaurant-nearby'),
 
     # MenuItem URLs
     path('<int:restaurant_id>/menu-items/', MenuItemListView.as_view(), name='menu-item-list'),
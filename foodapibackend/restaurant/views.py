@@ -6,14 +6,25 @@ from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnl
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.views import APIView
 from .permissions import IsOwner, IsOwnerOrReadOnly, IsCustomer
 
-from .models import Restaurant, MenuItem, Order, Review, DeliveryAgent
+from foodapibackend.fieldsets import eager_load
+from foodapibackend.pagination import CreatedAtCursorPagination
+
+from .cache import VersionedCacheMixin
+from .idempotency import IdempotencyMixin
+from .models import Restaurant, MenuItem, Order, Review
+from .nearby import load_page, nearby_restaurant_ids
+from .pagination import RestaurantPagination
+from .search import search_menu_items, search_restaurants
 from .serializers import (
-    RestaurantSerializer, RestaurantCreateSerializer, RestaurantUpdateSerializer,
+    RestaurantSerializer, RestaurantSummarySerializer, RestaurantCreateSerializer, RestaurantUpdateSerializer,
+    NearbyRestaurantSerializer, NearbyQuerySerializer,
     MenuItemSerializer, MenuItemCreateSerializer,
     OrderSerializer, OrderCreateSerializer,
-    ReviewSerializer, ReviewCreateSerializer
+    ReviewSerializer, ReviewCreateSerializer,
+    SearchQuerySerializer, MenuItemSearchResultSerializer
 )
 
 
@@ -27,15 +38,88 @@ class RestaurantCreateView(CreateAPIView):
             raise PermissionDenied("You already have a restaurant registered")
         serializer.save(user=self.request.user)
 
+def restaurant_detail_queryset(request=None):
+    """
+    Restaurants with everything RestaurantSerializer renders for ``request``
+    (after ``?fields``/``?expand``) loaded up front, so a page costs a
+    constant number of queries.
+    """
+    return eager_load(Restaurant.objects.all(), RestaurantSerializer, request)
+
+
 class RestaurantListView(ListAPIView):
-    serializer_class = RestaurantSerializer
-    queryset = Restaurant.objects.all()
+    """
+    Paginated restaurant list. ``?mode=summary`` returns RestaurantSummarySerializer
+    rows (name, rating, review count) without nested menu items or reviews.
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = RestaurantPagination
+
+    def is_summary(self):
+        return self.request.query_params.get('mode') == 'summary'
+
+    def get_serializer_class(self):
+        return RestaurantSummarySerializer if self.is_summary() else RestaurantSerializer
+
+    def get_queryset(self):
+        if self.is_summary():
+            return Restaurant.objects.order_by('id')
+        return restaurant_detail_queryset(self.request).order_by('id')
+
+class NearbyRestaurantListView(ListAPIView):
+    """
+    Restaurants within ``radius_km`` (default 5, at most 50) of ``?lat=&lng=``,
+    nearest first, each with its ``distance_km``. Restaurants without
+    coordinates are never listed.
+    """
+    serializer_class = NearbyRestaurantSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = RestaurantPagination
+
+    def list(self, request, *args, **kwargs):
+        params = NearbyQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        # Distances are paginated, so only one page of full rows is loaded
+        page = self.paginate_queryset(nearby_restaurant_ids(query['lat'], query['lng'], query['radius_km']))
+        serializer = self.get_serializer(load_page(page), many=True)
+        return self.get_paginated_response(serializer.data)
+
+class SearchView(APIView):
+    """
+    Ranked full-text search over restaurant and menu item names and
+    descriptions: ``?q=`` (the last word also matches as a prefix unless
+    ``prefix=false``), with ``min_price``, ``max_price`` and ``available``
+    narrowing the menu items. Returns up to ``limit`` of each, full name
+    matches first. On very common queries only the newest
+    ``RESTAURANT_SEARCH['MAX_CANDIDATES']`` matches of each pass are
+    ranked, so older matches can be missing (see restaurant.search).
+    """
     permission_classes = [IsAuthenticatedOrReadOnly]
 
-class RestaurantDetailView(RetrieveAPIView):
+    def get(self, request):
+        # A plain dict: with a QueryDict, DRF reads an omitted boolean as False
+        params = SearchQuerySerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        restaurants = search_restaurants(query['q'], limit=query['limit'], prefix=query['prefix'])
+        menu_items = search_menu_items(
+            query['q'], limit=query['limit'], prefix=query['prefix'], min_price=query.get('min_price'),
+            max_price=query.get('max_price'), is_available=query['available'],
+        )
+        return Response({
+            'restaurants': RestaurantSummarySerializer(restaurants, many=True).data,
+            'menu_items': MenuItemSearchResultSerializer(menu_items, many=True).data,
+        })
+
+class RestaurantDetailView(VersionedCacheMixin, RetrieveAPIView):
     serializer_class = RestaurantSerializer
-    queryset = Restaurant.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cache_name = 'detail'
+    cache_restaurant_kwarg = 'pk'
+
+    def get_queryset(self):
+        return restaurant_detail_queryset(self.request)
 
 class RestaurantUpdateView(UpdateAPIView):
     serializer_class = RestaurantUpdateSerializer
@@ -66,9 +150,10 @@ class MenuItemCreateView(CreateAPIView):
         restaurant = Restaurant.objects.get(user=self.request.user)
         serializer.save(restaurant=restaurant)
 
-class MenuItemListView(ListAPIView):
+class MenuItemListView(VersionedCacheMixin, ListAPIView):
     serializer_class = MenuItemSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cache_name = 'menu'
 
     def get_queryset(self):
         return MenuItem.objects.filter(restaurant_id=self.kwargs['restaurant_id'])
@@ -94,7 +179,14 @@ class MenuItemDeleteView(DestroyAPIView):
         instance.delete()
 
 # Order Views
-class OrderCreateView(CreateAPIView):
+def order_detail_queryset(request=None):
+    """
+    Orders with everything OrderSerializer renders for ``request`` loaded up front.
+    """
+    return eager_load(Order.objects.all(), OrderSerializer, request)
+
+
+class OrderCreateView(IdempotencyMixin, CreateAPIView):
     serializer_class = OrderCreateSerializer
     permission_classes = [IsCustomer]
 
@@ -108,22 +200,23 @@ class OrderCreateView(CreateAPIView):
         order = serializer.save(customer=self.request.user)
 
         # Use OrderSerializer for the response
-        response_serializer = OrderSerializer(order)
+        response_serializer = OrderSerializer(order_detail_queryset().get(pk=order.pk))
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 
 class OrderListView(ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'customer':
-            return Order.objects.filter(customer=user)
+            return order_detail_queryset(self.request).filter(customer=user)
         elif user.role == 'owner':
-            return Order.objects.filter(restaurant__user=user)
+            return order_detail_queryset(self.request).filter(restaurant__user=user)
         elif user.role == 'delivery_agent':
-            return Order.objects.filter(delivery_agent=user)
+            return order_detail_queryset(self.request).filter(delivery_agent=user)
         return Order.objects.none()
 
 class OrderDetailView(RetrieveAPIView):
@@ -133,11 +226,11 @@ class OrderDetailView(RetrieveAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.role == 'customer':
-            return Order.objects.filter(customer=user)
+            return order_detail_queryset(self.request).filter(customer=user)
         elif user.role == 'owner':
-            return Order.objects.filter(restaurant__user=user)
+            return order_detail_queryset(self.request).filter(restaurant__user=user)
         elif user.role == 'delivery_agent':
-            return Order.objects.filter(delivery_agent=user)
+            return order_detail_queryset(self.request).filter(delivery_agent=user)
         return Order.objects.none()
 
 # Review Views
@@ -153,17 +246,19 @@ class ReviewCreateView(CreateAPIView):
 class ReviewListView(ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
-        return Review.objects.filter(restaurant_id=self.kwargs['restaurant_id'])
+        return eager_load(Review.objects.filter(restaurant_id=self.kwargs['restaurant_id']), ReviewSerializer, self.request)
 
 class RestaurantReviewListView(ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'owner':
-            return Review.objects.filter(restaurant__user=user)
+            return eager_load(Review.objects.filter(restaurant__user=user), ReviewSerializer, self.request)
         return Review.objects.none()
 